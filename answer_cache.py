@@ -0,0 +1,359 @@
+"""
+Answer Cache Module
+Caches knowledge base answers keyed by (normalized query, knowledge base,
+model, retrieval_only, pipeline) with TTL and LRU eviction. A per-container memory
+tier can be backed by an optional shared tier (DynamoDB or an in-process
+stand-in), and every knowledge base carries a generation counter that
+DocumentManager bumps when documents change.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from client_registry import get_client
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = ' ¿?¡!.,;:'
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings share a cache entry
+    (unicode form, case, whitespace and surrounding punctuation)
+    """
+    if not query:
+        return ''
+    normalized = unicodedata.normalize('NFKC', query).casefold()
+    normalized = _WHITESPACE_RE.sub(' ', normalized)
+    return normalized.strip(_EDGE_PUNCTUATION)
+
+
+class SharedCacheBackend(ABC):
+    """
+    Interface for a cache tier shared between containers.
+    Values are JSON-serializable dictionaries.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached value of a key, or None if missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: int):
+        """Store a value for ttl_seconds"""
+
+    @abstractmethod
+    def get_counter(self, key: str) -> int:
+        """Current value of a counter (0 if it was never incremented)"""
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        """Atomically increment a counter and return its new value"""
+
+
+class InProcessSharedCache(SharedCacheBackend):
+    """Local stand-in for the shared tier (single process, used in tests and development)"""
+
+    def __init__(self):
+        self._items: Dict[str, Any] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, payload = item
+            if expires_at < time.time():
+                del self._items[key]
+                return None
+            return json.loads(payload)
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: int):
+        with self._lock:
+            self._items[key] = (time.time() + ttl_seconds, json.dumps(value))
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class DynamoDBSharedCache(SharedCacheBackend):
+    """
+    Shared tier stored in a DynamoDB table with partition key 'cache_key'
+    and TTL enabled on the 'expires_at' attribute
+    """
+
+    def __init__(self, table_name: str, region: str = 'eu-west-1'):
+        self.table_name = table_name
+        self.client = get_client('dynamodb', region)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={'cache_key': {'S': key}},
+            ConsistentRead=False
+        )
+        item = response.get('Item')
+        if not item or 'value' not in item:
+            return None
+        # DynamoDB TTL deletion is lazy, so check expiry here too
+        if int(item['expires_at']['N']) < time.time():
+            return None
+        return json.loads(item['value']['S'])
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: int):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                'cache_key': {'S': key},
+                'value': {'S': json.dumps(value)},
+                'expires_at': {'N': str(int(time.time() + ttl_seconds))}
+            }
+        )
+
+    def get_counter(self, key: str) -> int:
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={'cache_key': {'S': key}},
+            ConsistentRead=True
+        )
+        item = response.get('Item')
+        return int(item['counter']['N']) if item and 'counter' in item else 0
+
+    def incr(self, key: str) -> int:
+        response = self.client.update_item(
+            TableName=self.table_name,
+            Key={'cache_key': {'S': key}},
+            UpdateExpression='ADD #c :one',
+            ExpressionAttributeNames={'#c': 'counter'},
+            ExpressionAttributeValues={':one': {'N': '1'}},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['counter']['N'])
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache: in-memory LRU per container plus optional shared tier
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: int = 3600,
+                 shared_backend: Optional[SharedCacheBackend] = None,
+                 generation_ttl_seconds: float = 5):
+        """
+        Args:
+            max_entries: Maximum number of answers kept in memory
+            ttl_seconds: Time to live of every cached answer
+            shared_backend: Optional tier shared between containers
+            generation_ttl_seconds: How long a generation read from the shared
+                tier is reused before reading it again (bounds how late an
+                invalidation made by another container is seen)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared_backend = shared_backend
+        self.generation_ttl_seconds = generation_ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        # knowledge_base_id -> (read_at, generation) of the shared tier
+        self._shared_generations: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def make_key(self, query: str, knowledge_base_id: str, model_id: str,
+                 retrieval_only: bool, generation: int = 0, pipeline: Optional[str] = None) -> str:
+        """
+        Build the cache key for a request at a given knowledge base generation.
+        The pipeline is part of the key: each one retrieves and prompts
+        differently, and the logged metrics describe the pipeline that ran.
+        """
+        raw = json.dumps([normalize_query(query), knowledge_base_id, model_id,
+                          bool(retrieval_only), generation, pipeline])
+        return f"answer:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def get(self, query: str, knowledge_base_id: str, model_id: str,
+            retrieval_only: bool = False, pipeline: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer
+
+        Returns:
+            A copy of the cached result, or None on a miss
+        """
+        generation = self._generation(knowledge_base_id)
+        key = self.make_key(query, knowledge_base_id, model_id, retrieval_only, generation, pipeline)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return dict(value)
+                del self._entries[key]
+
+        if self.shared_backend is not None:
+            try:
+                value = self.shared_backend.get(key)
+            except Exception as e:
+                logger.warning(f"Shared answer cache lookup failed: {str(e)}")
+                value = None
+            if value is not None:
+                self._store_local(key, value)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return dict(value)
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, query: str, knowledge_base_id: str, model_id: str,
+            retrieval_only: bool, result: Dict[str, Any], pipeline: Optional[str] = None):
+        """Store a result for a request"""
+        generation = self._generation(knowledge_base_id)
+        key = self.make_key(query, knowledge_base_id, model_id, retrieval_only, generation, pipeline)
+        value = dict(result)
+        self._store_local(key, value)
+
+        if self.shared_backend is not None:
+            try:
+                self.shared_backend.set(key, value, self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Shared answer cache write failed: {str(e)}")
+
+    def invalidate_knowledge_base(self, knowledge_base_id: str):
+        """
+        Invalidate every cached answer of a knowledge base by bumping its
+        generation (entries of older generations are never read again)
+        """
+        with self._lock:
+            self._generations[knowledge_base_id] = self._generations.get(knowledge_base_id, 0) + 1
+            self._stats['invalidations'] += 1
+
+        if self.shared_backend is not None:
+            try:
+                shared_generation = self.shared_backend.incr(self._generation_key(knowledge_base_id))
+            except Exception as e:
+                logger.warning(f"Shared answer cache invalidation failed: {str(e)}")
+            else:
+                with self._lock:
+                    self._shared_generations[knowledge_base_id] = (time.time(), shared_generation)
+
+        logger.info(f"Invalidated answer cache for knowledge base {knowledge_base_id}")
+
+    def clear(self):
+        """Drop every in-memory entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            return stats
+
+    def _generation(self, knowledge_base_id: str) -> int:
+        local_generation = self._generations.get(knowledge_base_id, 0)
+        if self.shared_backend is None:
+            return local_generation
+
+        # The shared generation is a strongly consistent read: reuse it for
+        # generation_ttl_seconds instead of paying one on every lookup. Local
+        # invalidations still apply at once through local_generation.
+        now = time.time()
+        with self._lock:
+            cached = self._shared_generations.get(knowledge_base_id)
+        if cached is not None and now - cached[0] < self.generation_ttl_seconds:
+            return max(local_generation, cached[1])
+        try:
+            shared_generation = self.shared_backend.get_counter(self._generation_key(knowledge_base_id))
+        except Exception as e:
+            logger.warning(f"Shared answer cache generation lookup failed: {str(e)}")
+            return max(local_generation, cached[1]) if cached is not None else local_generation
+        with self._lock:
+            self._shared_generations[knowledge_base_id] = (now, shared_generation)
+        return max(local_generation, shared_generation)
+
+    def _generation_key(self, knowledge_base_id: str) -> str:
+        return f"generation:{knowledge_base_id}"
+
+    def _store_local(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+
+# Default TTL with the DynamoDB tier, where invalidations reach every container,
+# and without it, where other containers keep their entries until they expire
+SHARED_TTL_SECONDS = 3600
+CONTAINER_ONLY_TTL_SECONDS = 60
+
+
+def _build_default_cache() -> Optional[AnswerCache]:
+    """Create the container-wide cache from environment variables"""
+    if os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() != 'true':
+        logger.info("Answer cache disabled")
+        return None
+
+    shared_backend = None
+    default_ttl_seconds = SHARED_TTL_SECONDS
+    table_name = os.environ.get('ANSWER_CACHE_DYNAMODB_TABLE')
+    if table_name:
+        shared_backend = DynamoDBSharedCache(table_name)
+    else:
+        if os.environ.get('ANSWER_CACHE_SHARED') == 'local':
+            shared_backend = InProcessSharedCache()
+        default_ttl_seconds = CONTAINER_ONLY_TTL_SECONDS
+        logger.warning("ANSWER_CACHE_DYNAMODB_TABLE not set: document changes only invalidate the "
+                       "answer cache of the container that makes them; other containers keep "
+                       "serving their entries until ANSWER_CACHE_TTL_SECONDS expires "
+                       f"(default {CONTAINER_ONLY_TTL_SECONDS}s without the table)")
+
+    return AnswerCache(
+        max_entries=int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '256')),
+        ttl_seconds=int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', str(default_ttl_seconds))),
+        shared_backend=shared_backend,
+        generation_ttl_seconds=float(os.environ.get('ANSWER_CACHE_GENERATION_TTL_SECONDS', '5'))
+    )
+
+
+# Shared cache for the whole container (None when disabled)
+answer_cache = _build_default_cache()
+
+
+def invalidate_knowledge_base(knowledge_base_id: str):
+    """Invalidate cached answers of a knowledge base, if the cache is enabled"""
+    if answer_cache is not None:
+        answer_cache.invalidate_knowledge_base(knowledge_base_id)
@@ -1,9 +1,16 @@
-import boto3
+import copy
+import hashlib
 import json
 import logging
+import threading
 import time
 import os
+import unicodedata
+from collections import OrderedDict
 from botocore.exceptions import ClientError
+from client_registry import get_client
+from answer_cache import normalize_query
+from response_normalizer import normalize_retrieve_and_generate, ReferenceTable
 
 # Configure logging
 logger = logging.getLogger()
@@ -29,13 +36,232 @@ PROFILE_TO_PROVIDER = {
     "arn:aws:bedrock:eu-west-1:573734645132:inference-profile/eu.amazon.nova-pro-v1:0": "amazon"
 }
 
+# Instrucciones de sistema para la generación con contexto propio (retrieve_then_generate)
+KB_ANSWER_SYSTEM_PROMPT = (
+    "Eres un asistente que responde preguntas usando únicamente los fragmentos "
+    "recuperados de la base de conocimiento. Si los fragmentos no contienen la "
+    "respuesta, dilo claramente. Responde en el idioma de la pregunta."
+)
+
+class RetrievalCache:
+    """
+    Cache of Retrieve results per (knowledge base, normalized query,
+    numberOfResults, search type). Besides exact matches, paraphrases are
+    found with MinHash signatures over character shingles of the query and
+    an LSH band index, so near-identical questions reuse the same fragments.
+    Every knowledge base has a generation counter that DocumentManager bumps
+    when documents change and again when their ingestion job ends; entries
+    of older generations are never returned.
+    
+    Only retrieve() uses it, so it is opt-in through the
+    retrieve_then_generate pipeline: retrieve_and_generate is a single
+    RetrieveAndGenerate call with no separate retrieval to cache.
+    """
+    
+    _PRIME = (1 << 61) - 1
+    
+    def __init__(self, max_entries=512, ttl_seconds=900, similarity_threshold=0.8,
+                 num_perm=64, bands=16, shingle_size=4):
+        """
+        Args:
+            max_entries (int): Maximum number of cached retrievals (LRU)
+            ttl_seconds (int): Time to live of every entry
+            similarity_threshold (float): Minimum estimated Jaccard similarity
+                for a near-duplicate hit (1.0 disables near-duplicate lookup)
+            num_perm (int): Number of MinHash permutations
+            bands (int): LSH bands (num_perm must be divisible by bands)
+            shingle_size (int): Characters per shingle
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        
+        # Coeficientes deterministas para las permutaciones (a*x + b) mod p
+        self._coefficients = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(f"minhash-{i}".encode('utf-8'), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], 'big') % (self._PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], 'big') % self._PRIME
+            self._coefficients.append((a, b))
+        
+        self._entries = OrderedDict()
+        self._band_index = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'exact_hits': 0,
+            'near_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+    
+    def get(self, knowledge_base_id, query, number_of_results, search_type):
+        """
+        Look up cached fragments for a query.
+        
+        Returns:
+            tuple: (retrievalResults copy, 'exact' | 'near') or (None, None)
+        """
+        normalized = normalize_query(query)
+        now = time.time()
+        
+        with self._lock:
+            scope = self._scope(knowledge_base_id, number_of_results, search_type)
+            key = scope + (normalized,)
+            
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires_at'] >= now:
+                self._entries.move_to_end(key)
+                self._stats['exact_hits'] += 1
+                return copy.deepcopy(entry['results']), 'exact'
+            
+            if self.similarity_threshold < 1.0:
+                signature = self._signature(normalized)
+                best_key, best_similarity = None, 0.0
+                for candidate_key in self._candidates(scope, signature):
+                    candidate = self._entries.get(candidate_key)
+                    if candidate is None or candidate['expires_at'] < now:
+                        continue
+                    similarity = self._similarity(signature, candidate['signature'])
+                    if similarity > best_similarity:
+                        best_key, best_similarity = candidate_key, similarity
+                
+                if best_key is not None and best_similarity >= self.similarity_threshold:
+                    self._entries.move_to_end(best_key)
+                    self._stats['near_hits'] += 1
+                    logger.info(f"Retrieval cache near-duplicate hit (similarity {best_similarity:.2f})")
+                    return copy.deepcopy(self._entries[best_key]['results']), 'near'
+            
+            self._stats['misses'] += 1
+            return None, None
+    
+    def set(self, knowledge_base_id, query, number_of_results, search_type, results):
+        """Store the fragments retrieved for a query"""
+        normalized = normalize_query(query)
+        signature = self._signature(normalized)
+        
+        with self._lock:
+            scope = self._scope(knowledge_base_id, number_of_results, search_type)
+            key = scope + (normalized,)
+            
+            if key in self._entries:
+                self._remove_locked(key)
+            
+            self._entries[key] = {
+                'expires_at': time.time() + self.ttl_seconds,
+                'results': copy.deepcopy(results),
+                'signature': signature
+            }
+            for band_key in self._band_keys(scope, signature):
+                self._band_index.setdefault(band_key, set()).add(key)
+            
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove_locked(oldest_key)
+                self._stats['evictions'] += 1
+    
+    def invalidate_knowledge_base(self, knowledge_base_id):
+        """Bump the generation of a knowledge base and drop its entries"""
+        with self._lock:
+            self._generations[knowledge_base_id] = self._generations.get(knowledge_base_id, 0) + 1
+            self._stats['invalidations'] += 1
+            stale = [key for key in self._entries if key[0] == knowledge_base_id]
+            for key in stale:
+                self._remove_locked(key)
+        logger.info(f"Invalidated retrieval cache for knowledge base {knowledge_base_id}")
+    
+    def get_stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            return stats
+    
+    def _scope(self, knowledge_base_id, number_of_results, search_type):
+        return (knowledge_base_id, self._generations.get(knowledge_base_id, 0), number_of_results, search_type)
+    
+    def _shingles(self, normalized):
+        # Sin acentos para que "configuración" y "configuracion" coincidan
+        text = ''.join(c for c in unicodedata.normalize('NFD', normalized) if not unicodedata.combining(c))
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+    
+    def _signature(self, normalized):
+        hashed = [
+            int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+            for shingle in self._shingles(normalized)
+        ]
+        prime = self._PRIME
+        return tuple(min((a * x + b) % prime for x in hashed) for a, b in self._coefficients)
+    
+    def _similarity(self, signature_a, signature_b):
+        matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+        return matches / self.num_perm
+    
+    def _band_keys(self, scope, signature):
+        return [
+            scope + (band, hash(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+    
+    def _candidates(self, scope, signature):
+        candidates = set()
+        for band_key in self._band_keys(scope, signature):
+            candidates.update(self._band_index.get(band_key, ()))
+        return candidates
+    
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope = key[:4]
+        for band_key in self._band_keys(scope, entry['signature']):
+            keys = self._band_index.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._band_index[band_key]
+
+
+def _build_default_retrieval_cache():
+    """Create the container-wide retrieval cache from environment variables"""
+    if os.environ.get('RETRIEVAL_CACHE_ENABLED', 'true').lower() != 'true':
+        logger.info("Retrieval cache disabled")
+        return None
+    return RetrievalCache(
+        max_entries=int(os.environ.get('RETRIEVAL_CACHE_MAX_ENTRIES', '512')),
+        ttl_seconds=int(os.environ.get('RETRIEVAL_CACHE_TTL_SECONDS', '900')),
+        similarity_threshold=float(os.environ.get('RETRIEVAL_CACHE_SIMILARITY', '0.8'))
+    )
+
+
+# Caché de recuperación compartida por todo el contenedor (None si está desactivada)
+retrieval_cache = _build_default_retrieval_cache()
+
+
+def invalidate_retrieval_cache(knowledge_base_id):
+    """Invalidate cached retrievals of a knowledge base, if the cache is enabled"""
+    if retrieval_cache is not None:
+        retrieval_cache.invalidate_knowledge_base(knowledge_base_id)
+
+
 class BedrockClient:
     """Client for interacting with Amazon Bedrock Claude Sonnet 4 model."""
     
     def __init__(self, region_name='eu-west-1', model_id='anthropic.claude-sonnet-4-20250514-v1:0'):
         """Initialize Bedrock client with region and model."""
-        self.client = boto3.client('bedrock-runtime', region_name=region_name)
-        self.agent_client = boto3.client('bedrock-agent-runtime', region_name=region_name)
+        # Los clientes se reutilizan entre invocaciones del mismo contenedor
+        self.client = get_client('bedrock-runtime', region_name)
+        self.agent_client = get_client('bedrock-agent-runtime', region_name)
         self.model_id = model_id
         
         # Determinar el proveedor del modelo para ajustar el formato del prompt
@@ -233,42 +459,10 @@ class BedrockClient:
             current_model = model_id or self.model_id
             logger.info(f"Starting retrieve and generate using model: {current_model}")
             
-            # Get the region directly from the client's credentials
-            region = self.client.meta.region_name
-            
-            # Use inference profile ARN for RetrieveAndGenerate
-            if current_model in MODEL_TO_PROFILE_ARN:
-                model_arn = MODEL_TO_PROFILE_ARN[current_model]
-            else:
-                # Fallback to direct model ARN if no profile is available
-                model_arn = f"arn:aws:bedrock:{region}::foundation-model/{current_model}"
-            
-            logger.info(f"Using model ARN: {model_arn}")
             logger.info(f"Knowledge Base ID: {knowledge_base_id}")
             logger.info(f"Retrieval only: {retrieval_only}")
             
-            # Preparar la configuración para RetrieveAndGenerate con búsqueda híbrida
-            # SOLUCIÓN: Usar configuración por defecto de AWS Bedrock sin plantillas personalizadas
-            # Esto permite que Bedrock use sus plantillas internas optimizadas para generar citations
-            command_input = {
-                "input": {
-                    "text": prompt,
-                },
-                "retrieveAndGenerateConfiguration": {
-                    "type": "KNOWLEDGE_BASE",
-                    "knowledgeBaseConfiguration": {
-                        "knowledgeBaseId": knowledge_base_id,
-                        "modelArn": model_arn,
-                        # Configuración de recuperación con búsqueda híbrida
-                        "retrievalConfiguration": {
-                            "vectorSearchConfiguration": {
-                                "numberOfResults": 10,
-                                "overrideSearchType": "HYBRID"
-                            }
-                        }
-                    }
-                }
-            }
+            command_input = self._build_retrieve_and_generate_input(knowledge_base_id, prompt, current_model)
             
             logger.info(f"Command input: {json.dumps(command_input, default=str)[:200]}...")
             
@@ -295,149 +489,413 @@ class BedrockClient:
                     "processing_time_ms": round((time.time() - start_time) * 1000, 2)
                 }
             else:
-                # Para modo RAG con respuesta generada
-                # Imprimir la respuesta completa para depuración
-                logger.info(f"Response structure: {dir(response)}")
-                
-                # Intentar acceder a la respuesta de diferentes maneras
-                answer = "No se generó ninguna respuesta"
-                retrieval_results = []
-                
-                # Imprimir las claves del diccionario de respuesta si es un diccionario
-                if isinstance(response, dict):
-                    logger.info(f"Response keys: {list(response.keys())}")
-                    # Intentar acceder a la respuesta como un diccionario
-                    if 'output' in response:
-                        logger.info(f"Output content: {response['output']}")
-                        if isinstance(response['output'], dict) and 'text' in response['output']:
-                            answer = response['output']['text']
-                        elif isinstance(response['output'], str):
-                            answer = response['output']
-                    # Intentar otras claves comunes
-                    elif 'text' in response:
-                        answer = response['text']
-                    elif 'content' in response:
-                        answer = response['content']
-                    elif 'body' in response:
-                        try:
-                            if isinstance(response['body'], dict):
-                                logger.info(f"Body content: {response['body']}")
-                                if 'text' in response['body']:
-                                    answer = response['body']['text']
-                            else:
-                                body_content = json.loads(response['body'].read().decode('utf-8'))
-                                logger.info(f"Body content: {body_content}")
-                                if 'output' in body_content and 'text' in body_content['output']:
-                                    answer = body_content['output']['text']
-                        except Exception as e:
-                            logger.error(f"Error parsing response body: {str(e)}")
-                    
-                    # Extraer los fragmentos de texto de las citaciones
-                    if 'citations' in response:
-                        logger.info(f"Found citations in response: {response['citations']}")
-                        for citation in response['citations']:
-                            retrieval_result = {}
-                            if isinstance(citation, dict):
-                                # Extraer el contenido del fragmento
-                                if 'retrievedReferences' in citation:
-                                    for reference in citation['retrievedReferences']:
-                                        if 'content' in reference and 'text' in reference['content']:
-                                            retrieval_result['content'] = reference['content']['text']
-                                        
-                                        # Extraer la ubicación del fragmento si está disponible
-                                        if 'location' in reference and 's3Location' in reference['location'] and 'uri' in reference['location']['s3Location']:
-                                            retrieval_result['location'] = reference['location']['s3Location']['uri']
-                                        
-                                        # Extraer la puntuación de relevancia si está disponible
-                                        if 'score' in reference:
-                                            retrieval_result['score'] = reference['score']
-                                        
-                                        # Añadir el fragmento a la lista de resultados
-                                        if retrieval_result:
-                                            retrieval_results.append(retrieval_result)
-                                            # Crear un nuevo diccionario para el siguiente fragmento
-                                            retrieval_result = {}
-                    
-                    # Intentar extraer los fragmentos de texto de retrievalResults si existen
-                    if 'retrievalResults' in response:
-                        logger.info(f"Found retrievalResults in response: {response['retrievalResults']}")
-                        for result in response['retrievalResults']:
-                            retrieval_result = {}
-                            if isinstance(result, dict):
-                                # Extraer el contenido del fragmento
-                                if 'content' in result:
-                                    if isinstance(result['content'], dict) and 'text' in result['content']:
-                                        retrieval_result['content'] = result['content']['text']
-                                    elif isinstance(result['content'], str):
-                                        retrieval_result['content'] = result['content']
-                                
-                                # Extraer la ubicación del fragmento
-                                if 'location' in result and isinstance(result['location'], dict):
-                                    if 's3Location' in result['location'] and 'uri' in result['location']['s3Location']:
-                                        retrieval_result['location'] = result['location']['s3Location']['uri']
-                                
-                                # Extraer la puntuación de relevancia
-                                if 'score' in result:
-                                    retrieval_result['score'] = result['score']
-                                
-                                # Añadir el fragmento a la lista de resultados
-                                if retrieval_result:
-                                    retrieval_results.append(retrieval_result)
-                # Si es un objeto con atributos
-                else:
-                    # Intentar acceder como atributos
-                    if hasattr(response, 'output'):
-                        logger.info(f"Output structure: {dir(response.output)}")
-                        if hasattr(response.output, 'text'):
-                            answer = response.output.text
-                        elif isinstance(response.output, dict) and 'text' in response.output:
-                            answer = response.output['text']
-                    
-                    # Si no se encontró la respuesta en output, buscar en otros atributos
-                    if answer == "No se generó ninguna respuesta" and hasattr(response, 'body'):
-                        try:
-                            body_content = json.loads(response.body.read().decode('utf-8'))
-                            logger.info(f"Body content: {body_content}")
-                            if 'output' in body_content and 'text' in body_content['output']:
-                                answer = body_content['output']['text']
-                        except Exception as e:
-                            logger.error(f"Error parsing response body: {str(e)}")
-                    
-                    # Extraer los fragmentos de texto (retrievalResults)
-                    if hasattr(response, 'retrievalResults'):
-                        logger.info(f"Found retrievalResults attribute in response")
-                        for result in response.retrievalResults:
-                            retrieval_result = {}
-                            # Extraer el contenido del fragmento
-                            if hasattr(result, 'content') and hasattr(result.content, 'text'):
-                                retrieval_result['content'] = result.content.text
-                            
-                            # Extraer la ubicación del fragmento
-                            if hasattr(result, 'location') and hasattr(result.location, 's3Location') and hasattr(result.location.s3Location, 'uri'):
-                                retrieval_result['location'] = result.location.s3Location.uri
-                            
-                            # Extraer la puntuación de relevancia
-                            if hasattr(result, 'score'):
-                                retrieval_result['score'] = result.score
-                            
-                            # Añadir el fragmento a la lista de resultados
-                            if retrieval_result:
-                                retrieval_results.append(retrieval_result)
+                # Para modo RAG con respuesta generada: una sola pasada sobre el dict de boto3
+                normalized = normalize_retrieve_and_generate(response)
+                retrieval_results = normalized.retrieval_results()
                 
-                # Imprimir la respuesta final para depuración
-                logger.info(f"Final answer: {answer}")
-                logger.info(f"Retrieved {len(retrieval_results)} fragments")
+                logger.info(f"Answer length: {len(normalized.answer)} chars, {len(normalized.citations)} citations, {len(retrieval_results)} unique fragments")
                 
                 return {
-                    "answer": answer,
+                    "answer": normalized.answer,
                     "processing_time_ms": round((time.time() - start_time) * 1000, 2),
-                    "retrievalResults": retrieval_results
+                    "retrievalResults": retrieval_results,
+                    "citations": normalized.citation_table()
                 }
                 
         except Exception as e:
             logger.error(f"Error in retrieve and generate: {str(e)}")
             raise
     
+    def retrieve_and_generate_stream(self, knowledge_base_id, prompt, model_id=None):
+        """
+        Retrieve and generate with Knowledge Base using hybrid search, streaming
+        the answer as it is generated (RetrieveAndGenerateStream).
+        
+        Args:
+            knowledge_base_id (str): The Knowledge Base ID
+            prompt (str): The user prompt
+            model_id (str, optional): Specific model to use for this request
+            
+        Yields:
+            dict: {"type": "text", "text": ...} for every answer delta,
+                  {"type": "citation", "start": ..., "end": ..., "references": [...],
+                   "retrievalResults": [...]} for every citation, where references
+                   are indices into the reference table built across events and
+                   retrievalResults only carries the references not sent before,
+                  and a final {"type": "done", ...} event with the full answer,
+                  the deduplicated reference table, the citation spans and
+                  time_to_first_token_ms
+        """
+        start_time = time.time()
+        current_model = model_id or self.model_id
+        logger.info(f"Starting streaming retrieve and generate using model: {current_model}")
+        
+        command_input = self._build_retrieve_and_generate_input(knowledge_base_id, prompt, current_model)
+        
+        try:
+            response = self.agent_client.retrieve_and_generate_stream(**command_input)
+        except Exception as e:
+            logger.error(f"Error starting retrieve and generate stream: {str(e)}")
+            raise
+        
+        answer_parts = []
+        references = ReferenceTable()
+        citations = []
+        time_to_first_token_ms = None
+        
+        for event in response.get('stream', []):
+            if 'output' in event:
+                text = event['output'].get('text', '')
+                if not text:
+                    continue
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = round((time.time() - start_time) * 1000, 2)
+                    logger.info(f"Time to first token: {time_to_first_token_ms} ms")
+                answer_parts.append(text)
+                yield {"type": "text", "text": text}
+            elif 'citation' in event:
+                # El evento puede traer los campos en la raíz o dentro de 'citation' (formato antiguo)
+                citation_event = {**event['citation'].get('citation', {}), **event['citation']}
+                known_references = len(references.references)
+                citation = references.add_citation(citation_event)
+                citations.append(citation)
+                yield {
+                    "type": "citation",
+                    **citation.to_dict(),
+                    "retrievalResults": [reference.to_dict() for reference in references.references[known_references:]]
+                }
+            elif 'guardrail' in event:
+                logger.warning(f"Guardrail event in stream: {event['guardrail']}")
+        
+        answer = ''.join(answer_parts) or "No se generó ninguna respuesta"
+        processing_time_ms = round((time.time() - start_time) * 1000, 2)
+        retrieval_results = [reference.to_dict() for reference in references.references]
+        logger.info(f"Stream finished in {processing_time_ms} ms, {len(citations)} citations, {len(retrieval_results)} unique fragments")
+        
+        yield {
+            "type": "done",
+            "answer": answer,
+            "processing_time_ms": processing_time_ms,
+            "time_to_first_token_ms": time_to_first_token_ms,
+            "retrievalResults": retrieval_results,
+            "citations": [citation.to_dict() for citation in citations],
+            "sessionId": response.get('sessionId')
+        }
+    
+    def retrieve(self, knowledge_base_id, prompt, number_of_results=10, search_type="HYBRID", use_cache=True):
+        """
+        Retrieve relevant fragments from the Knowledge Base without generating.
+        
+        Args:
+            knowledge_base_id (str): The Knowledge Base ID
+            prompt (str): The user prompt
+            number_of_results (int): Number of fragments to retrieve
+            search_type (str): HYBRID or SEMANTIC
+            use_cache (boolean): Whether to use the retrieval cache
+            
+        Returns:
+            dict: retrievalResults (content, location, score), retrieval_time_ms
+                  and retrieval_cache ('exact', 'near' or None)
+        """
+        try:
+            start_time = time.time()
+            
+            cache = retrieval_cache if use_cache else None
+            if cache is not None:
+                cached_results, match = cache.get(knowledge_base_id, prompt, number_of_results, search_type)
+                if cached_results is not None:
+                    return {
+                        "retrievalResults": cached_results,
+                        "retrieval_time_ms": round((time.time() - start_time) * 1000, 2),
+                        "retrieval_cache": match
+                    }
+            
+            response = self.agent_client.retrieve(
+                knowledgeBaseId=knowledge_base_id,
+                retrievalQuery={"text": prompt},
+                retrievalConfiguration={
+                    "vectorSearchConfiguration": {
+                        "numberOfResults": number_of_results,
+                        "overrideSearchType": search_type
+                    }
+                }
+            )
+            
+            retrieval_results = []
+            for result in response.get('retrievalResults', []):
+                fragment = self._parse_reference(result)
+                if fragment:
+                    retrieval_results.append(fragment)
+            
+            retrieval_time_ms = round((time.time() - start_time) * 1000, 2)
+            logger.info(f"Retrieved {len(retrieval_results)} fragments in {retrieval_time_ms} ms")
+            
+            if cache is not None:
+                cache.set(knowledge_base_id, prompt, number_of_results, search_type, retrieval_results)
+            
+            return {
+                "retrievalResults": retrieval_results,
+                "retrieval_time_ms": retrieval_time_ms,
+                "retrieval_cache": None
+            }
+            
+        except Exception as e:
+            logger.error(f"Error in retrieve: {str(e)}")
+            raise
+    
+    def generate_answer(self, prompt, retrieval_results, model_id=None, max_tokens=4000):
+        """
+        Generate an answer from already retrieved fragments using the Converse API.
+        
+        Args:
+            prompt (str): The user prompt
+            retrieval_results (list): Fragments returned by retrieve()
+            model_id (str, optional): Specific model to use for this request
+            max_tokens (int): Maximum tokens in response
+            
+        Returns:
+            dict: answer, generation_time_ms, input_tokens and output_tokens
+        """
+        try:
+            start_time = time.time()
+            
+            response = self.client.converse(
+                **self._build_converse_input(prompt, retrieval_results, model_id, max_tokens)
+            )
+            
+            content = response.get('output', {}).get('message', {}).get('content', [])
+            answer = ''.join(block.get('text', '') for block in content) or "No se generó ninguna respuesta"
+            usage = response.get('usage', {})
+            
+            generation_time_ms = round((time.time() - start_time) * 1000, 2)
+            logger.info(f"Generated answer in {generation_time_ms} ms ({usage.get('inputTokens')} input / {usage.get('outputTokens')} output tokens)")
+            
+            return {
+                "answer": answer,
+                "generation_time_ms": generation_time_ms,
+                "input_tokens": usage.get('inputTokens'),
+                "output_tokens": usage.get('outputTokens')
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generating answer: {str(e)}")
+            raise
+    
+    def retrieve_then_generate_stream(self, knowledge_base_id, prompt, model_id=None, max_tokens=4000):
+        """
+        Streaming variant of retrieve_then_generate: Retrieve, then generate
+        with ConverseStream, taking token counts and model latency from the
+        stream's metadata event.
+        
+        Args:
+            knowledge_base_id (str): The Knowledge Base ID
+            prompt (str): The user prompt
+            model_id (str, optional): Specific model to use for this request
+            max_tokens (int): Maximum tokens in response
+            
+        Yields:
+            dict: one {"type": "citation", "retrievalResults": [...]} event with
+                  the retrieved fragments, {"type": "text", "text": ...} for
+                  every answer delta, and a final {"type": "done", ...} event
+                  with the same keys as retrieve_then_generate plus
+                  time_to_first_token_ms
+        """
+        start_time = time.time()
+        
+        retrieval = self.retrieve(knowledge_base_id, prompt)
+        retrieval_results = retrieval["retrievalResults"]
+        yield {"type": "citation", "retrievalResults": retrieval_results}
+        
+        generation_start = time.time()
+        try:
+            response = self.client.converse_stream(
+                **self._build_converse_input(prompt, retrieval_results, model_id, max_tokens)
+            )
+        except Exception as e:
+            logger.error(f"Error starting converse stream: {str(e)}")
+            raise
+        
+        answer_parts = []
+        time_to_first_token_ms = None
+        usage = {}
+        metrics = {}
+        
+        for event in response.get('stream', []):
+            if 'contentBlockDelta' in event:
+                text = event['contentBlockDelta'].get('delta', {}).get('text', '')
+                if not text:
+                    continue
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = round((time.time() - start_time) * 1000, 2)
+                    logger.info(f"Time to first token: {time_to_first_token_ms} ms")
+                answer_parts.append(text)
+                yield {"type": "text", "text": text}
+            elif 'metadata' in event:
+                usage = event['metadata'].get('usage', {})
+                metrics = event['metadata'].get('metrics', {})
+        
+        # latencyMs es el tiempo del modelo según Bedrock; si no llega, el medido aquí
+        generation_time_ms = metrics.get('latencyMs')
+        if generation_time_ms is None:
+            generation_time_ms = round((time.time() - generation_start) * 1000, 2)
+        processing_time_ms = round((time.time() - start_time) * 1000, 2)
+        logger.info(f"Stream finished in {processing_time_ms} ms ({usage.get('inputTokens')} input / {usage.get('outputTokens')} output tokens)")
+        
+        yield {
+            "type": "done",
+            "answer": ''.join(answer_parts) or "No se generó ninguna respuesta",
+            "processing_time_ms": processing_time_ms,
+            "time_to_first_token_ms": time_to_first_token_ms,
+            "retrievalResults": retrieval_results,
+            "citations": [],
+            "retrieval_time_ms": retrieval["retrieval_time_ms"],
+            "retrieval_cache": retrieval["retrieval_cache"],
+            "generation_time_ms": generation_time_ms,
+            "input_tokens": usage.get('inputTokens'),
+            "output_tokens": usage.get('outputTokens')
+        }
+    
+    def retrieve_then_generate(self, knowledge_base_id, prompt, model_id=None, retrieval_only=False):
+        """
+        Two-phase alternative to retrieve_and_generate: Retrieve first, then
+        generate with our own context assembly, timing each phase.
+        
+        Args:
+            knowledge_base_id (str): The Knowledge Base ID
+            prompt (str): The user prompt
+            model_id (str, optional): Specific model to use for this request
+            retrieval_only (boolean): Whether to only retrieve without generating
+            
+        Returns:
+            dict: Same keys as retrieve_and_generate plus retrieval_time_ms,
+                  generation_time_ms, input_tokens and output_tokens
+        """
+        start_time = time.time()
+        
+        retrieval = self.retrieve(knowledge_base_id, prompt)
+        result = {
+            "retrievalResults": retrieval["retrievalResults"],
+            "retrieval_time_ms": retrieval["retrieval_time_ms"],
+            "retrieval_cache": retrieval["retrieval_cache"]
+        }
+        
+        if not retrieval_only:
+            result.update(self.generate_answer(prompt, retrieval["retrievalResults"], model_id))
+        
+        result["processing_time_ms"] = round((time.time() - start_time) * 1000, 2)
+        return result
+    
+    def _build_converse_input(self, prompt, retrieval_results, model_id, max_tokens):
+        """Converse / ConverseStream parameters to answer from retrieved fragments"""
+        current_model = model_id or self.model_id
+        
+        # Converse usa el mismo formato de mensajes para Claude y Nova
+        return {
+            "modelId": MODEL_TO_PROFILE_ARN.get(current_model, current_model),
+            "system": [{"text": KB_ANSWER_SYSTEM_PROMPT}],
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"text": self._build_kb_prompt(prompt, retrieval_results)}]
+                }
+            ],
+            "inferenceConfig": {
+                "maxTokens": max_tokens,
+                "temperature": 0.1
+            }
+        }
+    
+    def _build_retrieve_and_generate_input(self, knowledge_base_id, prompt, current_model):
+        """
+        Build the RetrieveAndGenerate(Stream) request for hybrid search.
+        
+        Args:
+            knowledge_base_id (str): The Knowledge Base ID
+            prompt (str): The user prompt
+            current_model (str): Model ID to generate the answer with
+            
+        Returns:
+            dict: Keyword arguments for the agent runtime call
+        """
+        # Get the region directly from the client's credentials
+        region = self.client.meta.region_name
+        
+        # Use inference profile ARN for RetrieveAndGenerate
+        if current_model in MODEL_TO_PROFILE_ARN:
+            model_arn = MODEL_TO_PROFILE_ARN[current_model]
+        else:
+            # Fallback to direct model ARN if no profile is available
+            model_arn = f"arn:aws:bedrock:{region}::foundation-model/{current_model}"
+        
+        logger.info(f"Using model ARN: {model_arn}")
+        
+        # Preparar la configuración para RetrieveAndGenerate con búsqueda híbrida
+        # SOLUCIÓN: Usar configuración por defecto de AWS Bedrock sin plantillas personalizadas
+        # Esto permite que Bedrock use sus plantillas internas optimizadas para generar citations
+        return {
+            "input": {
+                "text": prompt,
+            },
+            "retrieveAndGenerateConfiguration": {
+                "type": "KNOWLEDGE_BASE",
+                "knowledgeBaseConfiguration": {
+                    "knowledgeBaseId": knowledge_base_id,
+                    "modelArn": model_arn,
+                    # Configuración de recuperación con búsqueda híbrida
+                    "retrievalConfiguration": {
+                        "vectorSearchConfiguration": {
+                            "numberOfResults": 10,
+                            "overrideSearchType": "HYBRID"
+                        }
+                    }
+                }
+            }
+        }
+    
+    def _parse_reference(self, reference):
+        """
+        Extract content, location and score from a retrievedReferences entry.
+        
+        Args:
+            reference (dict): Reference as returned by the agent runtime
+            
+        Returns:
+            dict: Fragment with the keys that were present
+        """
+        fragment = {}
+        content = reference.get('content', {})
+        if isinstance(content, dict) and 'text' in content:
+            fragment['content'] = content['text']
+        s3_location = reference.get('location', {}).get('s3Location', {})
+        if 'uri' in s3_location:
+            fragment['location'] = s3_location['uri']
+        if 'score' in reference:
+            fragment['score'] = reference['score']
+        return fragment
+    
+    def _build_kb_prompt(self, prompt, retrieval_results):
+        """
+        Build the user message for generate_answer: numbered fragments followed
+        by the question.
+        
+        Args:
+            prompt (str): The user prompt
+            retrieval_results (list): Fragments returned by retrieve()
+            
+        Returns:
+            str: Formatted message
+        """
+        context_text = "\n\n".join(
+            f"[{idx}] Fuente: {fragment.get('location', 'desconocida')}\n{fragment.get('content', '')}"
+            for idx, fragment in enumerate(retrieval_results, start=1)
+        )
+        
+        return f"""FRAGMENTOS RECUPERADOS:
+{context_text if context_text else "No se encontraron fragmentos relevantes."}
+
+PREGUNTA:
+{prompt}"""
+    
     def _build_prompt(self, requirement_text, application_context, max_items=3, user_instructions=""):
         """
         Build RAG-enhanced prompt for content generation.
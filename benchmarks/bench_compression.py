@@ -0,0 +1,133 @@
+"""
+Compressed Protocol Benchmark
+Bytes on the wire and client CPU of the MySQL compressed protocol framing
+(pymysql.compress.CompressedStream) for the traffic of one logged query:
+the query_logs INSERT, the success UPDATE carrying the LLM response, the
+retrieved_documents INSERT with ten chunk_text payloads, and a reporting
+read of query_logs rows. Transfer time is estimated for a given bandwidth.
+
+Usage:
+    python benchmarks/bench_compression.py [--thresholds 50 1024] [--bandwidth-mbps 100]
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'package'))
+
+from pymysql import compress  # noqa: E402
+
+WORDS = (
+    'la de el que en y a los se del las por un para con no una su al es lo como más pero sus le ya o '
+    'este sí porque esta entre cuando muy sin sobre también me hasta hay donde quien desde todo nos '
+    'durante todos uno les ni contra otros ese eso ante ellos e esto mí antes algunos qué unos yo otro '
+    'solicitud vacaciones política empleado responsable área aprobación recursos humanos calendario '
+    'periodo cierre contable ausencia justificada trimestre documento procedimiento normativa plazo '
+    'registro sistema portal formulario validación equipo dirección departamento contrato jornada '
+    'permiso retribuido convenio colectivo antigüedad días laborables naturales festivo anual'
+).split()
+
+
+def text(size, seed):
+    """Pseudo-random Spanish prose of about 'size' characters"""
+    generator = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = generator.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def packet(payload, sequence=0):
+    return struct.pack('<I', len(payload))[:3] + bytes([sequence]) + payload
+
+
+def lenenc(value):
+    if len(value) < 251:
+        return bytes([len(value)]) + value
+    if len(value) < 1 << 16:
+        return b'\xfc' + struct.pack('<H', len(value)) + value
+    return b'\xfd' + struct.pack('<I', len(value))[:3] + value
+
+
+def logged_query_traffic(response_kb, chunk_kb):
+    """Client->server statements and server->client report rows of one query"""
+    query = '¿Cuál es el procedimiento para solicitar vacaciones en el área de operaciones?'
+    insert = ("INSERT INTO query_logs (...) VALUES ('a7a9f8e2-1c3b-4a57-9d2e-5b8f7c6d1e2f', "
+              f"'conv-1234', 'jdoe', 'arn:aws:iam::123456789012:user/jdoe', 'analytics', '{query}', 14, 82, "
+              "'anthropic.claude-3-5-sonnet', 'TJ8IMVJVQW', 'pending', '203.0.113.10', 21, NOW())")
+    update = f"UPDATE query_logs SET llm_response = '{text(response_kb * 1024, 0)}', status = 'completed'"
+    documents = "INSERT INTO retrieved_documents (...) VALUES " + ', '.join(
+        f"('a7a9f8e2', 's3://kb-bucket/docs/politica_{rank}.pdf', '{text(chunk_kb * 1024, rank)}', 0.8, {rank})"
+        for rank in range(1, 11))
+    sent = [packet(b'\x03' + sql.encode()) for sql in (insert, update, documents)]
+    received = []
+    for row in range(20):
+        values = ('a7a9f8e2-1c3b-4a57-9d2e-5b8f7c6d1e2f', query, text(response_kb * 1024, row), 'completed')
+        received.append(packet(b''.join(lenenc(value.encode()) for value in values), 4))
+    return sent, received
+
+
+def measure(algorithm, threshold, sent, received):
+    codec = compress.make_codec(algorithm)
+    stream = compress.CompressedStream(codec, threshold)
+    start = time.process_time()
+    wire_out = sum(len(stream.frame(data)) for data in sent)
+    # What the server would send, read back through the client's stream
+    server = compress.CompressedStream(compress.make_codec(algorithm), threshold)
+    frames = b''.join(server.frame(data) for data in received)
+    server_cpu = time.process_time() - start
+    start = time.process_time()
+    position = 0
+
+    def read_socket(size):
+        nonlocal position
+        position += size
+        return frames[position - size:position]
+
+    total = sum(len(data) for data in received)
+    while total:
+        chunk = stream.read(min(total, 16384), read_socket)
+        total -= len(chunk)
+    read_cpu = time.process_time() - start
+    return wire_out, len(frames), server_cpu, read_cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--thresholds', type=int, nargs='+', default=[50, 1024])
+    parser.add_argument('--response-kb', type=int, default=4)
+    parser.add_argument('--chunk-kb', type=int, default=2)
+    parser.add_argument('--bandwidth-mbps', type=float, default=100.0)
+    args = parser.parse_args()
+
+    sent, received = logged_query_traffic(args.response_kb, args.chunk_kb)
+    raw_out = sum(len(data) for data in sent)
+    raw_in = sum(len(data) for data in received)
+    bytes_per_second = args.bandwidth_mbps * 1e6 / 8
+    algorithms = ['zlib'] + (['zstd'] if compress.zstd_available() else [])
+
+    print(f"{'mode':<16} {'sent B':>9} {'received B':>11} {'ratio':>6} "
+          f"{'compress ms':>12} {'read ms':>8} {'transfer ms':>12}")
+    print(f"{'uncompressed':<16} {raw_out:>9,} {raw_in:>11,} {1:>5.2f}x {0:>12.2f} {0:>8.2f} "
+          f"{(raw_out + raw_in) / bytes_per_second * 1000:>12.2f}")
+    for algorithm in algorithms:
+        for threshold in args.thresholds:
+            wire_out, wire_in, compress_cpu, read_cpu = measure(algorithm, threshold, sent, received)
+            print(f"{f'{algorithm} >= {threshold}':<16} {wire_out:>9,} {wire_in:>11,} "
+                  f"{(raw_out + raw_in) / (wire_out + wire_in):>5.2f}x {compress_cpu * 1000:>12.2f} "
+                  f"{read_cpu * 1000:>8.2f} {(wire_out + wire_in) / bytes_per_second * 1000:>12.2f}")
+    if not compress.zstd_available():
+        print("(zstd not measured: the zstandard package is not installed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Export Stream Benchmark
+Peak memory and rows per second of exporting a synthetic query_logs table
+of --rows rows to JSON Lines and CSV, buffered (DictCursor.fetchall, then one
+write) versus streamed (SSDictCursor.fetchmany batches fed to the db_export
+writers, as DatabaseLogger.export does). The result set is framed once into
+a temporary file that the connection reads as its socket; output goes to a
+sink that only counts characters. Each case runs in a fresh interpreter and
+reports its peak RSS (resource module: Linux and macOS).
+
+Usage:
+    python benchmarks/bench_export_stream.py [--rows 1000000] [--batch-size 1000] [--response-chars 256]
+"""
+
+import argparse
+import os
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'package'))
+
+from bench_packet_parse import BINARY, EOF_PACKET, UTF8MB4, field_packet, lenenc  # noqa: E402
+from bench_prepared_statements import make_connection  # noqa: E402
+from db_export import write_csv, write_jsonl  # noqa: E402
+from pymysql.constants import FIELD_TYPE  # noqa: E402
+from pymysql.cursors import DictCursor, SSDictCursor  # noqa: E402
+
+COLUMNS = [
+    ('query_id', FIELD_TYPE.VAR_STRING, UTF8MB4, 144),
+    ('iam_username', FIELD_TYPE.VAR_STRING, UTF8MB4, 1020),
+    ('user_query', FIELD_TYPE.BLOB, UTF8MB4, 65535),
+    ('llm_response', FIELD_TYPE.BLOB, UTF8MB4, 1 << 24),
+    ('status', FIELD_TYPE.VAR_STRING, UTF8MB4, 80),
+    ('tokens_used', FIELD_TYPE.LONG, BINARY, 11),
+    ('processing_time_ms', FIELD_TYPE.LONG, BINARY, 11),
+    ('cache_hit', FIELD_TYPE.TINY, BINARY, 1),
+    ('request_timestamp', FIELD_TYPE.DATETIME, BINARY, 19),
+]
+
+WRITERS = {'jsonl': write_jsonl, 'csv': write_csv}
+CURSORS = {'DictCursor': DictCursor, 'SSDictCursor': SSDictCursor}
+
+
+class LocalServer:
+    """Socket of a server whose replies were written to a file, which is
+    also the connection's read file"""
+
+    def __init__(self, stream):
+        self.read = stream.read
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def write_result_stream(fileobj, rows, response_chars):
+    """Write the framed packets of a query_logs result set of 'rows' rows"""
+    response = lenenc(('La política de vacaciones indica que la solicitud se realiza '
+                       'con quince días de antelación. ' * 100)[:response_chars].encode())
+    query = lenenc('¿Cuál es el procedimiento para solicitar vacaciones?'.encode())
+
+    def packets():
+        yield bytes([len(COLUMNS)])
+        for column in COLUMNS:
+            yield field_packet(*column)
+        yield EOF_PACKET
+        for row in range(rows):
+            yield b''.join([
+                lenenc(f'{row:08x}-1c3b-4a57-9d2e-5b8f7c6d1e2f'.encode()),
+                lenenc(f'user{row % 50:03d}'.encode()),
+                query,
+                response,
+                b'\x09completed',
+                lenenc(str(row % 2000).encode()),
+                lenenc(str(row % 9000).encode()),
+                b'\x011' if row % 3 == 0 else b'\x010',
+                b'\x132025-01-01 12:00:00',
+            ])
+        yield EOF_PACKET
+
+    for sequence, packet in enumerate(packets(), start=1):
+        fileobj.write(struct.pack('<I', len(packet))[:3] + bytes([sequence % 256]) + packet)
+
+
+class CountingSink:
+    """Text file object that keeps only the number of characters written"""
+
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, text):
+        self.chars += len(text)
+        return len(text)
+
+
+def export(path, cursor_name, fmt, batch_size):
+    """Rows and characters written by one export"""
+    with open(path, 'rb') as stream:
+        connection = make_connection(LocalServer(stream))
+        sink = CountingSink()
+        cursor = connection.cursor(CURSORS[cursor_name])
+        cursor.execute('SELECT * FROM query_logs')
+        if cursor_name == 'SSDictCursor':
+            rows = WRITERS[fmt](iter(lambda: cursor.fetchmany(batch_size), ()), sink)
+        else:
+            rows = WRITERS[fmt]([cursor.fetchall()], sink)
+        cursor.close()
+    return rows, sink.chars
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_case(args):
+    start = time.perf_counter()
+    rows, chars = export(args.stream, args.case[0], args.case[1], args.batch_size)
+    seconds = time.perf_counter() - start
+    print(rows, seconds, chars, peak_rss_mb())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--response-chars', type=int, default=256)
+    parser.add_argument('--stream', help=argparse.SUPPRESS)
+    parser.add_argument('--case', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        run_case(args)
+        return
+
+    mib = 1024 * 1024
+    with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as stream:
+        write_result_stream(stream, args.rows, args.response_chars)
+    try:
+        print(f"{args.rows:,} rows, result set {os.path.getsize(stream.name) / mib:.1f} MB")
+        print(f"{'cursor':<13} {'format':<6} {'rows/s':>10} {'output MB':>10} {'peak RSS MB':>12}")
+        for fmt in WRITERS:
+            outputs = set()
+            for cursor_name in CURSORS:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--stream', stream.name,
+                     '--case', cursor_name, fmt, '--batch-size', str(args.batch_size)],
+                    check=True, capture_output=True, text=True
+                ).stdout.split()
+                rows, seconds, chars, peak = int(output[0]), float(output[1]), int(output[2]), float(output[3])
+                assert rows == args.rows
+                outputs.add(chars)
+                print(f"{cursor_name:<13} {fmt:<6} {rows / seconds:>10,.0f} {chars / mib:>10.1f} {peak:>12.1f}")
+            assert len(outputs) == 1, "both cursors must write the same output"
+    finally:
+        os.unlink(stream.name)
+
+
+if __name__ == '__main__':
+    main()
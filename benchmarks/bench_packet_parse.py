@@ -0,0 +1,163 @@
+"""
+Packet Parse Benchmark
+Times MySQLResult parsing of synthetic query_logs-like result sets (id,
+created_at, user_id and two text columns of a given width) with the
+memoryview-based MysqlPacket versus the previous copying path (packet
+rebuilt through a bytearray, bytes slice per column value), best of
+--repeat runs, and reports the transient memory allocated on top of the
+decoded rows (tracemalloc peak minus what the result keeps), which for wide
+rows is the copies of the largest row packet.
+
+Usage:
+    python benchmarks/bench_packet_parse.py [--widths 128 1024 8192 65536] [--total-mb 32] [--repeat 5]
+"""
+
+import argparse
+import gc
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'package'))
+
+from pymysql import converters  # noqa: E402
+from pymysql.constants import FIELD_TYPE  # noqa: E402
+from pymysql.connections import MySQLResult  # noqa: E402
+from pymysql.protocol import MysqlPacket  # noqa: E402
+
+UTF8MB4 = 45
+BINARY = 63
+EOF_PACKET = b'\xfe\x00\x00\x02\x00'
+
+
+class CopyingPacket(MysqlPacket):
+    """MysqlPacket.read as it was before: every column value is a bytes copy"""
+
+    __slots__ = ()
+
+    def read(self, size):
+        result = self._data[self._position:self._position + size]
+        if len(result) != size:
+            raise AssertionError("Result length not requested length")
+        self._position += size
+        return result
+
+
+class ReplayConnection:
+    """Just enough of pymysql.Connection for MySQLResult.read()"""
+
+    def __init__(self, packets, row_packet_type):
+        self._packets = iter(packets)
+        self._row_packet_type = row_packet_type
+        self.use_unicode = True
+        self.encoding = 'utf8'
+        self.decoders = converters.decoders
+
+    def _read_packet(self, packet_type=MysqlPacket):
+        data = next(self._packets)
+        if packet_type is MysqlPacket:
+            packet_type = self._row_packet_type
+        if packet_type is CopyingPacket:
+            # Connection._read_packet used to rebuild every packet as bytes(bytearray)
+            buff = bytearray()
+            buff += data
+            data = bytes(buff)
+        return packet_type(data, self.encoding)
+
+
+def lenenc(value):
+    if value is None:
+        return b'\xfb'
+    length = len(value)
+    if length < 251:
+        prefix = bytes([length])
+    elif length < 1 << 16:
+        prefix = b'\xfc' + struct.pack('<H', length)
+    elif length < 1 << 24:
+        prefix = b'\xfd' + struct.pack('<I', length)[:3]
+    else:
+        prefix = b'\xfe' + struct.pack('<Q', length)
+    return prefix + value
+
+
+def field_packet(name, type_code, charsetnr, length):
+    return (b''.join(lenenc(part) for part in (b'def', b'rag_logs', b'query_logs', b'query_logs',
+                                               name.encode(), name.encode()))
+            + struct.pack('<BHIBHBxx', 0x0c, charsetnr, length, type_code, 0, 0))
+
+
+def result_set(rows, width):
+    """Packets of SELECT id, created_at, user_id, response_text, chunk_text"""
+    columns = [
+        ('id', FIELD_TYPE.LONGLONG, BINARY, 20),
+        ('created_at', FIELD_TYPE.DATETIME, BINARY, 19),
+        ('user_id', FIELD_TYPE.VAR_STRING, UTF8MB4, 256),
+        ('response_text', FIELD_TYPE.BLOB, UTF8MB4, 1 << 24),
+        ('chunk_text', FIELD_TYPE.BLOB, UTF8MB4, 1 << 24),
+    ]
+    packets = [bytes([len(columns)])]
+    packets += [field_packet(*column) for column in columns]
+    packets.append(EOF_PACKET)
+    text = ('respuesta ' * (width // 10 + 1))[:width].encode()
+    for row in range(rows):
+        packets.append(b''.join([
+            lenenc(str(row + 1).encode()),
+            lenenc(b'2025-01-01 12:00:00'),
+            lenenc(f'user{row % 50:03d}'.encode()),
+            lenenc(text),
+            lenenc(text if row % 2 else None),
+        ]))
+    packets.append(EOF_PACKET)
+    return packets
+
+
+def parse(packets, row_packet_type):
+    result = MySQLResult(ReplayConnection(packets, row_packet_type))
+    result.read()
+    return result.rows
+
+
+def measure(packets, row_packet_type, repeat):
+    seconds = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        rows = parse(packets, row_packet_type)
+        seconds = min(seconds, time.perf_counter() - start)
+        del rows
+
+    gc.collect()
+    tracemalloc.start()
+    rows = parse(packets, row_packet_type)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, seconds, peak - retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--widths', type=int, nargs='+', default=[128, 1024, 8192, 65536])
+    parser.add_argument('--total-mb', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    mib = 1024 * 1024
+    print(f"{'width':>7} {'rows':>7} {'copy rows/s':>12} {'view rows/s':>12} {'speedup':>8} "
+          f"{'copy extra MB':>14} {'view extra MB':>14}")
+    for width in args.widths:
+        rows = max(100, args.total_mb * mib // (width * 2))
+        packets = result_set(rows, width)
+
+        expected, copy_seconds, copy_extra = measure(packets, CopyingPacket, args.repeat)
+        got, view_seconds, view_extra = measure(packets, MysqlPacket, args.repeat)
+        assert got == expected, "memoryview parsing must produce the same rows"
+        print(f"{width:>7} {rows:>7} {rows / copy_seconds:>12,.0f} {rows / view_seconds:>12,.0f} "
+              f"{copy_seconds / view_seconds:>7.2f}x {copy_extra / mib:>14.2f} {view_extra / mib:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
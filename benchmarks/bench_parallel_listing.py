@@ -0,0 +1,134 @@
+"""
+Parallel Prefix Listing Benchmark
+Times DocumentManager.list_documents sequentially (1 thread) and on the
+thread pool against a local S3 stand-in with a fixed per-request latency,
+for a growing number of inclusion prefixes and for one large sharded prefix
+
+Usage:
+    python benchmarks/bench_parallel_listing.py [--latency-ms 30] [--objects-per-prefix 2500]
+"""
+
+import argparse
+import bisect
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from document_manager import DocumentManager  # noqa: E402
+
+
+class LocalS3:
+    """In-memory list_objects_v2 (Prefix, Delimiter, MaxKeys, StartAfter, ContinuationToken) with latency"""
+
+    def __init__(self, keys, latency_ms):
+        base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.keys = sorted(keys)
+        self.objects = {
+            key: {'Key': key, 'Size': 1024 + index, 'ETag': f'"{index:032x}"',
+                  'LastModified': base + timedelta(seconds=index)}
+            for index, key in enumerate(self.keys)
+        }
+        self.latency = latency_ms / 1000.0
+        self.calls = 0
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, MaxKeys=1000,
+                        StartAfter=None, ContinuationToken=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        start = bisect.bisect_left(self.keys, Prefix)
+        after = ContinuationToken or StartAfter
+        if after:
+            start = max(start, bisect.bisect_right(self.keys, after))
+
+        contents, common_prefixes, last = [], [], None
+        index = start
+        while index < len(self.keys) and self.keys[index].startswith(Prefix):
+            if len(contents) + len(common_prefixes) == MaxKeys:
+                break
+            key = self.keys[index]
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                common_prefixes.append({'Prefix': common})
+                # Skip every key of the common prefix
+                index = bisect.bisect_left(self.keys, common + '\uffff')
+                last = common + '\uffff'
+                continue
+            contents.append(self.objects[key])
+            last = key
+            index += 1
+
+        truncated = index < len(self.keys) and self.keys[index].startswith(Prefix)
+        page = {'Contents': contents, 'CommonPrefixes': common_prefixes, 'IsTruncated': truncated}
+        if truncated:
+            page['NextContinuationToken'] = last
+        return page
+
+    def get_paginator(self, operation_name):
+        client = self
+
+        class Paginator:
+            def paginate(self, **params):
+                while True:
+                    page = client.list_objects_v2(**params)
+                    yield page
+                    if not page['IsTruncated']:
+                        return
+                    params['ContinuationToken'] = page['NextContinuationToken']
+
+        return Paginator()
+
+
+def make_manager(s3, prefixes, workers):
+    manager = DocumentManager()
+    manager.s3_client = s3
+    manager.list_max_workers = workers
+    manager.get_data_source_config = lambda kb, ds, use_cache=True: {
+        'bucket_name': 'bench-bucket', 'prefixes': prefixes, 'data_source': {}}
+    return manager
+
+
+def timed_listing(s3, prefixes, workers):
+    manager = make_manager(s3, prefixes, workers)
+    s3.calls = 0
+    start = time.perf_counter()
+    documents = manager.list_documents('KB', 'DS')
+    return time.perf_counter() - start, s3.calls, [document['id'] for document in documents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency-ms', type=float, default=30.0)
+    parser.add_argument('--objects-per-prefix', type=int, default=2500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--prefix-counts', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'case':<28} {'calls':>6} {'sequential s':>13} {'parallel s':>11} {'speedup':>8}")
+
+    for count in args.prefix_counts:
+        prefixes = [f"area{p}/" for p in range(count)]
+        keys = [f"area{p}/20250101_120000_doc{i:05d}.pdf"
+                for p in range(count) for i in range(args.objects_per_prefix)]
+        s3 = LocalS3(keys, args.latency_ms)
+        sequential, calls, expected = timed_listing(s3, prefixes, 1)
+        parallel, _, got = timed_listing(s3, prefixes, args.workers)
+        assert got == expected, "parallel listing must match the sequential order"
+        print(f"{f'{count} prefixes':<28} {calls:>6} {sequential:>13.3f} {parallel:>11.3f} {sequential / parallel:>7.1f}x")
+
+    # One large prefix split into sub-prefix shards (e.g. one folder per year/area)
+    keys = [f"docs/{folder:02d}/20250101_120000_doc{i:05d}.pdf"
+            for folder in range(16) for i in range(args.objects_per_prefix // 4)]
+    s3 = LocalS3(keys, args.latency_ms)
+    sequential, calls, expected = timed_listing(s3, ['docs/'], 1)
+    parallel, _, got = timed_listing(s3, ['docs/'], args.workers)
+    assert got == expected, "sharded listing must match the sequential order"
+    print(f"{'1 prefix, 16 shards':<28} {calls:>6} {sequential:>13.3f} {parallel:>11.3f} {sequential / parallel:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
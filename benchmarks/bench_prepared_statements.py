@@ -0,0 +1,175 @@
+"""
+Prepared Statements Benchmark
+Client CPU time and bytes sent per execution of DatabaseLogger's fixed
+statements (the 18-column INSERT INTO query_logs and the success UPDATE with
+the LLM response) through pymysql Cursor.execute (escaping + COM_QUERY)
+versus Cursor.execute_prepared (COM_STMT_EXECUTE, binary parameters). The
+server is a local stand-in that answers every command with an OK packet, so
+the timings are client-side only.
+
+Usage:
+    python benchmarks/bench_prepared_statements.py [--executions 20000] [--response-kb 0 2 8 32]
+"""
+
+import argparse
+import collections
+import os
+import struct
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'package'))
+
+from pymysql import converters  # noqa: E402
+from pymysql.connections import Connection  # noqa: E402
+from pymysql.constants import COMMAND  # noqa: E402
+from pymysql.cursors import Cursor  # noqa: E402
+
+INSERT_SQL = """
+    INSERT INTO query_logs (
+        query_id, conversation_id, iam_username, iam_user_arn, iam_group,
+        person, team,
+        user_query, query_word_count, query_char_count,
+        model_id, knowledge_base_id, status,
+        lambda_request_id, api_gateway_request_id, source_ip,
+        tokens_used, request_timestamp
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, NOW())
+    )
+"""
+
+UPDATE_SQL = """
+    UPDATE query_logs SET
+        llm_response = %s,
+        response_word_count = %s,
+        response_char_count = %s,
+        tokens_used = %s,
+        processing_time_ms = %s,
+        vector_db_time_ms = %s,
+        llm_processing_time_ms = %s,
+        retrieved_documents_count = %s,
+        cache_hit = %s,
+        status = 'completed',
+        response_timestamp = COALESCE(%s, NOW())
+    WHERE query_id = %s
+"""
+
+OK_PACKET = b'\x00\x01\x00\x02\x00\x00\x00'
+EOF_PACKET = b'\xfe\x00\x00\x02\x00'
+PARAM_PACKET = b'\x03def\x00\x00\x00\x01?\x00\x0c\x3f\x00\x00\x00\x00\x00\xfd\x80\x00\x00\x00\x00'
+
+
+class LocalServer:
+    """Socket and read file of a server that answers every command with OK"""
+
+    def __init__(self):
+        self.bytes_sent = 0
+        self.pending = bytearray()
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        self.bytes_sent += len(data)
+        command = data[4]
+        if command == COMMAND.COM_STMT_PREPARE:
+            # No result columns; parameter definitions followed by EOF
+            param_count = data.count(b'?', 5)
+            replies = [struct.pack('<BIHHBH', 0, 1, 0, param_count, 0, 0)]
+            if param_count:
+                replies += [PARAM_PACKET] * param_count + [EOF_PACKET]
+        else:
+            replies = [OK_PACKET]
+        for sequence, reply in enumerate(replies, start=1):
+            self.pending += struct.pack('<I', len(reply))[:3] + bytes([sequence]) + reply
+
+    def read(self, size):
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+    def close(self):
+        pass
+
+
+def make_connection(server):
+    connection = Connection.__new__(Connection)
+    connection._sock = server
+    connection._rfile = server
+    connection._read_timeout = None
+    connection._write_timeout = None
+    connection._next_seq_id = 0
+    connection._result = None
+    connection.encoding = 'utf8'
+    connection.charset = 'utf8mb4'
+    connection.use_unicode = True
+    connection.server_status = 0
+    connection._binary_prefix = False
+    connection.encoders = {k: v for k, v in converters.conversions.items() if type(k) is not int}
+    connection.decoders = {k: v for k, v in converters.conversions.items() if type(k) is int}
+    connection.max_prepared_statements = 64
+    connection._statements = collections.OrderedDict()
+    return connection
+
+
+def statements(response_kb):
+    query = "¿Cuál es el procedimiento para solicitar vacaciones en el área de 'operaciones'?"
+    response = ('La política de vacaciones indica que la solicitud se realiza '
+                'con quince días de antelación. ' * 1000)[:response_kb * 1024]
+    insert_params = (
+        'a7a9f8e2-1c3b-4a57-9d2e-5b8f7c6d1e2f', 'conv-1234', 'jdoe',
+        'arn:aws:iam::123456789012:user/jdoe', 'analytics', 'John Doe', 'analytics',
+        query, 14, len(query), 'anthropic.claude-3-5-sonnet', 'TJ8IMVJVQW', 'pending',
+        'b2c3d4e5-f6a7-4b8c-9d0e-1f2a3b4c5d6e', 'b2c3d4e5-f6a7-4b8c-9d0e-1f2a3b4c5d6e',
+        '203.0.113.10', 21, '2025-01-01 12:00:00.000000'
+    )
+    update_params = (
+        response, len(response.split()), len(response), 512, 2150, 310, 1740, 5, False,
+        '2025-01-01 12:00:02.150000', 'a7a9f8e2-1c3b-4a57-9d2e-5b8f7c6d1e2f'
+    )
+    return [(INSERT_SQL, insert_params), (UPDATE_SQL, update_params)]
+
+
+def run(statement_list, executions, prepared):
+    """Client seconds and bytes sent per execution of every statement"""
+    server = LocalServer()
+    cursor = Cursor(make_connection(server))
+    execute = cursor.execute_prepared if prepared else cursor.execute
+    for sql, params in statement_list:
+        # Prepare outside the timed loop, as a pooled connection would have
+        execute(sql, params)
+    results = []
+    for sql, params in statement_list:
+        server.bytes_sent = 0
+        start = time.process_time()
+        for _ in range(executions):
+            execute(sql, params)
+        seconds = time.process_time() - start
+        results.append((seconds / executions, server.bytes_sent / executions))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--executions', type=int, default=20000)
+    parser.add_argument('--response-kb', type=int, nargs='+', default=[0, 2, 8, 32])
+    args = parser.parse_args()
+
+    print(f"{'statement':<22} {'text us':>8} {'prepared us':>12} {'speedup':>8} "
+          f"{'text bytes':>11} {'prepared bytes':>15}")
+    for response_kb in args.response_kb:
+        statement_list = statements(response_kb)
+        text = run(statement_list, args.executions, prepared=False)
+        prepared = run(statement_list, args.executions, prepared=True)
+        for name, (text_seconds, text_bytes), (prepared_seconds, prepared_bytes) in zip(
+                ('INSERT query_logs', f'UPDATE ({response_kb} KB resp.)'), text, prepared):
+            if name.startswith('INSERT') and response_kb != args.response_kb[0]:
+                continue
+            print(f"{name:<22} {text_seconds * 1e6:>8.1f} {prepared_seconds * 1e6:>12.1f} "
+                  f"{text_seconds / prepared_seconds:>7.2f}x {text_bytes:>11,.0f} {prepared_bytes:>15,.0f}")
+
+
+if __name__ == '__main__':
+    main()
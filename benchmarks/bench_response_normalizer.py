@@ -0,0 +1,115 @@
+"""
+Response Normalizer Benchmark
+Compares the legacy RetrieveAndGenerate parsing (multi-pass with full payload
+logging) against response_normalizer.normalize_retrieve_and_generate on a
+recorded response fixture
+
+Usage:
+    python benchmarks/bench_response_normalizer.py [--iterations 2000] [--scale 1 10 50]
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from response_normalizer import normalize_retrieve_and_generate  # noqa: E402
+
+FIXTURE_PATH = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures', 'retrieve_and_generate_response.json')
+
+logger = logging.getLogger()
+
+
+def legacy_parse(response):
+    """Dict branch of BedrockClient.retrieve_and_generate before the normalizer"""
+    logger.info(f"Response structure: {dir(response)}")
+    answer = "No se generó ninguna respuesta"
+    retrieval_results = []
+
+    logger.info(f"Response keys: {list(response.keys())}")
+    if 'output' in response:
+        logger.info(f"Output content: {response['output']}")
+        if isinstance(response['output'], dict) and 'text' in response['output']:
+            answer = response['output']['text']
+        elif isinstance(response['output'], str):
+            answer = response['output']
+
+    if 'citations' in response:
+        logger.info(f"Found citations in response: {response['citations']}")
+        for citation in response['citations']:
+            retrieval_result = {}
+            if isinstance(citation, dict) and 'retrievedReferences' in citation:
+                for reference in citation['retrievedReferences']:
+                    if 'content' in reference and 'text' in reference['content']:
+                        retrieval_result['content'] = reference['content']['text']
+                    if 'location' in reference and 's3Location' in reference['location'] and 'uri' in reference['location']['s3Location']:
+                        retrieval_result['location'] = reference['location']['s3Location']['uri']
+                    if 'score' in reference:
+                        retrieval_result['score'] = reference['score']
+                    if retrieval_result:
+                        retrieval_results.append(retrieval_result)
+                        retrieval_result = {}
+
+    logger.info(f"Final answer: {answer}")
+    logger.info(f"Extracted {len(retrieval_results)} retrieval results")
+
+    # Eliminar duplicados basados en el contenido
+    unique_results = []
+    seen_contents = set()
+    for result in retrieval_results:
+        content = result.get('content', '')
+        if content and content not in seen_contents:
+            seen_contents.add(content)
+            unique_results.append(result)
+
+    return {'answer': answer, 'retrievalResults': unique_results}
+
+
+def new_parse(response):
+    normalized = normalize_retrieve_and_generate(response)
+    return {'answer': normalized.answer, 'retrievalResults': normalized.retrieval_results()}
+
+
+def scale_fixture(response, factor):
+    """Repeat the citations of the fixture to simulate longer answers"""
+    scaled = copy.deepcopy(response)
+    scaled['citations'] = [copy.deepcopy(citation)
+                           for _ in range(factor) for citation in response['citations']]
+    return scaled
+
+
+def time_parser(parser, response, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parser(response)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 50])
+    args = parser.parse_args()
+
+    # Mismo nivel que en Lambda: los logs INFO se formatean aunque no se muestren
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
+
+    with open(FIXTURE_PATH, 'r', encoding='utf-8') as fixture_file:
+        fixture = json.load(fixture_file)
+
+    print(f"{'citations':>10} {'legacy us':>12} {'normalizer us':>14} {'speedup':>8}")
+    for factor in args.scale:
+        response = scale_fixture(fixture, factor)
+        old = time_parser(legacy_parse, response, args.iterations)
+        new = time_parser(new_parse, response, args.iterations)
+        print(f"{len(response['citations']):>10} {old:>12.1f} {new:>14.1f} {old / new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
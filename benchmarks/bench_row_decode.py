@@ -0,0 +1,127 @@
+"""
+Row Decode Benchmark
+Rows per second fetched through pymysql Cursor and DictCursor from synthetic
+buffered result sets, decoding each row with the per-result-set decoder that
+MySQLResult builds after reading the column descriptions versus the previous
+per-column loop over MySQLResult.converters. Narrow rows (ints, dates,
+floats, short strings) are where the per-column overhead shows.
+
+Usage:
+    python benchmarks/bench_row_decode.py [--columns 4 8 16 32] [--rows 50000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'package'))
+
+from bench_packet_parse import BINARY, EOF_PACKET, UTF8MB4, field_packet, lenenc  # noqa: E402
+from pymysql import converters  # noqa: E402
+from pymysql.constants import FIELD_TYPE  # noqa: E402
+from pymysql.connections import MySQLResult  # noqa: E402
+from pymysql.cursors import Cursor, DictCursor  # noqa: E402
+from pymysql.protocol import MysqlPacket  # noqa: E402
+
+# (type, charset, column length, value for row n)
+COLUMN_KINDS = [
+    (FIELD_TYPE.LONGLONG, BINARY, 20, lambda n: str(n).encode()),
+    (FIELD_TYPE.VAR_STRING, UTF8MB4, 256, lambda n: f'user{n % 50:03d}'.encode()),
+    (FIELD_TYPE.DATETIME, BINARY, 19, lambda n: b'2025-01-01 12:00:00'),
+    (FIELD_TYPE.DOUBLE, BINARY, 22, lambda n: f'{n / 7:.4f}'.encode()),
+    (FIELD_TYPE.LONG, BINARY, 11, lambda n: None if n % 5 == 0 else str(n % 1000).encode()),
+]
+
+
+class LegacyResult(MySQLResult):
+    """MySQLResult with the previous per-column row loop"""
+
+    def _read_row_from_packet(self, packet):
+        row = []
+        for encoding, converter in self.converters:
+            try:
+                data = packet.read_length_coded_string()
+            except IndexError:
+                break
+            if data is not None:
+                if encoding is not None:
+                    data = str(data, encoding)
+                else:
+                    data = bytes(data)
+                if converter is not None:
+                    data = converter(data)
+            row.append(data)
+        return tuple(row)
+
+
+class ReplayConnection:
+    """Just enough of pymysql.Connection for Cursor.execute() on a buffered result"""
+
+    def __init__(self, packets, result_type):
+        self.packets = packets
+        self.result_type = result_type
+        self.use_unicode = True
+        self.encoding = 'utf8'
+        self.decoders = converters.decoders
+        self._result = None
+
+    def query(self, sql, unbuffered=False):
+        self._packets = iter(self.packets)
+        result = self.result_type(self)
+        result.read()
+        self._result = result
+        return result.affected_rows
+
+    def _read_packet(self, packet_type=MysqlPacket):
+        return packet_type(next(self._packets), self.encoding)
+
+
+def result_set(columns, rows):
+    kinds = [COLUMN_KINDS[index % len(COLUMN_KINDS)] for index in range(columns)]
+    packets = [bytes([columns])]
+    packets += [field_packet(f'col{index}', type_code, charset, length)
+                for index, (type_code, charset, length, _) in enumerate(kinds)]
+    packets.append(EOF_PACKET)
+    for row in range(rows):
+        packets.append(b''.join(lenenc(value(row)) for _, _, _, value in kinds))
+    packets.append(EOF_PACKET)
+    return packets
+
+
+def rows_per_second(packets, result_type, cursor_type, repeat):
+    connection = ReplayConnection(packets, result_type)
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        cursor = cursor_type(connection)
+        cursor.execute('SELECT')
+        rows = cursor.fetchall()
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--columns', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'cursor':<11} {'columns':>7} {'loop rows/s':>12} {'decoder rows/s':>15} {'speedup':>8}")
+    for cursor_type in (Cursor, DictCursor):
+        for columns in args.columns:
+            packets = result_set(columns, args.rows)
+            loop_rate, expected = rows_per_second(packets, LegacyResult, cursor_type, args.repeat)
+            decoder_rate, got = rows_per_second(packets, MySQLResult, cursor_type, args.repeat)
+            assert got == expected, "the row decoder must produce the same rows"
+            print(f"{cursor_type.__name__:<11} {columns:>7} {loop_rate:>12,.0f} {decoder_rate:>15,.0f} "
+                  f"{decoder_rate / loop_rate:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Upload Memory Benchmark
+Peak Python memory (tracemalloc) of handling a POST /documents/{kb}/{ds} body
+with the legacy path (json.loads + base64.b64decode + upload_document) versus
+the streaming path (upload_stream.parse_upload_body + upload_document_stream),
+for 1 MB to 50 MB files. The request body itself is not counted: Lambda
+receives it already materialized in both cases.
+
+Usage:
+    python benchmarks/bench_upload_memory.py [--sizes-mb 1 5 10 25 50] [--workers 4]
+"""
+
+import argparse
+import base64
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from document_manager import DocumentManager  # noqa: E402
+from upload_stream import parse_upload_body  # noqa: E402
+
+
+class NullS3:
+    """put_object / multipart calls that read the body like botocore and discard it"""
+
+    def __init__(self):
+        self.received = 0
+
+    def _consume(self, body):
+        if hasattr(body, 'read'):
+            while True:
+                chunk = body.read(64 * 1024)
+                if not chunk:
+                    break
+                self.received += len(chunk)
+        else:
+            self.received += len(body)
+
+    def put_object(self, Body, **params):
+        self._consume(Body)
+        return {'ETag': '"put"'}
+
+    def create_multipart_upload(self, **params):
+        return {'UploadId': 'bench'}
+
+    def upload_part(self, Body, PartNumber, **params):
+        self._consume(Body)
+        return {'ETag': f'"part-{PartNumber}"'}
+
+    def complete_multipart_upload(self, **params):
+        return {'ETag': '"multipart"'}
+
+    def abort_multipart_upload(self, **params):
+        pass
+
+
+def make_manager(workers):
+    manager = DocumentManager()
+    manager.s3_client = NullS3()
+    manager.catalog = None
+    manager.ingestion_scheduler = None
+    manager.multipart_max_workers = workers
+    manager.request_ingestion = lambda kb, ds: {'status': 'skipped', 'ingestion_job_id': None}
+    manager.get_data_source_config = lambda kb, ds, use_cache=True: {
+        'bucket_name': 'bench-bucket', 'prefixes': ['docs/'], 'data_source': {}}
+    return manager
+
+
+def legacy_upload(manager, body_str):
+    body = json.loads(body_str)
+    file_content = base64.b64decode(body['file_content'])
+    return manager.upload_document('KB', 'DS', file_content, body['filename'], body['content_type'], on_duplicate='off')
+
+
+def streaming_upload(manager, body_str):
+    body, content = parse_upload_body(body_str)
+    return manager.upload_document_stream('KB', 'DS', content, body['filename'], body['content_type'], on_duplicate='off')
+
+
+def measure(upload, manager, body_str):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    upload(manager, body_str)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    mib = 1024 * 1024
+    print(f"{'file MB':>8} {'legacy peak MB':>15} {'stream peak MB':>15} {'ratio':>6} {'legacy s':>9} {'stream s':>9}")
+    for size_mb in args.sizes_mb:
+        file_content = os.urandom(size_mb * mib)
+        body_str = json.dumps({
+            'filename': 'benchmark.pdf',
+            'content_type': 'application/pdf',
+            'file_content': base64.b64encode(file_content).decode('ascii')
+        })
+        del file_content
+
+        legacy_peak, legacy_seconds = measure(legacy_upload, make_manager(args.workers), body_str)
+        stream_peak, stream_seconds = measure(streaming_upload, make_manager(args.workers), body_str)
+        print(f"{size_mb:>8} {legacy_peak / mib:>15.1f} {stream_peak / mib:>15.1f} "
+              f"{legacy_peak / stream_peak:>5.1f}x {legacy_seconds:>9.3f} {stream_seconds:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
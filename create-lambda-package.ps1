@@ -2,7 +2,7 @@
 Write-Host "Creando paquete de despliegue Lambda..." -ForegroundColor Green
 
 # Verificar archivos
-$files = @("document_manager.py", "kb_query_handler.py", "bedrock_client_hybrid_search.py")
+$files = @("document_manager.py", "kb_query_handler.py", "bedrock_client_hybrid_search.py", "client_registry.py", "db_pool.py", "answer_cache.py", "response_normalizer.py", "data_source_cache.py", "document_catalog.py", "ingestion_scheduler.py", "upload_stream.py")
 foreach ($file in $files) {
     if (-not (Test-Path $file)) {
         Write-Host "Error: Falta el archivo $file" -ForegroundColor Red
@@ -19,6 +19,14 @@ New-Item -ItemType Directory -Path $tempDir -Force | Out-Null
 Copy-Item "document_manager.py" -Destination $tempDir
 Copy-Item "kb_query_handler.py" -Destination $tempDir
 Copy-Item "bedrock_client_hybrid_search.py" -Destination $tempDir
+Copy-Item "client_registry.py" -Destination $tempDir
+Copy-Item "db_pool.py" -Destination $tempDir
+Copy-Item "answer_cache.py" -Destination $tempDir
+Copy-Item "response_normalizer.py" -Destination $tempDir
+Copy-Item "data_source_cache.py" -Destination $tempDir
+Copy-Item "document_catalog.py" -Destination $tempDir
+Copy-Item "ingestion_scheduler.py" -Destination $tempDir
+Copy-Item "upload_stream.py" -Destination $tempDir
 
 # Crear ZIP
 $zipName = "lambda-function-$timestamp.zip"
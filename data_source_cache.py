@@ -0,0 +1,139 @@
+"""
+Data Source Config Cache Module
+Per-container cache of resolved Knowledge Base data source configurations
+(bucket name and inclusion prefixes) keyed by (knowledge_base_id, data_source_id).
+Entries expire after a TTL; if refreshing an expired entry fails, the stale
+value keeps being served for a grace period.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class DataSourceConfigCache:
+    """
+    TTL + LRU cache of data source configs with stale-while-revalidate on errors
+    """
+
+    def __init__(self, max_entries: int = 64, ttl_seconds: float = 300.0,
+                 stale_seconds: float = 3600.0):
+        """
+        Args:
+            max_entries: Maximum number of data sources kept in memory
+            ttl_seconds: Seconds a config is served without calling bedrock-agent
+            stale_seconds: Seconds past the TTL an expired config may still be
+                served when the refresh call fails
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'stale_hits': 0,
+            'load_errors': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def get(self, knowledge_base_id: str, data_source_id: str,
+            loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the cached config, calling loader() when it is missing or expired
+
+        Args:
+            knowledge_base_id: Knowledge Base ID
+            data_source_id: Data source ID
+            loader: Callable that fetches the config from bedrock-agent
+
+        Returns:
+            Config dict (shared, callers must not mutate it)
+        """
+        key = (knowledge_base_id, data_source_id)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                loaded_at, value = entry
+                if now - loaded_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                self._stats['refreshes'] += 1
+            else:
+                self._stats['misses'] += 1
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._stats['load_errors'] += 1
+                if entry is not None and now - entry[0] <= self.ttl_seconds + self.stale_seconds:
+                    self._stats['stale_hits'] += 1
+                    logger.warning(f"Serving stale data source config for {data_source_id}: {str(e)}")
+                    return entry[1]
+            raise
+
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def invalidate(self, knowledge_base_id: str, data_source_id: Optional[str] = None):
+        """Drop the config of one data source, or of every data source of the knowledge base"""
+        with self._lock:
+            keys = [key for key in self._entries
+                    if key[0] == knowledge_base_id and data_source_id in (None, key[1])]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(keys)
+
+    def clear(self):
+        """Drop every cached config"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            return stats
+
+
+def _build_default_cache() -> Optional[DataSourceConfigCache]:
+    """Create the container-wide cache from environment variables"""
+    if os.environ.get('DATA_SOURCE_CACHE_ENABLED', 'true').lower() != 'true':
+        logger.info("Data source config cache disabled")
+        return None
+
+    return DataSourceConfigCache(
+        max_entries=int(os.environ.get('DATA_SOURCE_CACHE_MAX_ENTRIES', '64')),
+        ttl_seconds=float(os.environ.get('DATA_SOURCE_CACHE_TTL_SECONDS', '300')),
+        stale_seconds=float(os.environ.get('DATA_SOURCE_CACHE_STALE_SECONDS', '3600'))
+    )
+
+
+# Shared cache for the whole container (None when disabled)
+data_source_cache = _build_default_cache()
+
+
+def invalidate_data_source_config(knowledge_base_id: str, data_source_id: Optional[str] = None):
+    """Invalidate cached data source configs, if the cache is enabled"""
+    if data_source_cache is not None:
+        data_source_cache.invalidate(knowledge_base_id, data_source_id)
@@ -0,0 +1,101 @@
+"""
+Database Export Module
+Writers that stream query log rows, as yielded in batches by
+DatabaseLogger.export_batches, to a file object as JSON Lines or CSV. Each
+batch is serialized and written on its own, so memory is bounded by the
+batch size and not by the number of rows exported.
+"""
+
+import csv
+import datetime
+import decimal
+import json
+import operator
+from typing import Dict, Any, Iterable, List, Optional, Sequence, TextIO
+
+FORMAT_JSONL = 'jsonl'
+FORMAT_CSV = 'csv'
+FORMATS = (FORMAT_JSONL, FORMAT_CSV)
+
+
+def _json_default(value: Any) -> Any:
+    """JSON form of the column types pymysql returns that json does not know"""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        # similarity_score is DECIMAL(5,4): a float keeps every digit
+        return float(value)
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+
+def write_jsonl(batches: Iterable[List[Dict[str, Any]]], fileobj: TextIO) -> int:
+    """
+    Write one JSON object per row
+
+    Args:
+        batches: Lists of row dicts
+        fileobj: Text file object to write to
+
+    Returns:
+        Number of rows written
+    """
+    encode = _JSON_ENCODER.encode
+    rows_written = 0
+    for batch in batches:
+        if not batch:
+            continue
+        # One write per batch instead of one per row
+        fileobj.write('\n'.join([encode(row) for row in batch]))
+        fileobj.write('\n')
+        rows_written += len(batch)
+    return rows_written
+
+
+def write_csv(batches: Iterable[List[Dict[str, Any]]], fileobj: TextIO,
+              fieldnames: Optional[Sequence[str]] = None) -> int:
+    """
+    Write rows as CSV with a header line
+
+    Args:
+        batches: Lists of row dicts
+        fileobj: Text file object to write to (opened with newline='')
+        fieldnames: Columns to write, in order. Defaults to the keys of the
+            first row; without rows and fieldnames nothing is written.
+
+    Returns:
+        Number of rows written
+    """
+    writer = csv.writer(fileobj)
+    get_values = None
+    if fieldnames:
+        writer.writerow(fieldnames)
+    rows_written = 0
+    for batch in batches:
+        if not batch:
+            continue
+        if get_values is None:
+            if not fieldnames:
+                fieldnames = list(batch[0])
+                writer.writerow(fieldnames)
+            # itemgetter of a single key returns the bare value, not a tuple
+            get_values = (operator.itemgetter(*fieldnames) if len(fieldnames) > 1
+                          else lambda row: (row[fieldnames[0]],))
+        writer.writerows(map(get_values, batch))
+        rows_written += len(batch)
+    return rows_written
+
+
+def write_rows(batches: Iterable[List[Dict[str, Any]]], fileobj: TextIO, fmt: str = FORMAT_JSONL) -> int:
+    """Write batches with the writer of 'fmt' (jsonl or csv)"""
+    if fmt == FORMAT_JSONL:
+        return write_jsonl(batches, fileobj)
+    if fmt == FORMAT_CSV:
+        return write_csv(batches, fileobj)
+    raise ValueError(f"Unknown export format: {fmt}")
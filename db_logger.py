@@ -5,13 +5,105 @@ Handles all database operations for logging queries to RDS MySQL
 
 import boto3
 import pymysql
+from pymysql.constants import CR, ER
 import json
 import logging
 import uuid
 import os
 import re
-from datetime import datetime
-from typing import Dict, Any, Optional, List
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, Optional, List, TextIO
+
+from client_registry import get_client, registry
+from db_export import write_rows
+from db_pool import ConnectionPool
+from db_log_queue import WriteBehindQueue
+from response_normalizer import unique_documents
+
+# Credentials are cached per container, keyed by secret name
+_CREDENTIALS_CACHE: Dict[str, Dict[str, Any]] = {}
+
+
+def _pool_options() -> Dict[str, Any]:
+    """Connection pool settings from environment variables"""
+    return {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+        'idle_timeout': float(os.environ.get('DB_POOL_IDLE_TIMEOUT_SECONDS', '300')),
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME_SECONDS', '1800')),
+        'validation_interval': float(os.environ.get('DB_POOL_VALIDATION_INTERVAL_SECONDS', '5')),
+        'acquire_timeout': float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT_SECONDS', '5'))
+    }
+
+
+def _compression_options() -> Dict[str, Any]:
+    """Compressed protocol settings from environment variables (off by default)"""
+    algorithm = os.environ.get('DB_COMPRESS', '').lower()
+    if not algorithm:
+        return {}
+    return {
+        'compress': algorithm,
+        'compress_threshold': int(os.environ.get('DB_COMPRESS_THRESHOLD', '1024'))
+    }
+
+
+# Retrieved documents per prepared multi-row INSERT; bounds the number of
+# statement variants (one per row count) cached on each connection
+PREPARED_DOCUMENTS_INSERT_ROWS = 10
+
+# Rows read from the unbuffered export cursor per yielded batch
+EXPORT_BATCH_SIZE = 1000
+
+# Exportable tables; rows are filtered by the request_timestamp of their query log
+_EXPORT_QUERIES = {
+    'query_logs': "SELECT ql.* FROM query_logs ql",
+    'retrieved_documents': (
+        "SELECT rd.* FROM retrieved_documents rd "
+        "JOIN query_logs ql ON ql.query_id = rd.query_id"
+    )
+}
+
+# Whether query_logs has the cache_hit column (migration in README_BD.md),
+# checked once per container, keyed by secret name
+_CACHE_HIT_COLUMN: Dict[str, bool] = {}
+
+
+# MySQL errors that mean the server is unreachable or busy, not that the
+# record is wrong: can't connect, server gone / lost, too many connections,
+# lock wait timeout and deadlock
+TRANSIENT_MYSQL_ERRORS = frozenset([
+    CR.CR_CONN_HOST_ERROR,
+    CR.CR_SERVER_GONE_ERROR,
+    CR.CR_SERVER_LOST,
+    CR.CR_SERVER_LOST_EXTENDED,
+    ER.CON_COUNT_ERROR,
+    ER.LOCK_WAIT_TIMEOUT,
+    ER.LOCK_DEADLOCK
+])
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """
+    Whether a failed log write should be spilled and retried: connection and
+    server availability errors are, errors caused by the record itself
+    (unknown column, bad value, missing default, constraint violations,
+    malformed records) are not. pymysql raises OperationalError for both
+    kinds, so MySQL errors are told apart by their error number.
+    """
+    if isinstance(error, pymysql.err.InterfaceError):
+        # Raised on a connection that is already closed
+        return True
+    if isinstance(error, pymysql.err.MySQLError):
+        return bool(error.args) and error.args[0] in TRANSIENT_MYSQL_ERRORS
+    # Pool timeouts, socket errors; malformed records fail the same way every time
+    return not isinstance(error, (KeyError, TypeError, ValueError))
+
+
+# Write-behind queues are shared per container, keyed by secret name
+_WRITE_BEHIND_QUEUES: Dict[str, WriteBehindQueue] = {}
+_WRITE_BEHIND_LOCK = threading.Lock()
 
 # Configure logging
 logger = logging.getLogger()
@@ -22,18 +114,50 @@ class DatabaseLogger:
     Handles logging of RAG queries to RDS MySQL database
     """
     
-    def __init__(self, secret_name: str = 'rag-query-logs-db-credentials', region: str = 'eu-west-1'):
+    def __init__(self, secret_name: str = 'rag-query-logs-db-credentials', region: str = 'eu-west-1',
+                 write_behind: Optional[bool] = None):
         """
         Initialize DatabaseLogger with credentials from Secrets Manager
         
         Args:
             secret_name: Name of the secret in AWS Secrets Manager
             region: AWS region
+            write_behind: Queue log records and write them from a background
+                thread. Defaults to DB_LOG_MODE == 'write_behind'.
         """
         self.secret_name = secret_name
         self.region = region
         self.connection = None
+        self._pool = None
         self._credentials = None
+        # Fixed statements run as server-side prepared statements (binary protocol)
+        self._prepared_statements = os.environ.get('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+        
+        if write_behind is None:
+            write_behind = os.environ.get('DB_LOG_MODE', 'sync') == 'write_behind'
+        self._queue = self._get_write_behind_queue() if write_behind else None
+    
+    def _get_write_behind_queue(self) -> WriteBehindQueue:
+        """Return the container-wide write-behind queue for this database"""
+        with _WRITE_BEHIND_LOCK:
+            queue = _WRITE_BEHIND_QUEUES.get(self.secret_name)
+            if queue is None:
+                # The writer thread checks out its own pooled connection, so it
+                # never shares a pymysql connection with request threads
+                writer = DatabaseLogger(self.secret_name, self.region, write_behind=False)
+                queue = WriteBehindQueue(
+                    writer._write_records,
+                    max_size=int(os.environ.get('DB_LOG_QUEUE_MAX_SIZE', '1000')),
+                    batch_size=int(os.environ.get('DB_LOG_BATCH_SIZE', '50')),
+                    policy=os.environ.get('DB_LOG_QUEUE_POLICY', 'drop_oldest'),
+                    spill_path=os.environ.get('DB_LOG_SPILL_PATH', '/tmp/db_log_spill.jsonl'),
+                    dead_letter_path=os.environ.get('DB_LOG_DEAD_LETTER_PATH', '/tmp/db_log_dead_letter.jsonl'),
+                    is_transient_error=_is_transient_error,
+                    max_replay_attempts=int(os.environ.get('DB_LOG_MAX_REPLAY_ATTEMPTS', '5'))
+                )
+                _WRITE_BEHIND_QUEUES[self.secret_name] = queue
+                logger.info(f"Started write-behind log queue for {self.secret_name}")
+            return queue
         
     def _get_credentials(self) -> Dict[str, Any]:
         """
@@ -44,30 +168,50 @@ class DatabaseLogger:
         """
         if self._credentials:
             return self._credentials
+        
+        cached = _CREDENTIALS_CACHE.get(self.secret_name)
+        if cached:
+            self._credentials = cached
+            return self._credentials
             
         try:
-            client = boto3.client('secretsmanager', region_name=self.region)
+            client = get_client('secretsmanager', self.region)
             response = client.get_secret_value(SecretId=self.secret_name)
             self._credentials = json.loads(response['SecretString'])
+            _CREDENTIALS_CACHE[self.secret_name] = self._credentials
             logger.info(f"Successfully retrieved credentials from Secrets Manager")
             return self._credentials
         except Exception as e:
             logger.error(f"Error retrieving credentials from Secrets Manager: {str(e)}")
             raise
     
+    def _get_pool(self) -> ConnectionPool:
+        """Return the container-wide connection pool for this database"""
+        return registry.get_pool(self.secret_name, self._open_connection, **_pool_options())
+    
     def _connect(self) -> pymysql.connections.Connection:
         """
-        Establish connection to RDS MySQL database
+        Check out a connection to RDS MySQL from the shared pool, unless this
+        logger already holds one. The pool validates connections on checkout.
+        
+        Returns:
+            pymysql connection object
+        """
+        if self.connection is None:
+            self._pool = self._get_pool()
+            self.connection = self._pool.acquire()
+        return self.connection
+    
+    def _open_connection(self) -> pymysql.connections.Connection:
+        """
+        Establish a new connection to RDS MySQL database
         
         Returns:
             pymysql connection object
         """
-        if self.connection and self.connection.open:
-            return self.connection
-            
         try:
             creds = self._get_credentials()
-            self.connection = pymysql.connect(
+            connection = pymysql.connect(
                 host=creds['host'],
                 user=creds['username'],
                 password=creds['password'],
@@ -75,19 +219,34 @@ class DatabaseLogger:
                 port=creds.get('port', 3306),
                 connect_timeout=5,
                 charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
+                cursorclass=pymysql.cursors.DictCursor,
+                **_compression_options()
             )
-            logger.info(f"Successfully connected to database: {creds['host']}")
-            return self.connection
+            compression = f" (compression: {connection.compression})" if connection.compression else ""
+            logger.info(f"Successfully connected to database: {creds['host']}{compression}")
+            return connection
         except Exception as e:
             logger.error(f"Error connecting to database: {str(e)}")
             raise
     
-    def _close(self):
-        """Close database connection"""
-        if self.connection and self.connection.open:
-            self.connection.close()
-            logger.info("Database connection closed")
+    def _close(self, broken: bool = False):
+        """
+        Return the connection to the pool so the next request (or invocation)
+        can reuse it
+        
+        Args:
+            broken: Close the connection instead of reusing it
+        """
+        if self.connection is not None:
+            connection = self.connection
+            self.connection = None
+            self._pool.release(connection, broken=broken)
+    
+    def close(self):
+        """Release the connection and close the shared pool for good"""
+        self._close()
+        registry.close_pool(self.secret_name)
+        logger.info("Database connection pool closed")
     
     def _count_words(self, text: str) -> int:
         """
@@ -199,8 +358,6 @@ class DatabaseLogger:
         query_id = str(uuid.uuid4())
         
         try:
-            connection = self._connect()
-            
             # Extract IAM information (including Person and Team tags)
             iam_info = self._extract_iam_info(event)
             
@@ -228,20 +385,9 @@ class DatabaseLogger:
             username_to_store = iam_info.get('person') or iam_info['username']
             group_to_store = iam_info.get('team') or iam_info['group']
             
-            with connection.cursor() as cursor:
-                sql = """
-                    INSERT INTO query_logs (
-                        query_id, conversation_id, iam_username, iam_user_arn, iam_group,
-                        person, team,
-                        user_query, query_word_count, query_char_count,
-                        model_id, knowledge_base_id, status,
-                        lambda_request_id, api_gateway_request_id, source_ip,
-                        tokens_used, request_timestamp
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW()
-                    )
-                """
-                cursor.execute(sql, (
+            self._submit({
+                'op': 'create',
+                'params': [
                     query_id,
                     iam_info.get('conversation_id'),  # Nuevo campo conversation_id
                     username_to_store,
@@ -258,9 +404,10 @@ class DatabaseLogger:
                     lambda_request_id,
                     request_context.get('requestId'),
                     source_ip,
-                    estimated_tokens
-                ))
-                connection.commit()
+                    estimated_tokens,
+                    self._timestamp()
+                ]
+            })
                 
             logger.info(f"Created query log with ID: {query_id} for user: {username_to_store} (person: {iam_info.get('person')}, team: {iam_info.get('team')}, conversation_id: {iam_info.get('conversation_id')})")
             return query_id
@@ -273,7 +420,8 @@ class DatabaseLogger:
                                  processing_time_ms: int, tokens_used: Optional[int] = None,
                                  retrieved_docs_count: int = 0,
                                  vector_db_time_ms: Optional[int] = None,
-                                 llm_time_ms: Optional[int] = None):
+                                 llm_time_ms: Optional[int] = None,
+                                 cache_hit: bool = False):
         """
         Update query log with successful response
         
@@ -285,48 +433,21 @@ class DatabaseLogger:
             retrieved_docs_count: Number of documents retrieved
             vector_db_time_ms: Vector DB query time
             llm_time_ms: LLM processing time
+            cache_hit: Whether the answer was served from the answer cache
         """
         try:
-            connection = self._connect()
-            
-            # Count words in response
-            response_word_count = self._count_words(response)
-            response_char_count = len(response) if response else 0
-            
-            # Estimate total tokens if not provided
-            if tokens_used is None:
-                # Estimate tokens for query + response
-                tokens_used = self._estimate_tokens(response)
-            
-            logger.info(f"Response metrics: {response_word_count} words, {response_char_count} chars, ~{tokens_used} tokens")
-            
-            with connection.cursor() as cursor:
-                sql = """
-                    UPDATE query_logs SET
-                        llm_response = %s,
-                        response_word_count = %s,
-                        response_char_count = %s,
-                        tokens_used = %s,
-                        processing_time_ms = %s,
-                        vector_db_time_ms = %s,
-                        llm_processing_time_ms = %s,
-                        retrieved_documents_count = %s,
-                        status = 'completed',
-                        response_timestamp = NOW()
-                    WHERE query_id = %s
-                """
-                cursor.execute(sql, (
-                    response,
-                    response_word_count,
-                    response_char_count,
-                    tokens_used,
-                    processing_time_ms,
-                    vector_db_time_ms,
-                    llm_time_ms,
-                    retrieved_docs_count,
-                    query_id
-                ))
-                connection.commit()
+            self._submit({
+                'op': 'success',
+                'query_id': query_id,
+                'response': response,
+                'processing_time_ms': processing_time_ms,
+                'tokens_used': tokens_used,
+                'retrieved_docs_count': retrieved_docs_count,
+                'vector_db_time_ms': vector_db_time_ms,
+                'llm_time_ms': llm_time_ms,
+                'cache_hit': cache_hit,
+                'timestamp': self._timestamp()
+            })
                 
             logger.info(f"Updated query log {query_id} with success status")
             
@@ -334,6 +455,50 @@ class DatabaseLogger:
             logger.error(f"Error updating query log: {str(e)}")
             raise
     
+    def complete_query_log(self, query_id: str, response: str,
+                           processing_time_ms: int,
+                           documents: Optional[List[Dict[str, Any]]] = None,
+                           tokens_used: Optional[int] = None,
+                           vector_db_time_ms: Optional[int] = None,
+                           llm_time_ms: Optional[int] = None,
+                           cache_hit: bool = False):
+        """
+        Mark a query as completed and store its retrieved documents in a
+        single transaction (one UPDATE, one multi-row INSERT, one commit)
+        
+        Args:
+            query_id: Query UUID
+            response: LLM response text
+            processing_time_ms: Total processing time
+            documents: Retrieved documents with content, location, and score
+            tokens_used: Number of tokens used (if available)
+            vector_db_time_ms: Vector DB query time
+            llm_time_ms: LLM processing time
+            cache_hit: Whether the answer was served from the answer cache
+        """
+        documents = self._compact_documents(documents or [])
+        
+        try:
+            self._submit({
+                'op': 'success',
+                'query_id': query_id,
+                'response': response,
+                'processing_time_ms': processing_time_ms,
+                'tokens_used': tokens_used,
+                'retrieved_docs_count': len(documents),
+                'vector_db_time_ms': vector_db_time_ms,
+                'llm_time_ms': llm_time_ms,
+                'cache_hit': cache_hit,
+                'timestamp': self._timestamp(),
+                'documents': documents
+            })
+                
+            logger.info(f"Completed query log {query_id} with {len(documents)} retrieved documents")
+            
+        except Exception as e:
+            logger.error(f"Error completing query log: {str(e)}")
+            raise
+    
     def update_query_log_error(self, query_id: str, error_message: str):
         """
         Update query log with error status
@@ -343,18 +508,12 @@ class DatabaseLogger:
             error_message: Error message
         """
         try:
-            connection = self._connect()
-            
-            with connection.cursor() as cursor:
-                sql = """
-                    UPDATE query_logs SET
-                        status = 'error',
-                        error_message = %s,
-                        response_timestamp = NOW()
-                    WHERE query_id = %s
-                """
-                cursor.execute(sql, (error_message, query_id))
-                connection.commit()
+            self._submit({
+                'op': 'error',
+                'query_id': query_id,
+                'error_message': error_message,
+                'timestamp': self._timestamp()
+            })
                 
             logger.info(f"Updated query log {query_id} with error status")
             
@@ -373,32 +532,326 @@ class DatabaseLogger:
             return
             
         try:
-            connection = self._connect()
-            
-            with connection.cursor() as cursor:
-                sql = """
-                    INSERT INTO retrieved_documents (
-                        query_id, document_reference, chunk_text,
-                        similarity_score, rank_position
-                    ) VALUES (%s, %s, %s, %s, %s)
-                """
-                
-                for idx, doc in enumerate(documents, start=1):
-                    cursor.execute(sql, (
-                        query_id,
-                        doc.get('location', ''),
-                        doc.get('content', ''),
-                        doc.get('score', 0.0),
-                        idx
-                    ))
-                
-                connection.commit()
+            self._submit({
+                'op': 'documents',
+                'query_id': query_id,
+                'documents': self._compact_documents(documents)
+            })
                 
             logger.info(f"Logged {len(documents)} retrieved documents for query {query_id}")
             
         except Exception as e:
             logger.error(f"Error logging retrieved documents: {str(e)}")
     
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for queued log records to be written (write-behind mode only)
+        
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+            
+        Returns:
+            True if nothing is left pending
+        """
+        if self._queue is None:
+            return True
+        drained = self._queue.flush(timeout)
+        if not drained:
+            logger.warning(f"Log queue not drained after {timeout}s: {self._queue.get_stats()}")
+        return drained
+
+    def export_batches(self, table: str, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None,
+                       batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream the rows of a log table in batches through an unbuffered
+        SSDictCursor, so memory is bounded by batch_size and not by the
+        number of rows
+
+        The export runs on its own connection, outside the pool: the result
+        set keeps it busy until the last row is read, which for months of
+        logs would hold a pool slot for minutes. Abandoning the generator
+        closes that connection instead of reading the remaining rows.
+
+        Args:
+            table: 'query_logs' or 'retrieved_documents'
+            start: Only rows whose query log request_timestamp >= start
+            end: Only rows whose query log request_timestamp < end
+            batch_size: Rows per yielded batch
+
+        Yields:
+            Lists of up to batch_size row dicts
+        """
+        sql, params = self._export_query(table, start, end)
+        connection = self._open_connection()
+        exhausted = False
+        rows_exported = 0
+        started = time.monotonic()
+        try:
+            cursor = connection.cursor(pymysql.cursors.SSDictCursor)
+            # The server aborts a result set whose client stops reading for
+            # longer than net_write_timeout (60s by default); the consumer may
+            # be writing each batch to S3
+            cursor.execute("SET SESSION net_write_timeout = %s",
+                           (int(os.environ.get('DB_EXPORT_NET_WRITE_TIMEOUT_SECONDS', '600')),))
+            cursor.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                rows_exported += len(batch)
+                yield batch
+            exhausted = True
+            cursor.close()
+            logger.info(f"Exported {rows_exported} rows from {table} in {time.monotonic() - started:.1f}s")
+        finally:
+            if not exhausted:
+                logger.warning(f"Export of {table} stopped after {rows_exported} rows")
+                # Closing the cursor would read the rest of the result set;
+                # dropping the socket discards it
+                connection._force_close()
+            else:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    def export(self, table: str, fileobj: TextIO, fmt: str = 'jsonl',
+               start: Optional[datetime] = None, end: Optional[datetime] = None,
+               batch_size: int = EXPORT_BATCH_SIZE) -> int:
+        """
+        Stream a log table to a file object as JSON Lines or CSV
+
+        Args:
+            table: 'query_logs' or 'retrieved_documents'
+            fileobj: Text file object (open CSV files with newline='')
+            fmt: 'jsonl' or 'csv'
+            start: Only rows whose query log request_timestamp >= start
+            end: Only rows whose query log request_timestamp < end
+            batch_size: Rows read and written at a time
+
+        Returns:
+            Number of rows written
+        """
+        return write_rows(self.export_batches(table, start, end, batch_size), fileobj, fmt)
+
+    def _export_query(self, table: str, start: Optional[datetime],
+                      end: Optional[datetime]) -> tuple:
+        """SELECT and parameters of an export"""
+        if table not in _EXPORT_QUERIES:
+            raise ValueError(f"Unknown export table: {table}")
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("ql.request_timestamp >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("ql.request_timestamp < %s")
+            params.append(end)
+        sql = _EXPORT_QUERIES[table]
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql, tuple(params)
+
+    def _submit(self, record: Dict[str, Any]):
+        """Write a record now, or enqueue it in write-behind mode"""
+        if self._queue is not None:
+            self._queue.put(record)
+        else:
+            self._write_records([record])
+    
+    def _write_records(self, records: List[Dict[str, Any]]):
+        """Apply log records in a single transaction"""
+        # Connections checked out here go back to the pool right after the write
+        owns_connection = self.connection is None
+        connection = None
+        broken = False
+        try:
+            connection = self._connect()
+            with connection.cursor() as cursor:
+                for record in records:
+                    self._apply_record(cursor, record)
+                connection.commit()
+        except Exception:
+            broken = True
+            if connection is not None:
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+            raise
+        finally:
+            if owns_connection:
+                self._close(broken=broken)
+    
+    def _apply_record(self, cursor, record: Dict[str, Any]):
+        """Execute the statements of one log record without committing"""
+        op = record['op']
+        if op == 'create':
+            sql = """
+                INSERT INTO query_logs (
+                    query_id, conversation_id, iam_username, iam_user_arn, iam_group,
+                    person, team,
+                    user_query, query_word_count, query_char_count,
+                    model_id, knowledge_base_id, status,
+                    lambda_request_id, api_gateway_request_id, source_ip,
+                    tokens_used, request_timestamp
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, NOW())
+                )
+            """
+            self._execute(cursor, sql, tuple(record['params']))
+        elif op == 'success':
+            self._execute_success_update(
+                cursor, record['query_id'], record['response'],
+                record['processing_time_ms'], record['tokens_used'],
+                record['retrieved_docs_count'], record['vector_db_time_ms'],
+                record['llm_time_ms'], record['cache_hit'], record.get('timestamp')
+            )
+            if record.get('documents'):
+                self._execute_documents_insert(cursor, record['query_id'], record['documents'])
+        elif op == 'error':
+            sql = """
+                UPDATE query_logs SET
+                    status = 'error',
+                    error_message = %s,
+                    response_timestamp = COALESCE(%s, NOW())
+                WHERE query_id = %s
+            """
+            self._execute(cursor, sql, (record['error_message'], record.get('timestamp'), record['query_id']))
+        elif op == 'documents':
+            self._execute_documents_insert(cursor, record['query_id'], record['documents'])
+        else:
+            raise ValueError(f"Unknown log record type: {op}")
+    
+    def _execute_success_update(self, cursor, query_id: str, response: str,
+                                processing_time_ms: int, tokens_used: Optional[int],
+                                retrieved_docs_count: int,
+                                vector_db_time_ms: Optional[int],
+                                llm_time_ms: Optional[int],
+                                cache_hit: bool,
+                                timestamp: Optional[str] = None):
+        """Run the success UPDATE on query_logs without committing"""
+        # Count words in response
+        response_word_count = self._count_words(response)
+        response_char_count = len(response) if response else 0
+        
+        # Estimate total tokens if not provided
+        if tokens_used is None:
+            # Estimate tokens for query + response
+            tokens_used = self._estimate_tokens(response)
+        
+        logger.info(f"Response metrics: {response_word_count} words, {response_char_count} chars, ~{tokens_used} tokens")
+        
+        params = [
+            response,
+            response_word_count,
+            response_char_count,
+            tokens_used,
+            processing_time_ms,
+            vector_db_time_ms,
+            llm_time_ms,
+            retrieved_docs_count
+        ]
+        cache_hit_column = ""
+        if self._has_cache_hit_column(cursor):
+            cache_hit_column = "cache_hit = %s,"
+            params.append(cache_hit)
+        sql = f"""
+            UPDATE query_logs SET
+                llm_response = %s,
+                response_word_count = %s,
+                response_char_count = %s,
+                tokens_used = %s,
+                processing_time_ms = %s,
+                vector_db_time_ms = %s,
+                llm_processing_time_ms = %s,
+                retrieved_documents_count = %s,
+                {cache_hit_column}
+                status = 'completed',
+                response_timestamp = COALESCE(%s, NOW())
+            WHERE query_id = %s
+        """
+        self._execute(cursor, sql, tuple(params + [timestamp, query_id]))
+    
+    def _has_cache_hit_column(self, cursor) -> bool:
+        """
+        Whether query_logs has the cache_hit column. Databases that have not
+        run the migration keep logging, without the cache hit flag.
+        """
+        has_column = _CACHE_HIT_COLUMN.get(self.secret_name)
+        if has_column is None:
+            cursor.execute("""
+                SELECT COUNT(*) AS columns_found FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'query_logs' AND COLUMN_NAME = 'cache_hit'
+            """)
+            has_column = cursor.fetchone()['columns_found'] > 0
+            _CACHE_HIT_COLUMN[self.secret_name] = has_column
+            if not has_column:
+                logger.warning("query_logs.cache_hit is missing, cache hits are not logged; "
+                               "run the migration in README_BD.md")
+        return has_column
+    
+    def _execute(self, cursor, sql: str, params: tuple):
+        """Run a fixed statement, as a prepared statement unless disabled"""
+        if self._prepared_statements:
+            cursor.execute_prepared(sql, params)
+        else:
+            cursor.execute(sql, params)
+    
+    def _execute_documents_insert(self, cursor, query_id: str, documents: List[Dict[str, Any]]):
+        """
+        Insert retrieved documents without committing. executemany turns the
+        statement into a single multi-row INSERT ... VALUES (...), (...); with
+        prepared statements, rows go in multi-row INSERTs of up to
+        PREPARED_DOCUMENTS_INSERT_ROWS rows.
+        """
+        sql = """
+            INSERT INTO retrieved_documents (
+                query_id, document_reference, chunk_text,
+                similarity_score, rank_position
+            ) VALUES """
+        row_placeholders = "(%s, %s, %s, %s, %s)"
+        rows = [
+            (
+                query_id,
+                doc.get('location', ''),
+                doc.get('content', ''),
+                doc.get('score', 0.0),
+                idx
+            )
+            for idx, doc in enumerate(documents, start=1)
+        ]
+        if not self._prepared_statements:
+            cursor.executemany(sql + row_placeholders, rows)
+            return
+        for start in range(0, len(rows), PREPARED_DOCUMENTS_INSERT_ROWS):
+            chunk = rows[start:start + PREPARED_DOCUMENTS_INSERT_ROWS]
+            cursor.execute_prepared(
+                sql + ", ".join([row_placeholders] * len(chunk)),
+                tuple(value for row in chunk for value in row)
+            )
+    
+    def _compact_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep only the fields stored in retrieved_documents, one row per distinct chunk"""
+        return unique_documents([
+            {
+                'location': doc.get('location', ''),
+                'content': doc.get('content', ''),
+                'score': doc.get('score', 0.0)
+            }
+            for doc in documents
+        ])
+    
+    def _timestamp(self) -> Optional[str]:
+        """
+        Event time for deferred writes. Synchronous writes return None so the
+        statement keeps using the database NOW().
+        """
+        if self._queue is None:
+            return None
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+    
     def __enter__(self):
         """Context manager entry"""
         return self
@@ -12,8 +12,10 @@ $TIMESTAMP = Get-Date -Format "yyyyMMdd-HHmmss"
 $ZIP_FILE = "lambda-function-rds-$TIMESTAMP.zip"
 
 Write-Host "`n[1/6] Limpiando archivos temporales..." -ForegroundColor Yellow
+# package/pymysql es la copia de pymysql incluida en el repositorio (con
+# optimizaciones locales del protocolo); se conserva entre despliegues
 if (Test-Path "package") {
-    Remove-Item -Recurse -Force "package"
+    Get-ChildItem "package" -Exclude "pymysql", "pymysql-*.dist-info" | Remove-Item -Recurse -Force
 }
 if (Test-Path "*.zip") {
     Remove-Item -Force "*.zip"
@@ -23,11 +25,15 @@ Write-Host "[2/6] Creando directorio de paquete..." -ForegroundColor Yellow
 New-Item -ItemType Directory -Force -Path "package" | Out-Null
 
 Write-Host "[3/6] Instalando dependencias Python (pymysql)..." -ForegroundColor Yellow
-python -m pip install --target ./package pymysql
+if (Test-Path "package/pymysql") {
+    Write-Host "Usando pymysql incluido en package/pymysql" -ForegroundColor Gray
+} else {
+    python -m pip install --target ./package pymysql
 
-if ($LASTEXITCODE -ne 0) {
-    Write-Host "Error instalando dependencias" -ForegroundColor Red
-    exit 1
+    if ($LASTEXITCODE -ne 0) {
+        Write-Host "Error instalando dependencias" -ForegroundColor Red
+        exit 1
+    }
 }
 
 Write-Host "[4/6] Copiando archivos de la función Lambda..." -ForegroundColor Yellow
@@ -36,6 +42,18 @@ Copy-Item "kb_query_handler.py" -Destination "package/"
 Copy-Item "bedrock_client_hybrid_search.py" -Destination "package/"
 Copy-Item "document_manager.py" -Destination "package/"
 Copy-Item "db_logger.py" -Destination "package/"
+Copy-Item "db_log_queue.py" -Destination "package/"
+Copy-Item "db_export.py" -Destination "package/"
+Copy-Item "client_registry.py" -Destination "package/"
+Copy-Item "db_pool.py" -Destination "package/"
+Copy-Item "answer_cache.py" -Destination "package/"
+Copy-Item "response_normalizer.py" -Destination "package/"
+Copy-Item "data_source_cache.py" -Destination "package/"
+Copy-Item "document_catalog.py" -Destination "package/"
+Copy-Item "ingestion_scheduler.py" -Destination "package/"
+Copy-Item "upload_stream.py" -Destination "package/"
+Copy-Item "lambda_stream_runtime.py" -Destination "package/"
+Copy-Item "lambda-stream-bootstrap" -Destination "package/"
 
 Write-Host "[5/6] Creando archivo ZIP..." -ForegroundColor Yellow
 # Cambiar al directorio package y crear el ZIP
@@ -62,7 +80,7 @@ if ($LASTEXITCODE -eq 0) {
     
     # Limpiar archivos temporales
     Write-Host "`n[LIMPIEZA] Eliminando archivos temporales..." -ForegroundColor Yellow
-    Remove-Item -Recurse -Force "package"
+    Get-ChildItem "package" -Exclude "pymysql", "pymysql-*.dist-info" | Remove-Item -Recurse -Force
     
     Write-Host "`n✓ Despliegue completado!" -ForegroundColor Green
 } else {
@@ -0,0 +1,393 @@
+"""
+Document Catalog Module
+Index of the documents of every data source stored in the RAG MySQL
+database (table document_catalog), so listings, name searches and counts do
+not have to scan S3. DocumentManager keeps it up to date on upload, delete
+and rename; reconcile() repairs drift from a full S3 listing.
+"""
+
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from db_logger import DatabaseLogger
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Columns used by sort_by (the S3 key breaks ties so the order is total)
+CATALOG_SORT_COLUMNS = {
+    'key': 's3_key',
+    'name': 'name',
+    'size': 'size',
+    'modified': 'last_modified'
+}
+
+# Keys are stored as {prefix}{YYYYmmdd_HHMMSS}_{filename}
+_UPLOAD_TIMESTAMP_RE = re.compile(r'^\d{8}_\d{6}_')
+
+# Maximum number of sample keys per category in drift reports
+DRIFT_SAMPLE_SIZE = 20
+
+
+class DocumentCatalog:
+    """
+    Reads and maintains the document_catalog table through the shared
+    connection pool of the RAG database
+    """
+
+    def __init__(self, secret_name: str = 'rag-query-logs-db-credentials', region: str = 'eu-west-1'):
+        """
+        Args:
+            secret_name: Secrets Manager secret with the database credentials
+            region: AWS region
+        """
+        # Reuse the credentials cache and connection pool of the query logger
+        self._db = DatabaseLogger(secret_name, region, write_behind=False)
+
+    def upsert_documents(self, knowledge_base_id: str, data_source_id: str,
+                         documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert or update catalog rows from document dicts (DocumentManager format)
+
+        Returns:
+            Number of documents written
+        """
+        rows = [self._document_to_row(knowledge_base_id, data_source_id, document) for document in documents]
+        if not rows:
+            return 0
+
+        sql = """
+            INSERT INTO document_catalog (
+                data_source_id, key_hash, knowledge_base_id, bucket_name, s3_key,
+                name, display_name, extension, content_type, size, etag, last_modified,
+                content_sha256
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                -- Before etag is assigned: keep a known hash while the object is unchanged
+                content_sha256 = IF(etag <=> VALUES(etag),
+                                    COALESCE(VALUES(content_sha256), content_sha256),
+                                    VALUES(content_sha256)),
+                knowledge_base_id = VALUES(knowledge_base_id),
+                bucket_name = VALUES(bucket_name),
+                name = VALUES(name),
+                display_name = VALUES(display_name),
+                extension = VALUES(extension),
+                content_type = VALUES(content_type),
+                size = VALUES(size),
+                etag = VALUES(etag),
+                last_modified = VALUES(last_modified)
+        """
+        with self._db._get_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+            connection.commit()
+        return len(rows)
+
+    def remove_documents(self, data_source_id: str, s3_keys: Iterable[str]) -> int:
+        """
+        Delete catalog rows by S3 key
+
+        Returns:
+            Number of rows deleted
+        """
+        hashes = [_key_hash(key) for key in s3_keys]
+        if not hashes:
+            return 0
+
+        deleted = 0
+        with self._db._get_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                for start in range(0, len(hashes), 500):
+                    chunk = hashes[start:start + 500]
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    deleted += cursor.execute(
+                        f"DELETE FROM document_catalog WHERE data_source_id = %s AND key_hash IN ({placeholders})",
+                        [data_source_id] + chunk
+                    )
+            connection.commit()
+        return deleted
+
+    def rename_document(self, knowledge_base_id: str, data_source_id: str,
+                        old_s3_key: str, document: Dict[str, Any]) -> bool:
+        """
+        Move the row of old_s3_key to the renamed document, keeping its size
+        and content hash (copy_object does not return them)
+
+        Returns:
+            False if old_s3_key was not indexed (a reconcile will add the new key)
+        """
+        (_, key_hash, _, bucket_name, s3_key, name, display_name, extension,
+         content_type, _, etag, last_modified, _) = self._document_to_row(knowledge_base_id, data_source_id, document)
+        sql = """
+            UPDATE document_catalog SET
+                key_hash = %s, bucket_name = %s, s3_key = %s, name = %s,
+                display_name = %s, extension = %s, content_type = %s,
+                etag = %s, last_modified = %s
+            WHERE data_source_id = %s AND key_hash = %s
+        """
+        with self._db._get_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                updated = cursor.execute(sql, (
+                    key_hash, bucket_name, s3_key, name, display_name, extension,
+                    content_type, etag, last_modified, data_source_id, _key_hash(old_s3_key)
+                ))
+            connection.commit()
+        return bool(updated)
+
+    def list_page(self, knowledge_base_id: str, data_source_id: str, limit: int,
+                  cursor: Optional[List[Any]] = None, name_prefix: str = '',
+                  extensions: Optional[List[str]] = None, sort_by: str = 'key',
+                  descending: bool = False) -> Tuple[List[Dict[str, Any]], Optional[List[Any]], int]:
+        """
+        Read one page of documents from the index
+
+        Args:
+            knowledge_base_id: Knowledge Base ID
+            data_source_id: Data source ID
+            limit: Page size
+            cursor: (sort value, s3 key) of the last document of the previous page
+            name_prefix: Case-insensitive prefix of the name, with or without
+                the upload timestamp
+            extensions: Extensions to keep, with leading dot
+            sort_by: 'key', 'name', 'size' or 'modified'
+            descending: Reverse the order
+
+        Returns:
+            tuple: (documents, next cursor or None, total matching documents)
+        """
+        column = CATALOG_SORT_COLUMNS[sort_by]
+        where, params = self._filters(knowledge_base_id, data_source_id, name_prefix, extensions)
+
+        page_where = list(where)
+        page_params = list(params)
+        if cursor:
+            page_where.append(f"({column}, s3_key) {'<' if descending else '>'} (%s, %s)")
+            page_params.extend(cursor)
+
+        direction = 'DESC' if descending else 'ASC'
+        sql = f"""
+            SELECT s3_key, bucket_name, name, content_type, size, etag, last_modified
+            FROM document_catalog
+            WHERE {' AND '.join(page_where)}
+            ORDER BY {column} {direction}, s3_key {direction}
+            LIMIT %s
+        """
+
+        with self._db._get_pool().connection() as connection:
+            with connection.cursor() as db_cursor:
+                db_cursor.execute(sql, page_params + [limit + 1])
+                rows = db_cursor.fetchall()
+                db_cursor.execute(f"SELECT COUNT(*) AS total FROM document_catalog WHERE {' AND '.join(where)}", params)
+                total = db_cursor.fetchone()['total']
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            value = last[column]
+            if isinstance(value, datetime):
+                value = value.strftime('%Y-%m-%d %H:%M:%S.%f')
+            next_cursor = [value, last['s3_key']]
+
+        return [self._row_to_document(row) for row in rows], next_cursor, total
+
+    def find_by_content_hash(self, knowledge_base_id: str, data_source_id: str,
+                             content_sha256: str) -> List[Dict[str, Any]]:
+        """
+        Documents of the data source with the given SHA-256 (hex) content hash,
+        oldest first. Only documents uploaded through the Lambda have a hash.
+        """
+        sql = """
+            SELECT s3_key, bucket_name, name, content_type, size, etag, last_modified
+            FROM document_catalog
+            WHERE data_source_id = %s AND content_sha256 = %s AND knowledge_base_id = %s
+            ORDER BY last_modified, s3_key
+        """
+        with self._db._get_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, (data_source_id, bytes.fromhex(content_sha256), knowledge_base_id))
+                rows = cursor.fetchall()
+        return [self._row_to_document(row) for row in rows]
+
+    def get_stats(self, knowledge_base_id: str, data_source_id: str) -> Dict[str, Any]:
+        """Document count and total size per extension for a data source"""
+        sql = """
+            SELECT extension, COUNT(*) AS documents, COALESCE(SUM(size), 0) AS total_size,
+                   MAX(last_modified) AS last_modified
+            FROM document_catalog
+            WHERE knowledge_base_id = %s AND data_source_id = %s
+            GROUP BY extension
+        """
+        with self._db._get_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, (knowledge_base_id, data_source_id))
+                rows = cursor.fetchall()
+
+        by_extension = {
+            row['extension']: {'documents': row['documents'], 'total_size': int(row['total_size'])}
+            for row in rows
+        }
+        last_modified = max((row['last_modified'] for row in rows if row['last_modified']), default=None)
+        return {
+            'documents': sum(item['documents'] for item in by_extension.values()),
+            'total_size': sum(item['total_size'] for item in by_extension.values()),
+            'by_extension': by_extension,
+            'last_modified': _isoformat(last_modified) if last_modified else None
+        }
+
+    def drift_report(self, knowledge_base_id: str, data_source_id: str,
+                     s3_documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Compare the index with a full S3 listing without changing anything
+
+        Args:
+            knowledge_base_id: Knowledge Base ID
+            data_source_id: Data source ID
+            s3_documents: Output of DocumentManager.list_documents
+
+        Returns:
+            dict: counts and sample keys of documents missing from the index,
+                  stale index rows and rows whose size or ETag changed
+        """
+        missing, stale, changed = self._diff(knowledge_base_id, data_source_id, s3_documents)
+        return self._report(s3_documents, missing, stale, changed)
+
+    def reconcile(self, knowledge_base_id: str, data_source_id: str,
+                  s3_documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Bring the index in line with a full S3 listing
+
+        Returns:
+            The drift report computed before repairing
+        """
+        missing, stale, changed = self._diff(knowledge_base_id, data_source_id, s3_documents)
+        self.upsert_documents(knowledge_base_id, data_source_id, missing + changed)
+        self.remove_documents(data_source_id, stale)
+        report = self._report(s3_documents, missing, stale, changed)
+        logger.info(f"Reconciled document catalog for data source {data_source_id}: "
+                    f"{report['missing_count']} added, {report['changed_count']} updated, "
+                    f"{report['stale_count']} removed")
+        return report
+
+    def _diff(self, knowledge_base_id: str, data_source_id: str, s3_documents: List[Dict[str, Any]]):
+        """Return (documents missing from the index, stale index keys, changed documents)"""
+        with self._db._get_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT s3_key, size, etag FROM document_catalog WHERE knowledge_base_id = %s AND data_source_id = %s",
+                    (knowledge_base_id, data_source_id)
+                )
+                indexed = {row['s3_key']: (row['size'], row['etag']) for row in cursor.fetchall()}
+
+        missing = []
+        changed = []
+        for document in s3_documents:
+            entry = indexed.pop(document['id'], None)
+            if entry is None:
+                missing.append(document)
+            elif entry != (document['size'], document['metadata'].get('etag')):
+                changed.append(document)
+        # Whatever is left in the index no longer exists in S3
+        stale = list(indexed)
+        return missing, stale, changed
+
+    def _report(self, s3_documents, missing, stale, changed) -> Dict[str, Any]:
+        return {
+            's3_count': len(s3_documents),
+            'missing_count': len(missing),
+            'stale_count': len(stale),
+            'changed_count': len(changed),
+            'in_sync': not (missing or stale or changed),
+            'missing_sample': [document['id'] for document in missing[:DRIFT_SAMPLE_SIZE]],
+            'stale_sample': stale[:DRIFT_SAMPLE_SIZE],
+            'changed_sample': [document['id'] for document in changed[:DRIFT_SAMPLE_SIZE]],
+            'checked_at': datetime.now(timezone.utc).isoformat()
+        }
+
+    def _filters(self, knowledge_base_id: str, data_source_id: str, name_prefix: str,
+                 extensions: Optional[List[str]]):
+        where = ['knowledge_base_id = %s', 'data_source_id = %s']
+        params: List[Any] = [knowledge_base_id, data_source_id]
+        if name_prefix:
+            # The column collation is case-insensitive, so LIKE is too
+            pattern = _escape_like(name_prefix) + '%'
+            where.append('(name LIKE %s OR display_name LIKE %s)')
+            params.extend([pattern, pattern])
+        if extensions:
+            where.append(f"extension IN ({', '.join(['%s'] * len(extensions))})")
+            params.extend(extensions)
+        return where, params
+
+    def _document_to_row(self, knowledge_base_id: str, data_source_id: str, document: Dict[str, Any]) -> tuple:
+        metadata = document.get('metadata', {})
+        s3_key = document['id']
+        name = os.path.basename(s3_key)
+        modified = datetime.fromisoformat(document['updatedAt'])
+        if modified.tzinfo is not None:
+            modified = modified.astimezone(timezone.utc).replace(tzinfo=None)
+        content_sha256 = metadata.get('content_sha256')
+        return (
+            data_source_id,
+            _key_hash(s3_key),
+            knowledge_base_id,
+            metadata.get('s3Bucket', ''),
+            s3_key,
+            name,
+            _UPLOAD_TIMESTAMP_RE.sub('', name),
+            os.path.splitext(name)[1].lower(),
+            document.get('type', ''),
+            document.get('size', 0),
+            metadata.get('etag'),
+            modified,
+            bytes.fromhex(content_sha256) if content_sha256 else None
+        )
+
+    def _row_to_document(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the same document dict as a live S3 listing"""
+        modified = _isoformat(row['last_modified'])
+        return {
+            'id': row['s3_key'],
+            'name': row['name'],
+            'status': 'ACTIVE',
+            'createdAt': modified,
+            'updatedAt': modified,
+            'size': row['size'],
+            'type': row['content_type'],
+            'metadata': {
+                's3Key': row['s3_key'],
+                's3Bucket': row['bucket_name'],
+                'etag': row['etag']
+            }
+        }
+
+
+def _key_hash(s3_key: str) -> bytes:
+    """Fixed-size primary key component (S3 keys are too long for an index)"""
+    return hashlib.sha256(s3_key.encode('utf-8')).digest()
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _isoformat(value: datetime) -> str:
+    """Catalog times are stored in UTC without time zone"""
+    return value.replace(tzinfo=timezone.utc).isoformat()
+
+
+def _build_default_catalog() -> Optional[DocumentCatalog]:
+    """Create the container-wide catalog from environment variables"""
+    if os.environ.get('DOCUMENT_CATALOG_ENABLED', 'false').lower() != 'true':
+        return None
+    return DocumentCatalog(
+        secret_name=os.environ.get('DOCUMENT_CATALOG_DB_SECRET', 'rag-query-logs-db-credentials')
+    )
+
+
+# Shared catalog for the whole container (None when disabled)
+document_catalog = _build_default_catalog()
@@ -1,18 +1,118 @@
+import base64
 import boto3
+import hashlib
+import io
 import json
 import logging
 import os
 import uuid
 import unicodedata
 import re
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
 from botocore.exceptions import ClientError
-from urllib.parse import unquote
+from urllib.parse import quote, unquote, urlencode
+
+from client_registry import get_client
+from answer_cache import invalidate_knowledge_base
+from bedrock_client_hybrid_search import invalidate_retrieval_cache
+from data_source_cache import data_source_cache, invalidate_data_source_config
+from document_catalog import document_catalog
+from ingestion_scheduler import ingestion_scheduler
+from upload_stream import iter_parts
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Paginated listing (GET /documents/{kb}/{ds}?limit=...)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+LIST_SORT_FIELDS = {
+    'key': lambda document: document['id'],
+    'name': lambda document: document['name'].casefold(),
+    'size': lambda document: document['size'],
+    'modified': lambda document: document['updatedAt']
+}
+# Maximum number of concurrent list_objects_v2 calls per listing
+LIST_MAX_WORKERS = int(os.environ.get('DOCUMENT_LIST_MAX_WORKERS', '8'))
+# Keys are stored as {prefix}{YYYYmmdd_HHMMSS}_{filename}
+UPLOAD_TIMESTAMP_RE = re.compile(r'^\d{8}_\d{6}_')
+# Presigned uploads (POST /documents/{kb}/{ds}/uploads): the browser sends the
+# file straight to S3 instead of base64 inside the API Gateway body
+UPLOAD_URL_EXPIRES_SECONDS = int(os.environ.get('DOCUMENT_UPLOAD_URL_EXPIRES_SECONDS', '900'))
+UPLOAD_URL_MULTIPART_THRESHOLD = int(os.environ.get('DOCUMENT_UPLOAD_URL_MULTIPART_THRESHOLD_BYTES', str(100 * 1024 * 1024)))
+MULTIPART_PART_SIZE = int(os.environ.get('DOCUMENT_MULTIPART_PART_SIZE_BYTES', str(16 * 1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.environ.get('DOCUMENT_MAX_UPLOAD_BYTES', str(5 * 1024 ** 3)))
+# S3 limits: parts of at least 5 MiB (except the last one), at most 10000 parts
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# Server-side uploads above this size use a multipart upload with parallel parts
+MULTIPART_THRESHOLD = int(os.environ.get('DOCUMENT_MULTIPART_THRESHOLD_BYTES', str(8 * 1024 * 1024)))
+MULTIPART_MAX_WORKERS = int(os.environ.get('DOCUMENT_MULTIPART_MAX_WORKERS', '4'))
+MULTIPART_PART_RETRIES = int(os.environ.get('DOCUMENT_MULTIPART_PART_RETRIES', '3'))
+# What an upload whose content already exists in the data source does:
+# 'skip' returns the existing document, 'replace' uploads it and deletes the
+# old copies, 'off' disables the check. Duplicates are looked up by content
+# hash in the document catalog, so without the catalog uploads are not checked
+DEDUP_MODES = ('skip', 'replace', 'off')
+DEDUP_MODE = os.environ.get('DOCUMENT_DEDUP_MODE')
+SHA256_HEX_RE = re.compile(r'^[0-9a-f]{64}$')
+# Read size when a presigned upload is hashed from S3 at completion
+HASH_READ_CHUNK_SIZE = 1024 * 1024
+# delete_objects accepts at most 1000 keys per call
+DELETE_BATCH_SIZE = 1000
+# Batch rename / upload: items per request and concurrent S3 operations
+BATCH_MAX_ITEMS = 500
+BATCH_MAX_WORKERS = int(os.environ.get('DOCUMENT_BATCH_MAX_WORKERS', '8'))
+
+
+def invalidate_caches(knowledge_base_id):
+    """Bump the knowledge base generation in the answer and retrieval caches."""
+    invalidate_knowledge_base(knowledge_base_id)
+    invalidate_retrieval_cache(knowledge_base_id)
+
+
+if ingestion_scheduler is not None:
+    # A mutation invalidates the caches right away, but answers cached while
+    # the ingestion job runs still reflect the old content: invalidate again
+    # once the job has ended
+    ingestion_scheduler.add_job_finished_listener(
+        lambda knowledge_base_id, data_source_id, ingestion_job_id: invalidate_caches(knowledge_base_id))
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    Seekable file object over a memoryview, so upload_part can send a slice of
+    the decoded file without copying it (botocore only accepts bytes or files)
+    """
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
 class DocumentManager:
     """Manager for document operations in S3 and Bedrock Knowledge Base."""
     
@@ -60,8 +160,21 @@ class DocumentManager:
             )
         else:
             logger.info("⚠️ Inicializando DocumentManager con credenciales por defecto (rol de Lambda)")
-            self.s3_client = boto3.client('s3', region_name=region_name)
-            self.bedrock_agent_client = boto3.client('bedrock-agent', region_name=region_name)
+            self.s3_client = get_client('s3', region_name)
+            self.bedrock_agent_client = get_client('bedrock-agent', region_name)
+        
+        # Threads used to list several prefixes (or sub-prefix shards) at once
+        self.list_max_workers = LIST_MAX_WORKERS
+        # Threads used to upload the parts of a multipart upload
+        self.multipart_max_workers = MULTIPART_MAX_WORKERS
+        # Threads used by the batch rename / upload endpoints
+        self.batch_max_workers = BATCH_MAX_WORKERS
+        
+        # Persistent document index (None unless DOCUMENT_CATALOG_ENABLED)
+        self.catalog = document_catalog
+        
+        # Coalesces ingestion jobs per data source (None if INGESTION_SCHEDULER_ENABLED=false)
+        self.ingestion_scheduler = ingestion_scheduler
         
         # Allowed file types - Expandido para soportar más tipos
         self.allowed_extensions = {
@@ -82,8 +195,86 @@ class DocumentManager:
             '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
         }
     
-    def get_data_source_config(self, knowledge_base_id, data_source_id):
-        """Get data source configuration to find S3 bucket and prefix."""
+    def _invalidate_caches(self, knowledge_base_id):
+        """Bump the knowledge base generation in the answer and retrieval caches."""
+        invalidate_caches(knowledge_base_id)
+    
+    def _update_catalog(self, update):
+        """
+        Apply update(catalog) if the catalog is enabled. Failures never fail the
+        S3 operation; the drift report / reconcile job repairs the index.
+        """
+        if self.catalog is None:
+            return
+        try:
+            update(self.catalog)
+        except Exception as e:
+            logger.warning(f"Document catalog update failed, reconcile to repair it: {str(e)}")
+    
+    def request_ingestion(self, knowledge_base_id, data_source_id):
+        """
+        Ask for a Knowledge Base sync after a mutation. With the scheduler, a job
+        is only started when none is running; otherwise one follow-up is queued.
+        Never raises: the S3 change is already done.
+        """
+        if self.ingestion_scheduler is not None:
+            return self.ingestion_scheduler.request_sync(self.bedrock_agent_client, knowledge_base_id, data_source_id)
+        
+        try:
+            response = self.bedrock_agent_client.start_ingestion_job(
+                knowledgeBaseId=knowledge_base_id,
+                dataSourceId=data_source_id
+            )
+            ingestion_job_id = response.get('ingestionJob', {}).get('ingestionJobId')
+            logger.info(f"Started ingestion job {ingestion_job_id} for data source {data_source_id}")
+            return {'status': 'started', 'ingestion_job_id': ingestion_job_id, 'follow_up_pending': False}
+        except Exception as e:
+            logger.warning(f"Could not start ingestion job: {str(e)}")
+            return {'status': 'failed', 'ingestion_job_id': None, 'follow_up_pending': False, 'error': str(e)}
+    
+    def run_pending_ingestions(self, knowledge_base_id=None, data_source_id=None):
+        """Start queued follow-up ingestion jobs that are due (no-op without the scheduler)."""
+        if self.ingestion_scheduler is None:
+            return []
+        return self.ingestion_scheduler.run_pending(self.bedrock_agent_client, knowledge_base_id, data_source_id)
+    
+    def run_scheduled_ingestion(self, knowledge_base_id, data_source_id, ingestion_job_id=None, follow_up=False):
+        """Run of an ingestion schedule: check the watched job and start the queued follow-up."""
+        if self.ingestion_scheduler is None:
+            raise ValueError("Ingestion scheduler is not enabled")
+        return self.ingestion_scheduler.run_scheduled(
+            self.bedrock_agent_client, knowledge_base_id, data_source_id, ingestion_job_id, follow_up)
+    
+    def get_ingestion_status(self, knowledge_base_id, data_source_id):
+        """Latest ingestion job of the data source and whether a follow-up is queued."""
+        if self.ingestion_scheduler is None:
+            raise ValueError("Ingestion scheduler is not enabled")
+        return self.ingestion_scheduler.get_status(self.bedrock_agent_client, knowledge_base_id, data_source_id)
+    
+    def _invalidate_config_on_error(self, error, knowledge_base_id, data_source_id):
+        """Forget the cached data source config if S3 says its bucket is gone."""
+        if isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') == 'NoSuchBucket':
+            logger.warning(f"Bucket of data source {data_source_id} not found, invalidating cached config")
+            invalidate_data_source_config(knowledge_base_id, data_source_id)
+    
+    def get_data_source_config(self, knowledge_base_id, data_source_id, use_cache=True):
+        """
+        Get data source configuration to find S3 bucket and prefix.
+        
+        The resolved config is cached per container (see data_source_cache);
+        use_cache=False forces a get_data_source call.
+        """
+        if not use_cache or data_source_cache is None:
+            return self._load_data_source_config(knowledge_base_id, data_source_id)
+        
+        return data_source_cache.get(
+            knowledge_base_id,
+            data_source_id,
+            lambda: self._load_data_source_config(knowledge_base_id, data_source_id)
+        )
+    
+    def _load_data_source_config(self, knowledge_base_id, data_source_id):
+        """Call bedrock-agent get_data_source and extract bucket and prefixes."""
         try:
             response = self.bedrock_agent_client.get_data_source(
                 knowledgeBaseId=knowledge_base_id,
@@ -98,6 +289,7 @@ class DocumentManager:
             
             # Extract bucket name from ARN
             bucket_name = bucket_arn.split(':::')[-1] if bucket_arn else None
+            logger.info(f"Loaded data source config for {data_source_id}: bucket={bucket_name}, prefixes={inclusion_prefixes}")
             
             return {
                 'bucket_name': bucket_name,
@@ -109,8 +301,13 @@ class DocumentManager:
             logger.error(f"Error getting data source config: {str(e)}")
             raise
     
-    def list_documents(self, knowledge_base_id, data_source_id):
-        """List all documents in a data source."""
+    def list_documents(self, knowledge_base_id, data_source_id, raise_errors=False):
+        """
+        List all documents in a data source.
+        
+        By default a prefix that cannot be listed is skipped; raise_errors=True
+        fails instead (needed when the result must be complete, e.g. reconcile).
+        """
         try:
             logger.info(f"Listing documents for data source {data_source_id} in KB {knowledge_base_id}")
             
@@ -121,57 +318,25 @@ class DocumentManager:
             
             if not bucket_name:
                 logger.error("No bucket name found in data source configuration")
+                if raise_errors:
+                    raise ValueError("No bucket name found in data source configuration")
                 return []
             
             documents = []
             
-            # List objects for each prefix
-            for prefix in prefixes:
-                try:
-                    paginator = self.s3_client.get_paginator('list_objects_v2')
-                    pages = paginator.paginate(
-                        Bucket=bucket_name,
-                        Prefix=prefix,
-                        MaxKeys=1000
-                    )
-                    
-                    for page in pages:
-                        if 'Contents' in page:
-                            for obj in page['Contents']:
-                                key = obj['Key']
-                                
-                                # Skip folders
-                                if key.endswith('/'):
-                                    continue
-                                
-                                # Get file extension
-                                file_ext = os.path.splitext(key)[1].lower()
-                                if file_ext not in self.allowed_extensions:
-                                    continue
-                                
-                                # Extract filename from key
-                                filename = os.path.basename(key)
-                                
-                                document = {
-                                    'id': key,  # Use S3 key as document ID
-                                    'name': filename,
-                                    'status': 'ACTIVE',
-                                    'createdAt': obj['LastModified'].isoformat(),
-                                    'updatedAt': obj['LastModified'].isoformat(),
-                                    'size': obj['Size'],
-                                    'type': self.allowed_extensions[file_ext],
-                                    'metadata': {
-                                        's3Key': key,
-                                        's3Bucket': bucket_name,
-                                        'etag': obj['ETag'].strip('"')
-                                    }
-                                }
-                                
-                                documents.append(document)
-                                
-                except Exception as e:
-                    logger.error(f"Error listing objects with prefix {prefix}: {str(e)}")
+            # List the prefixes concurrently; results keep the prefix order
+            for prefix, objects, error in self._list_prefixes(bucket_name, prefixes):
+                if error is not None:
+                    logger.error(f"Error listing objects with prefix {prefix}: {str(error)}")
+                    self._invalidate_config_on_error(error, knowledge_base_id, data_source_id)
+                    if raise_errors:
+                        raise error
                     continue
+                
+                for obj in objects:
+                    document = self._object_to_document(obj, bucket_name)
+                    if document:
+                        documents.append(document)
             
             logger.info(f"Found {len(documents)} documents in data source {data_source_id}")
             return documents
@@ -180,80 +345,879 @@ class DocumentManager:
             logger.error(f"Error listing documents: {str(e)}")
             raise
     
-    def upload_document(self, knowledge_base_id, data_source_id, file_content, filename, content_type):
-        """Upload a document to the data source."""
-        try:
-            logger.info(f"Uploading document {filename} to data source {data_source_id}")
-            
-            # Validate file type
-            file_ext = os.path.splitext(filename)[1].lower()
-            if file_ext not in self.allowed_extensions:
-                raise ValueError(f"File type {file_ext} not allowed. Allowed types: {list(self.allowed_extensions.keys())}")
+    def list_documents_page(self, knowledge_base_id, data_source_id, limit=DEFAULT_PAGE_SIZE,
+                            page_token=None, name_prefix=None, extensions=None,
+                            sort_by='key', sort_order='asc', use_catalog=True):
+        """
+        List one page of documents in a data source.
+        
+        Args:
+            knowledge_base_id (str): Knowledge Base ID
+            data_source_id (str): Data source ID
+            limit (int): Maximum number of documents in the page (1-MAX_PAGE_SIZE)
+            page_token (str, optional): next_page_token of the previous page
+            name_prefix (str, optional): Case-insensitive prefix of the file name,
+                with or without the upload timestamp
+            extensions (list, optional): File extensions to keep (e.g. ['.pdf', 'docx'])
+            sort_by (str): 'key' (S3 order), 'name', 'size' or 'modified'
+            sort_order (str): 'asc' or 'desc'
+            use_catalog (bool): Read from the document catalog when it is enabled
             
-            # Get data source configuration
+        Returns:
+            dict: documents, count, next_page_token (None on the last page) and
+                  source ('catalog' or 's3'); catalog pages also carry total_count
+        """
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError("limit must be an integer")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        if sort_by not in LIST_SORT_FIELDS:
+            raise ValueError(f"sort_by must be one of {list(LIST_SORT_FIELDS)}")
+        if sort_order not in ('asc', 'desc'):
+            raise ValueError("sort_order must be 'asc' or 'desc'")
+        
+        name_prefix = (name_prefix or '').casefold()
+        extensions = sorted({
+            ext.lower() if ext.startswith('.') else f".{ext.lower()}"
+            for ext in (extensions or []) if ext
+        })
+        source = 'catalog' if use_catalog and self.catalog is not None else 's3'
+        # A token is only valid for the query that produced it
+        query = [knowledge_base_id, data_source_id, name_prefix, extensions, sort_by, sort_order, source]
+        state = self._decode_page_token(page_token, query)
+        
+        if source == 'catalog':
+            documents, next_cursor, total_count = self.catalog.list_page(
+                knowledge_base_id, data_source_id, limit, state.get('cursor'),
+                name_prefix, extensions, sort_by, sort_order == 'desc')
+            logger.info(f"Listed page of {len(documents)} of {total_count} documents from the catalog "
+                        f"for data source {data_source_id}")
+            return {
+                'documents': documents,
+                'count': len(documents),
+                'total_count': total_count,
+                'next_page_token': self._encode_page_token({'cursor': next_cursor}, query) if next_cursor else None,
+                'source': source
+            }
+        
+        def matches(document):
+            if extensions and os.path.splitext(document['name'])[1].lower() not in extensions:
+                return False
+            if name_prefix:
+                name = document['name'].casefold()
+                return name.startswith(name_prefix) or UPLOAD_TIMESTAMP_RE.sub('', name).startswith(name_prefix)
+            return True
+        
+        try:
             config = self.get_data_source_config(knowledge_base_id, data_source_id)
             bucket_name = config['bucket_name']
-            prefixes = config['prefixes']
+            prefixes = config['prefixes'] or ['']
             
             if not bucket_name:
                 raise ValueError("No bucket name found in data source configuration")
             
-            # Use first prefix or empty string
-            prefix = prefixes[0] if prefixes else ''
+            if sort_by == 'key' and sort_order == 'asc':
+                documents, next_state = self._list_page_in_key_order(
+                    bucket_name, prefixes, limit, matches, state)
+            else:
+                documents, next_state = self._list_page_sorted(
+                    bucket_name, prefixes, limit, matches, state, sort_by, sort_order == 'desc')
             
-            # Generate S3 key
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            safe_filename = filename.replace(' ', '_')
-            s3_key = f"{prefix}{timestamp}_{safe_filename}" if prefix else f"{timestamp}_{safe_filename}"
+            logger.info(f"Listed page of {len(documents)} documents in data source {data_source_id} "
+                        f"(sort={sort_by} {sort_order}, more={next_state is not None})")
+            
+            return {
+                'documents': documents,
+                'count': len(documents),
+                'next_page_token': self._encode_page_token(next_state, query) if next_state else None,
+                'source': source
+            }
+            
+        except Exception as e:
+            logger.error(f"Error listing documents page: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
+            raise
+    
+    def _list_page_in_key_order(self, bucket_name, prefixes, limit, matches, state):
+        """
+        Walk the prefixes in order, resuming after the last key returned, and
+        stop as soon as the page is full. Returns (documents, next_state).
+        """
+        prefix_index = state.get('prefix', 0)
+        start_after = state.get('after')
+        documents = []
+        
+        while prefix_index < len(prefixes):
+            params = {'Bucket': bucket_name, 'Prefix': prefixes[prefix_index], 'MaxKeys': 1000}
+            if start_after:
+                params['StartAfter'] = start_after
             
-            # Sanitize filename for S3 metadata (ASCII only)
-            sanitized_filename = self._sanitize_filename_for_metadata(filename)
-            logger.info(f"Original filename: '{filename}' -> Sanitized: '{sanitized_filename}'")
+            while True:
+                page = self.s3_client.list_objects_v2(**params)
+                contents = page.get('Contents', [])
+                for position, obj in enumerate(contents):
+                    document = self._object_to_document(obj, bucket_name)
+                    if not document or not matches(document):
+                        continue
+                    documents.append(document)
+                    if len(documents) == limit:
+                        more = (position + 1 < len(contents) or page.get('IsTruncated')
+                                or prefix_index + 1 < len(prefixes))
+                        return documents, ({'prefix': prefix_index, 'after': obj['Key']} if more else None)
+                
+                if not page.get('IsTruncated'):
+                    break
+                params.pop('StartAfter', None)
+                params['ContinuationToken'] = page['NextContinuationToken']
+            
+            prefix_index += 1
+            start_after = None
+        
+        return documents, None
+    
+    def _list_page_sorted(self, bucket_name, prefixes, limit, matches, state, sort_by, descending):
+        """
+        Sort every matching document and return the page after the cursor
+        (sort value, key) of the previous page. Returns (documents, next_state).
+        """
+        sort_value = LIST_SORT_FIELDS[sort_by]
+        documents = []
+        
+        for prefix, objects, error in self._list_prefixes(bucket_name, prefixes):
+            if error is not None:
+                raise error
+            for obj in objects:
+                document = self._object_to_document(obj, bucket_name)
+                if document and matches(document):
+                    documents.append(document)
+        
+        def cursor_of(document):
+            return [sort_value(document), document['id']]
+        
+        documents.sort(key=cursor_of, reverse=descending)
+        
+        cursor = state.get('cursor')
+        if cursor:
+            if descending:
+                documents = [document for document in documents if cursor_of(document) < cursor]
+            else:
+                documents = [document for document in documents if cursor_of(document) > cursor]
+        
+        page = documents[:limit]
+        next_state = {'cursor': cursor_of(page[-1])} if len(documents) > limit else None
+        return page, next_state
+    
+    def _list_prefixes(self, bucket_name, prefixes):
+        """
+        List every object under several prefixes on a bounded thread pool.
+        
+        Phase 1 reads the first page of each prefix; a prefix with more than
+        one page is split into its sub-prefixes (Delimiter='/'). Phase 2 lists
+        those shards in full. Tasks never wait on other tasks, so the pool
+        cannot deadlock.
+        
+        Returns:
+            list: (prefix, objects in S3 key order, error or None), in the
+                  order of prefixes, so the output matches a sequential listing
+        """
+        shard_count = 0
+        merged = []
+        with ThreadPoolExecutor(max_workers=max(1, self.list_max_workers), thread_name_prefix='s3-list') as executor:
+            plans = [executor.submit(self._plan_prefix, bucket_name, prefix) for prefix in prefixes]
+            
+            # Submit every shard before waiting on any of them
+            pending = []
+            for prefix, plan in zip(prefixes, plans):
+                try:
+                    objects, shards = plan.result()
+                except Exception as e:
+                    pending.append((prefix, None, [], e))
+                    continue
+                shard_count += len(shards)
+                pending.append((prefix, objects, [executor.submit(self._list_all_objects, bucket_name, shard)
+                                                  for shard in shards], None))
+            
+            for prefix, objects, shard_futures, error in pending:
+                if shard_futures:
+                    try:
+                        for future in shard_futures:
+                            objects.extend(future.result())
+                        objects.sort(key=lambda obj: obj['Key'])
+                    except Exception as e:
+                        objects, error = None, e
+                merged.append((prefix, objects, error))
+        
+        if len(prefixes) > 1 or shard_count:
+            logger.info(f"Listed {len(prefixes)} prefixes and {shard_count} sub-prefix shards "
+                        f"on up to {self.list_max_workers} threads")
+        return merged
+    
+    def _plan_prefix(self, bucket_name, prefix):
+        """
+        Read the first page of a prefix. Returns (objects, shards): all objects
+        and no shards for a small prefix, or the objects directly under the
+        prefix and its sub-prefixes for a large one.
+        """
+        page = self.s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, MaxKeys=1000)
+        if not page.get('IsTruncated'):
+            return page.get('Contents', []), []
+        
+        objects = []
+        shards = []
+        params = {'Bucket': bucket_name, 'Prefix': prefix, 'Delimiter': '/', 'MaxKeys': 1000}
+        while True:
+            page = self.s3_client.list_objects_v2(**params)
+            objects.extend(page.get('Contents', []))
+            shards.extend(common['Prefix'] for common in page.get('CommonPrefixes', []))
+            if not page.get('IsTruncated'):
+                break
+            params['ContinuationToken'] = page['NextContinuationToken']
+        return objects, shards
+    
+    def _list_all_objects(self, bucket_name, prefix):
+        """Every object under a prefix, in S3 key order."""
+        objects = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, MaxKeys=1000):
+            objects.extend(page.get('Contents', []))
+        return objects
+    
+    def _object_to_document(self, obj, bucket_name):
+        """Build the document dict of a list_objects_v2 entry, or None if it is not a document."""
+        key = obj['Key']
+        
+        # Skip folders
+        if key.endswith('/'):
+            return None
+        
+        # Get file extension
+        file_ext = os.path.splitext(key)[1].lower()
+        if file_ext not in self.allowed_extensions:
+            return None
+        
+        return {
+            'id': key,  # Use S3 key as document ID
+            'name': os.path.basename(key),
+            'status': 'ACTIVE',
+            'createdAt': obj['LastModified'].isoformat(),
+            'updatedAt': obj['LastModified'].isoformat(),
+            'size': obj['Size'],
+            'type': self.allowed_extensions[file_ext],
+            'metadata': {
+                's3Key': key,
+                's3Bucket': bucket_name,
+                'etag': obj['ETag'].strip('"')
+            }
+        }
+    
+    def _encode_page_token(self, state, query):
+        """Opaque continuation token: URL-safe base64 of the position and the query it belongs to."""
+        payload = json.dumps({'q': query, 's': state}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    def _decode_page_token(self, page_token, query):
+        """Return the position stored in a continuation token ({} for the first page)."""
+        if not page_token:
+            return {}
+        try:
+            padded = page_token + '=' * (-len(page_token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        except Exception:
+            raise ValueError("Invalid page_token")
+        if payload.get('q') != query:
+            raise ValueError("page_token does not match the listing parameters")
+        return payload.get('s') or {}
+    
+    def _prepare_upload(self, knowledge_base_id, data_source_id, filename):
+        """
+        Validate the file type and build the target of an upload: bucket, key
+        ({prefix}{YYYYmmdd_HHMMSS}_{filename}), metadata and tagging. Shared by
+        the direct upload and the presigned upload URLs.
+        """
+        # Validate file type
+        file_ext = os.path.splitext(filename)[1].lower()
+        if file_ext not in self.allowed_extensions:
+            raise ValueError(f"File type {file_ext} not allowed. Allowed types: {list(self.allowed_extensions.keys())}")
+        
+        # Get data source configuration
+        config = self.get_data_source_config(knowledge_base_id, data_source_id)
+        bucket_name = config['bucket_name']
+        prefixes = config['prefixes']
+        
+        if not bucket_name:
+            raise ValueError("No bucket name found in data source configuration")
+        
+        # Use first prefix or empty string
+        prefix = prefixes[0] if prefixes else ''
+        
+        # Generate S3 key
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        safe_filename = filename.replace(' ', '_')
+        s3_key = f"{prefix}{timestamp}_{safe_filename}" if prefix else f"{timestamp}_{safe_filename}"
+        
+        # Sanitize filename for S3 metadata (ASCII only)
+        sanitized_filename = self._sanitize_filename_for_metadata(filename)
+        logger.info(f"Original filename: '{filename}' -> Sanitized: '{sanitized_filename}'")
+        
+        return {
+            'bucket_name': bucket_name,
+            'key': s3_key,
+            'extension': file_ext,
+            'metadata': {
+                'original_filename': sanitized_filename,  # Use sanitized version for metadata
+                'uploaded_at': datetime.now().isoformat(),
+                'data_source_id': data_source_id,
+                'knowledge_base_id': knowledge_base_id
+            },
+            'tagging': self._original_name_tagging(filename)
+        }
+    
+    def _original_name_tagging(self, filename):
+        """
+        Tagging that stores the original filename (supports Unicode). Fully
+        URL-encoded so it is also a valid header for presigned PUTs.
+        """
+        return urlencode({'original_name': filename}, quote_via=quote)
+    
+    def upload_document(self, knowledge_base_id, data_source_id, file_content, filename, content_type,
+                        on_duplicate=None):
+        """
+        Upload a document to the data source.
+        
+        on_duplicate ('skip', 'replace' or 'off', default DOCUMENT_DEDUP_MODE)
+        decides what happens when the same content is already in the data source.
+        """
+        try:
+            logger.info(f"Uploading document {filename} to data source {data_source_id}")
+            
+            target = self._prepare_upload(knowledge_base_id, data_source_id, filename)
+            
+            on_duplicate = self._dedup_mode(on_duplicate)
+            content_sha256, duplicates = self._find_duplicates(
+                knowledge_base_id, data_source_id, [memoryview(file_content)], on_duplicate)
+            if duplicates and on_duplicate == 'skip':
+                return {**duplicates[0], 'duplicate': True, 'content_sha256': content_sha256}
+            if content_sha256:
+                target['metadata']['content_sha256'] = content_sha256
             
             # Upload to S3
-            self.s3_client.put_object(
+            if len(file_content) > MULTIPART_THRESHOLD:
+                put_response = self._multipart_upload(
+                    target, content_type, self._split_parts(file_content))
+            else:
+                put_response = self.s3_client.put_object(
+                    Bucket=target['bucket_name'],
+                    Key=target['key'],
+                    Body=file_content,
+                    ContentType=content_type,
+                    Metadata=target['metadata'],
+                    Tagging=target['tagging']
+                )
+            
+            replaced = self._remove_duplicates(knowledge_base_id, data_source_id, target['bucket_name'], duplicates)
+            return self._register_upload(knowledge_base_id, data_source_id, target, filename,
+                                         len(file_content), put_response, replaced)
+            
+        except Exception as e:
+            logger.error(f"Error uploading document: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
+            raise
+    
+    def upload_document_stream(self, knowledge_base_id, data_source_id, content, filename, content_type,
+                               on_duplicate=None, schedule_ingestion=True):
+        """
+        Upload a document from an upload_stream.Base64Content without decoding
+        it whole: above MULTIPART_THRESHOLD the chunks are regrouped into 5 MiB
+        parts, so at most multipart_max_workers + 1 parts are in memory.
+        The duplicate check decodes the content once more, chunk by chunk.
+        schedule_ingestion=False leaves cache invalidation and the ingestion
+        job to the caller (batch upload).
+        """
+        try:
+            logger.info(f"Uploading document {filename} to data source {data_source_id} (streaming)")
+            
+            size = content.decoded_size
+            if size > MAX_UPLOAD_SIZE:
+                raise ValueError(f"File too large: {size} bytes (max {MAX_UPLOAD_SIZE})")
+            
+            target = self._prepare_upload(knowledge_base_id, data_source_id, filename)
+            
+            on_duplicate = self._dedup_mode(on_duplicate)
+            content_sha256, duplicates = self._find_duplicates(
+                knowledge_base_id, data_source_id, content.chunks(), on_duplicate)
+            if duplicates and on_duplicate == 'skip':
+                return {**duplicates[0], 'duplicate': True, 'content_sha256': content_sha256}
+            if content_sha256:
+                target['metadata']['content_sha256'] = content_sha256
+            
+            if size > MULTIPART_THRESHOLD:
+                part_size = max(MIN_PART_SIZE, -(-size // MAX_PARTS))
+                put_response = self._multipart_upload(
+                    target, content_type, iter_parts(content.chunks(), part_size))
+            else:
+                put_response = self.s3_client.put_object(
+                    Bucket=target['bucket_name'],
+                    Key=target['key'],
+                    Body=content.decode(),
+                    ContentType=content_type,
+                    Metadata=target['metadata'],
+                    Tagging=target['tagging']
+                )
+            
+            replaced = self._remove_duplicates(knowledge_base_id, data_source_id, target['bucket_name'], duplicates)
+            return self._register_upload(knowledge_base_id, data_source_id, target, filename, size,
+                                         put_response, replaced, schedule_ingestion)
+            
+        except Exception as e:
+            logger.error(f"Error uploading document: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
+            raise
+    
+    def _register_upload(self, knowledge_base_id, data_source_id, target, filename, size, put_response,
+                         replaced=None, schedule_ingestion=True):
+        """Invalidate caches, index the new object and schedule ingestion; returns the document."""
+        s3_key = target['key']
+        
+        # Cached answers may no longer reflect the data source
+        if schedule_ingestion:
+            self._invalidate_caches(knowledge_base_id)
+        
+        uploaded_at = datetime.now(timezone.utc).isoformat()
+        document = {
+            'id': s3_key,
+            'name': filename,
+            'status': 'ACTIVE',
+            'createdAt': uploaded_at,
+            'updatedAt': uploaded_at,
+            'size': size,
+            'type': self.allowed_extensions[target['extension']],
+            'metadata': {
+                's3Key': s3_key,
+                's3Bucket': target['bucket_name'],
+                'etag': put_response.get('ETag', '').strip('"'),
+                'original_filename': filename
+            }
+        }
+        if 'content_sha256' in target['metadata']:
+            document['metadata']['content_sha256'] = target['metadata']['content_sha256']
+        self._update_catalog(lambda catalog: catalog.upsert_documents(knowledge_base_id, data_source_id, [document]))
+        
+        # Trigger Knowledge Base sync (optional - KB will sync automatically)
+        ingestion = self.request_ingestion(knowledge_base_id, data_source_id) if schedule_ingestion else None
+        
+        # Return document info
+        result = {**document, 'ingestion': ingestion}
+        if 'upload_metrics' in put_response:
+            result['upload_metrics'] = put_response['upload_metrics']
+        if replaced:
+            result['replaced'] = replaced
+        return result
+    
+    def _dedup_mode(self, on_duplicate):
+        """
+        Duplicate policy of an upload: on_duplicate, else DOCUMENT_DEDUP_MODE,
+        else 'skip' with the document catalog and 'off' without it. The check
+        needs the catalog's content hash index; S3 is never listed for it.
+        """
+        mode = on_duplicate or DEDUP_MODE or ('skip' if self.catalog is not None else 'off')
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"on_duplicate must be one of {list(DEDUP_MODES)}")
+        if mode != 'off' and self.catalog is None:
+            if on_duplicate:
+                raise ValueError(f"on_duplicate='{mode}' requires the document catalog (DOCUMENT_CATALOG_ENABLED)")
+            return 'off'
+        return mode
+    
+    def _find_duplicates(self, knowledge_base_id, data_source_id, chunks, on_duplicate):
+        """
+        Hash the content (SHA-256, streaming over chunks) and look it up in the
+        document catalog.
+        
+        Returns:
+            tuple: (SHA-256 hex or None when disabled, existing documents)
+        """
+        if on_duplicate == 'off':
+            return None, []
+        
+        sha256 = hashlib.sha256()
+        for chunk in chunks:
+            sha256.update(chunk)
+        content_sha256 = sha256.hexdigest()
+        return content_sha256, self._find_indexed_duplicates(knowledge_base_id, data_source_id, content_sha256)
+    
+    def _find_indexed_duplicates(self, knowledge_base_id, data_source_id, content_sha256):
+        """Documents of the data source whose content_sha256 is in the catalog and still in S3."""
+        try:
+            indexed = self.catalog.find_by_content_hash(knowledge_base_id, data_source_id, content_sha256)
+        except Exception as e:
+            logger.warning(f"Duplicate check against the document catalog failed: {str(e)}")
+            return []
+        
+        # The index may lag behind S3; only return copies that still exist
+        duplicates = []
+        for document in indexed:
+            try:
+                self.s3_client.head_object(Bucket=document['metadata']['s3Bucket'], Key=document['id'])
+                duplicates.append(document)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                    raise
+                self._update_catalog(lambda catalog: catalog.remove_documents(data_source_id, [document['id']]))
+        if duplicates:
+            logger.info(f"Content {content_sha256} already in data source {data_source_id}: {duplicates[0]['id']}")
+        return duplicates
+    
+    def _remove_duplicates(self, knowledge_base_id, data_source_id, bucket_name, duplicates):
+        """Delete the old copies replaced by an upload (on_duplicate='replace'); returns their keys."""
+        if not duplicates:
+            return []
+        keys = [document['id'] for document in duplicates]
+        deleted, errors = self._delete_keys(bucket_name, keys)
+        if errors:
+            logger.warning(f"Could not delete replaced duplicates: {errors}")
+        self._update_catalog(lambda catalog: catalog.remove_documents(data_source_id, deleted))
+        return deleted
+    
+    def _delete_keys(self, bucket_name, keys):
+        """delete_objects in batches of DELETE_BATCH_SIZE; returns (deleted keys, errors)."""
+        deleted, errors = [], []
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            response = self.s3_client.delete_objects(
                 Bucket=bucket_name,
-                Key=s3_key,
-                Body=file_content,
-                ContentType=content_type,
-                Metadata={
-                    'original_filename': sanitized_filename,  # Use sanitized version for metadata
-                    'uploaded_at': datetime.now().isoformat(),
-                    'data_source_id': data_source_id,
-                    'knowledge_base_id': knowledge_base_id
-                },
-                # Store original filename in S3 object tags (supports Unicode)
-                Tagging=f'original_name={filename.replace("=", "%3D").replace("&", "%26")}'
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + DELETE_BATCH_SIZE]]}
             )
+            deleted.extend(item['Key'] for item in response.get('Deleted', []))
+            errors.extend(response.get('Errors', []))
+        return deleted, errors
+    
+    def _split_parts(self, file_content):
+        """
+        Zero-copy parts of an in-memory file: memoryview slices sized so every
+        worker gets at least one part (never below the 5 MiB S3 minimum).
+        """
+        view = memoryview(file_content)
+        part_size = max(MIN_PART_SIZE, -(-len(view) // MAX_PARTS),
+                        min(MULTIPART_PART_SIZE, -(-len(view) // self.multipart_max_workers)))
+        return (view[offset:offset + part_size] for offset in range(0, len(view), part_size))
+    
+    def _multipart_upload(self, target, content_type, parts):
+        """
+        Upload an iterable of parts (bytes-like) with create/upload_part/complete.
+        Parts go to a bounded pool (at most one per worker in flight, so a
+        generator producing parts keeps memory bounded), each part is retried
+        on its own, and the upload is aborted if any part finally fails.
+        
+        Returns:
+            dict: ETag of the completed object and upload_metrics
+        """
+        bucket_name = target['bucket_name']
+        s3_key = target['key']
+        upload_id = self.s3_client.create_multipart_upload(
+            Bucket=bucket_name,
+            Key=s3_key,
+            ContentType=content_type,
+            Metadata=target['metadata'],
+            Tagging=target['tagging']
+        )['UploadId']
+        
+        start_time = time.perf_counter()
+        results = []
+        pool = ThreadPoolExecutor(max_workers=self.multipart_max_workers)
+        try:
+            in_flight = set()
+            for part_number, part in enumerate(parts, start=1):
+                if len(in_flight) >= self.multipart_max_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                in_flight.add(pool.submit(self._upload_part, bucket_name, s3_key, upload_id, part_number, part))
+            results.extend(future.result() for future in in_flight)
             
-            # Trigger Knowledge Base sync (optional - KB will sync automatically)
+            response = self.s3_client.complete_multipart_upload(
+                Bucket=bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': sorted((result['part'] for result in results),
+                                                 key=lambda part: part['PartNumber'])}
+            )
+        except Exception as e:
+            pool.shutdown(wait=True, cancel_futures=True)
+            logger.error(f"Multipart upload of {s3_key} failed, aborting: {str(e)}")
             try:
-                self.bedrock_agent_client.start_ingestion_job(
-                    knowledgeBaseId=knowledge_base_id,
-                    dataSourceId=data_source_id
+                self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=s3_key, UploadId=upload_id)
+            except Exception as abort_error:
+                logger.warning(f"Could not abort multipart upload {upload_id}: {str(abort_error)}")
+            raise
+        finally:
+            pool.shutdown(wait=False)
+        
+        seconds = time.perf_counter() - start_time
+        total_bytes = sum(result['bytes'] for result in results)
+        metrics = {
+            'parts': len(results),
+            'bytes': total_bytes,
+            'seconds': round(seconds, 3),
+            'throughput_mib_s': round(total_bytes / (1024 * 1024) / seconds, 2) if seconds else None,
+            'part_retries': sum(result['attempts'] - 1 for result in results),
+            'workers': self.multipart_max_workers
+        }
+        logger.info(f"Multipart upload of {s3_key} completed: {metrics}")
+        return {'ETag': response.get('ETag', ''), 'upload_metrics': metrics}
+    
+    def _upload_part(self, bucket_name, s3_key, upload_id, part_number, part):
+        """Upload one part, retrying with exponential backoff up to MULTIPART_PART_RETRIES times."""
+        view = memoryview(part)
+        for attempt in range(1, MULTIPART_PART_RETRIES + 2):
+            try:
+                response = self.s3_client.upload_part(
+                    Bucket=bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=_BufferReader(view),
+                    ContentLength=len(view)
                 )
-                logger.info(f"Started ingestion job for data source {data_source_id}")
+                return {
+                    'part': {'PartNumber': part_number, 'ETag': response['ETag']},
+                    'bytes': len(view),
+                    'attempts': attempt
+                }
             except Exception as e:
-                logger.warning(f"Could not start ingestion job: {str(e)}")
+                if attempt > MULTIPART_PART_RETRIES:
+                    raise
+                logger.warning(f"Part {part_number} of {s3_key} failed (attempt {attempt}): {str(e)}")
+                time.sleep(0.2 * 2 ** (attempt - 1))
+    
+    def create_upload_session(self, knowledge_base_id, data_source_id, filename, content_type, size=None,
+                              content_sha256=None):
+        """
+        Issue presigned URLs so the client uploads the file straight to S3, with
+        the same key, metadata and tagging as upload_document. Files larger than
+        UPLOAD_URL_MULTIPART_THRESHOLD get one presigned URL per multipart part.
+        The client must call complete_upload afterwards.
+        content_sha256 (hex) is signed as the ChecksumSHA256 of a single PUT:
+        S3 rejects a body with another hash and complete_upload reads the hash
+        back instead of downloading the object.
+        """
+        try:
+            logger.info(f"Creating upload session for {filename} in data source {data_source_id}")
             
-            # Return document info
-            return {
-                'id': s3_key,
+            if size is not None and not 0 < size <= MAX_UPLOAD_SIZE:
+                raise ValueError(f"size must be between 1 and {MAX_UPLOAD_SIZE} bytes")
+            if content_sha256 is not None:
+                content_sha256 = str(content_sha256).lower()
+                if not SHA256_HEX_RE.match(content_sha256):
+                    raise ValueError("content_sha256 must be a hex SHA-256 digest")
+            
+            target = self._prepare_upload(knowledge_base_id, data_source_id, filename)
+            bucket_name = target['bucket_name']
+            s3_key = target['key']
+            params = {
+                'Bucket': bucket_name,
+                'Key': s3_key,
+                'ContentType': content_type,
+                'Metadata': target['metadata'],
+                'Tagging': target['tagging']
+            }
+            session = {
+                'document_id': s3_key,
                 'name': filename,
-                'status': 'ACTIVE',
-                'createdAt': datetime.now().isoformat(),
-                'updatedAt': datetime.now().isoformat(),
-                'size': len(file_content),
-                'type': self.allowed_extensions[file_ext],
-                'metadata': {
-                    's3Key': s3_key,
-                    's3Bucket': bucket_name,
-                    'original_filename': filename
+                'expires_in': UPLOAD_URL_EXPIRES_SECONDS,
+                'knowledge_base_id': knowledge_base_id,
+                'data_source_id': data_source_id
+            }
+            
+            if size is None or size <= UPLOAD_URL_MULTIPART_THRESHOLD:
+                # Single PUT: the signed headers must be sent exactly as returned
+                headers = {
+                    'Content-Type': content_type,
+                    'x-amz-tagging': target['tagging'],
+                    **{f'x-amz-meta-{name}': value for name, value in target['metadata'].items()}
                 }
+                if content_sha256:
+                    checksum = base64.b64encode(bytes.fromhex(content_sha256)).decode('ascii')
+                    params['ChecksumSHA256'] = checksum
+                    headers['x-amz-checksum-sha256'] = checksum
+                session.update({
+                    'method': 'PUT',
+                    'url': self.s3_client.generate_presigned_url(
+                        'put_object', Params=params, ExpiresIn=UPLOAD_URL_EXPIRES_SECONDS),
+                    'headers': headers
+                })
+                return session
+            
+            # Metadata and tagging are fixed when the multipart upload is created
+            part_size = max(MULTIPART_PART_SIZE, MIN_PART_SIZE, -(-size // MAX_PARTS))
+            upload_id = self.s3_client.create_multipart_upload(**params)['UploadId']
+            session.update({
+                'method': 'MULTIPART',
+                'upload_id': upload_id,
+                'part_size': part_size,
+                'parts': [
+                    {
+                        'part_number': part_number,
+                        'url': self.s3_client.generate_presigned_url(
+                            'upload_part',
+                            Params={'Bucket': bucket_name, 'Key': s3_key,
+                                    'UploadId': upload_id, 'PartNumber': part_number},
+                            ExpiresIn=UPLOAD_URL_EXPIRES_SECONDS)
+                    }
+                    for part_number in range(1, -(-size // part_size) + 1)
+                ]
+            })
+            return session
+            
+        except Exception as e:
+            logger.error(f"Error creating upload session: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
+            raise
+    
+    def complete_upload(self, knowledge_base_id, data_source_id, document_id, upload_id=None, parts=None,
+                        on_duplicate=None):
+        """
+        Finish a presigned upload: complete the multipart upload if there is one,
+        check that the object exists and was issued for this data source, then
+        update the catalog and schedule ingestion like upload_document.
+        parts ([{part_number, etag}]) is optional; S3 is asked for them otherwise.
+        on_duplicate is applied here, since the content is only known once it
+        is in S3: 'skip' deletes the new object and returns the existing one.
+        """
+        try:
+            logger.info(f"Completing upload of {document_id} in data source {data_source_id}")
+            
+            config = self.get_data_source_config(knowledge_base_id, data_source_id)
+            bucket_name = config['bucket_name']
+            
+            if not bucket_name:
+                raise ValueError("No bucket name found in data source configuration")
+            
+            if upload_id:
+                if parts:
+                    completed_parts = [{'PartNumber': int(part['part_number']), 'ETag': part['etag']} for part in parts]
+                else:
+                    completed_parts = [
+                        {'PartNumber': part['PartNumber'], 'ETag': part['ETag']}
+                        for page in self.s3_client.get_paginator('list_parts').paginate(
+                            Bucket=bucket_name, Key=document_id, UploadId=upload_id)
+                        for part in page.get('Parts', [])
+                    ]
+                if not completed_parts:
+                    raise ValueError("No parts were uploaded")
+                self.s3_client.complete_multipart_upload(
+                    Bucket=bucket_name,
+                    Key=document_id,
+                    UploadId=upload_id,
+                    MultipartUpload={'Parts': sorted(completed_parts, key=lambda part: part['PartNumber'])}
+                )
+            
+            try:
+                head = self.s3_client.head_object(Bucket=bucket_name, Key=document_id, ChecksumMode='ENABLED')
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                    raise ValueError(f"Uploaded object {document_id} not found")
+                raise
+            
+            # Only objects uploaded through create_upload_session carry these signed metadata values
+            metadata = head.get('Metadata', {})
+            if (metadata.get('knowledge_base_id') != knowledge_base_id
+                    or metadata.get('data_source_id') != data_source_id):
+                raise ValueError(f"Object {document_id} was not uploaded for this data source")
+            
+            document = self._object_to_document({
+                'Key': document_id,
+                'Size': head['ContentLength'],
+                'ETag': head.get('ETag', ''),
+                'LastModified': head['LastModified']
+            }, bucket_name)
+            if document is None:
+                raise ValueError(f"File type {os.path.splitext(document_id)[1].lower()} not allowed")
+            if not 0 < document['size'] <= MAX_UPLOAD_SIZE:
+                self.s3_client.delete_object(Bucket=bucket_name, Key=document_id)
+                raise ValueError(f"Uploaded file must be between 1 and {MAX_UPLOAD_SIZE} bytes")
+            
+            on_duplicate = self._dedup_mode(on_duplicate)
+            duplicates = []
+            if on_duplicate != 'off':
+                content_sha256 = self._uploaded_content_sha256(bucket_name, document_id, head)
+                document['metadata']['content_sha256'] = content_sha256
+                # A repeated complete_upload finds the document itself in the catalog
+                duplicates = [
+                    duplicate for duplicate in self._find_indexed_duplicates(
+                        knowledge_base_id, data_source_id, content_sha256)
+                    if duplicate['id'] != document_id
+                ]
+                if duplicates and on_duplicate == 'skip':
+                    self.s3_client.delete_object(Bucket=bucket_name, Key=document_id)
+                    return {**duplicates[0], 'duplicate': True, 'content_sha256': content_sha256}
+            
+            # The tag keeps the Unicode name; the metadata only has the ASCII version
+            try:
+                tags = self.s3_client.get_object_tagging(Bucket=bucket_name, Key=document_id).get('TagSet', [])
+                original_name = next((tag['Value'] for tag in tags if tag['Key'] == 'original_name'), None)
+            except Exception as e:
+                logger.warning(f"Could not read tags of {document_id}: {str(e)}")
+                original_name = None
+            document['name'] = original_name or UPLOAD_TIMESTAMP_RE.sub('', document['name'])
+            document['metadata']['original_filename'] = document['name']
+            
+            # Cached answers may no longer reflect the data source
+            self._invalidate_caches(knowledge_base_id)
+            self._update_catalog(lambda catalog: catalog.upsert_documents(knowledge_base_id, data_source_id, [document]))
+            
+            replaced = self._remove_duplicates(knowledge_base_id, data_source_id, bucket_name, duplicates)
+            ingestion = self.request_ingestion(knowledge_base_id, data_source_id)
+            
+            result = {**document, 'ingestion': ingestion}
+            if replaced:
+                result['replaced'] = replaced
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error completing upload: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
+            raise
+    
+    def _uploaded_content_sha256(self, bucket_name, s3_key, head):
+        """
+        SHA-256 (hex) of an object uploaded with a presigned URL: the
+        full-object ChecksumSHA256 S3 verified on the PUT if the client sent
+        one, else the object is read back and hashed chunk by chunk.
+        """
+        checksum = head.get('ChecksumSHA256')
+        # Multipart checksums are composite ("...-N"), not the hash of the content
+        if checksum and '-' not in checksum and head.get('ChecksumType', 'FULL_OBJECT') == 'FULL_OBJECT':
+            return base64.b64decode(checksum).hex()
+        
+        sha256 = hashlib.sha256()
+        body = self.s3_client.get_object(Bucket=bucket_name, Key=s3_key)['Body']
+        for chunk in body.iter_chunks(chunk_size=HASH_READ_CHUNK_SIZE):
+            sha256.update(chunk)
+        return sha256.hexdigest()
+    
+    def abort_upload(self, knowledge_base_id, data_source_id, document_id, upload_id):
+        """Abort a presigned multipart upload so its parts stop being billed."""
+        try:
+            config = self.get_data_source_config(knowledge_base_id, data_source_id)
+            bucket_name = config['bucket_name']
+            
+            if not bucket_name:
+                raise ValueError("No bucket name found in data source configuration")
+            
+            self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=document_id, UploadId=upload_id)
+            logger.info(f"Aborted multipart upload of {document_id}")
+            
+            return {
+                'success': True,
+                'message': 'Upload aborted',
+                'document_id': document_id,
+                'knowledge_base_id': knowledge_base_id,
+                'data_source_id': data_source_id
             }
             
         except Exception as e:
-            logger.error(f"Error uploading document: {str(e)}")
+            logger.error(f"Error aborting upload: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
             raise
     
     def delete_document(self, knowledge_base_id, data_source_id, document_id):
@@ -274,17 +1238,12 @@ class DocumentManager:
                 Key=document_id  # document_id is the S3 key
             )
             
+            # Cached answers may no longer reflect the data source
+            self._invalidate_caches(knowledge_base_id)
+            self._update_catalog(lambda catalog: catalog.remove_documents(data_source_id, [document_id]))
+            
             # Trigger Knowledge Base sync
-            ingestion_job_id = None
-            try:
-                response = self.bedrock_agent_client.start_ingestion_job(
-                    knowledgeBaseId=knowledge_base_id,
-                    dataSourceId=data_source_id
-                )
-                ingestion_job_id = response.get('ingestionJob', {}).get('ingestionJobId')
-                logger.info(f"Started ingestion job {ingestion_job_id} for data source {data_source_id}")
-            except Exception as e:
-                logger.warning(f"Could not start ingestion job: {str(e)}")
+            ingestion = self.request_ingestion(knowledge_base_id, data_source_id)
             
             logger.info(f"Document {document_id} deleted successfully")
             
@@ -295,12 +1254,14 @@ class DocumentManager:
                 'document_id': document_id,
                 'knowledge_base_id': knowledge_base_id,
                 'data_source_id': data_source_id,
-                'ingestion_job_id': ingestion_job_id,
+                'ingestion_job_id': ingestion['ingestion_job_id'],
+                'ingestion': ingestion,
                 'deleted_at': datetime.now().isoformat()
             }
             
         except Exception as e:
             logger.error(f"Error deleting document: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
             raise
     
     def delete_documents_batch(self, knowledge_base_id, data_source_id, document_ids):
@@ -333,17 +1294,14 @@ class DocumentManager:
             if errors:
                 logger.error(f"Some documents could not be deleted: {errors}")
             
+            # Cached answers may no longer reflect the data source
+            if deleted_count:
+                self._invalidate_caches(knowledge_base_id)
+                deleted_keys = [deleted['Key'] for deleted in response.get('Deleted', [])]
+                self._update_catalog(lambda catalog: catalog.remove_documents(data_source_id, deleted_keys))
+            
             # Trigger Knowledge Base sync
-            ingestion_job_id = None
-            try:
-                sync_response = self.bedrock_agent_client.start_ingestion_job(
-                    knowledgeBaseId=knowledge_base_id,
-                    dataSourceId=data_source_id
-                )
-                ingestion_job_id = sync_response.get('ingestionJob', {}).get('ingestionJobId')
-                logger.info(f"Started ingestion job {ingestion_job_id} for data source {data_source_id}")
-            except Exception as e:
-                logger.warning(f"Could not start ingestion job: {str(e)}")
+            ingestion = self.request_ingestion(knowledge_base_id, data_source_id)
             
             logger.info(f"Batch delete completed: {deleted_count} documents deleted, {len(errors)} errors")
             
@@ -356,16 +1314,23 @@ class DocumentManager:
                 'errors': errors,
                 'knowledge_base_id': knowledge_base_id,
                 'data_source_id': data_source_id,
-                'ingestion_job_id': ingestion_job_id,
+                'ingestion_job_id': ingestion['ingestion_job_id'],
+                'ingestion': ingestion,
                 'deleted_at': datetime.now().isoformat()
             }
             
         except Exception as e:
             logger.error(f"Error deleting documents batch: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
             raise
     
-    def rename_document(self, knowledge_base_id, data_source_id, document_id, new_name):
-        """Rename a document by copying it with a new name and deleting the old one."""
+    def rename_document(self, knowledge_base_id, data_source_id, document_id, new_name, schedule_ingestion=True):
+        """
+        Rename a document by copying it with a new name and deleting the old one.
+        
+        schedule_ingestion=False leaves cache invalidation and the ingestion
+        job to the caller (batch rename).
+        """
         try:
             logger.info(f"Renaming document {document_id} to {new_name}")
             
@@ -398,7 +1363,7 @@ class DocumentManager:
             sanitized_new_name = self._sanitize_filename_for_metadata(new_name)
             logger.info(f"Renaming - Original: '{new_name}' -> Sanitized: '{sanitized_new_name}'")
             
-            self.s3_client.copy_object(
+            copy_response = self.s3_client.copy_object(
                 CopySource=copy_source,
                 Bucket=bucket_name,
                 Key=new_s3_key,
@@ -409,8 +1374,10 @@ class DocumentManager:
                     'data_source_id': data_source_id,
                     'knowledge_base_id': knowledge_base_id
                 },
-                # Store original filename in S3 object tags
-                Tagging=f'original_name={new_name.replace("=", "%3D").replace("&", "%26")}'
+                # Store original filename in S3 object tags (without REPLACE
+                # the copy keeps the tags of the old object)
+                TaggingDirective='REPLACE',
+                Tagging=self._original_name_tagging(new_name)
             )
             
             # Delete old object
@@ -419,17 +1386,25 @@ class DocumentManager:
                 Key=document_id
             )
             
+            # Cached answers may no longer reflect the data source
+            if schedule_ingestion:
+                self._invalidate_caches(knowledge_base_id)
+            
+            copy_result = copy_response.get('CopyObjectResult', {})
+            last_modified = copy_result.get('LastModified') or datetime.now(timezone.utc)
+            renamed = {
+                'id': new_s3_key,
+                'updatedAt': last_modified.isoformat(),
+                'type': self.allowed_extensions[file_ext],
+                'metadata': {
+                    's3Bucket': bucket_name,
+                    'etag': copy_result.get('ETag', '').strip('"')
+                }
+            }
+            self._update_catalog(lambda catalog: catalog.rename_document(knowledge_base_id, data_source_id, document_id, renamed))
+            
             # Trigger Knowledge Base sync
-            ingestion_job_id = None
-            try:
-                response = self.bedrock_agent_client.start_ingestion_job(
-                    knowledgeBaseId=knowledge_base_id,
-                    dataSourceId=data_source_id
-                )
-                ingestion_job_id = response.get('ingestionJob', {}).get('ingestionJobId')
-                logger.info(f"Started ingestion job {ingestion_job_id} for data source {data_source_id}")
-            except Exception as e:
-                logger.warning(f"Could not start ingestion job: {str(e)}")
+            ingestion = self.request_ingestion(knowledge_base_id, data_source_id) if schedule_ingestion else None
             
             logger.info(f"Document renamed successfully from {document_id} to {new_s3_key}")
             
@@ -441,10 +1416,210 @@ class DocumentManager:
                 'new_name': new_name,
                 'knowledge_base_id': knowledge_base_id,
                 'data_source_id': data_source_id,
-                'ingestion_job_id': ingestion_job_id,
+                'ingestion_job_id': ingestion['ingestion_job_id'] if ingestion else None,
+                'ingestion': ingestion,
                 'renamed_at': datetime.now().isoformat()
             }
             
         except Exception as e:
             logger.error(f"Error renaming document: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
+            raise
+    
+    def rename_documents_batch(self, knowledge_base_id, data_source_id, renames):
+        """
+        Rename several documents concurrently on a bounded pool.
+        
+        Args:
+            renames: list of {'document_id': ..., 'new_name': ...}
+        
+        Returns:
+            dict: per-item results in request order and a single ingestion job
+        """
+        # New keys are {prefix}{timestamp}_{name}: the same name twice in one
+        # batch would map two documents to one key
+        name_counts = {}
+        for item in renames:
+            name_counts[item.get('new_name')] = name_counts.get(item.get('new_name'), 0) + 1
+        
+        def rename(item):
+            if not item.get('document_id') or not item.get('new_name'):
+                raise ValueError("document_id and new_name are required")
+            if name_counts[item['new_name']] > 1:
+                raise ValueError(f"new_name {item['new_name']} is repeated in the batch")
+            return self.rename_document(knowledge_base_id, data_source_id, item['document_id'],
+                                        item['new_name'], schedule_ingestion=False)
+        
+        return self._run_batch(
+            knowledge_base_id, data_source_id, 'rename', renames, rename,
+            lambda item: {'document_id': item.get('document_id'), 'new_name': item.get('new_name')}
+        )
+    
+    def upload_documents_batch(self, knowledge_base_id, data_source_id, uploads):
+        """
+        Upload several documents concurrently on a bounded pool.
+        
+        Args:
+            uploads: list of {'filename', 'content' (upload_stream.Base64Content),
+                     'content_type', optional 'on_duplicate'}; an item with an
+                     'error' (e.g. invalid base64) is reported without uploading
+        
+        Returns:
+            dict: per-item results in request order and a single ingestion job
+        """
+        def upload(item):
+            if item.get('error'):
+                raise ValueError(item['error'])
+            if not item.get('filename') or item.get('content') is None:
+                raise ValueError("filename and file_content are required")
+            return self.upload_document_stream(
+                knowledge_base_id, data_source_id, item['content'], item['filename'],
+                item.get('content_type') or 'application/octet-stream',
+                on_duplicate=item.get('on_duplicate'), schedule_ingestion=False)
+        
+        return self._run_batch(
+            knowledge_base_id, data_source_id, 'upload', uploads, upload,
+            lambda item: {'filename': item.get('filename')}
+        )
+    
+    def _run_batch(self, knowledge_base_id, data_source_id, operation, items, run_item, describe_item):
+        """
+        Run run_item over the items on batch_max_workers threads, then invalidate
+        the caches and request one ingestion job if anything changed.
+        """
+        if not items:
+            raise ValueError(f"At least one item is required for batch {operation}")
+        if len(items) > BATCH_MAX_ITEMS:
+            raise ValueError(f"Batch {operation} accepts at most {BATCH_MAX_ITEMS} items")
+        
+        logger.info(f"Batch {operation} of {len(items)} documents in data source {data_source_id}")
+        
+        def run(item):
+            try:
+                return {**describe_item(item), 'success': True, 'result': run_item(item)}
+            except Exception as e:
+                return {**describe_item(item), 'success': False, 'error': str(e)}
+        
+        with ThreadPoolExecutor(max_workers=min(self.batch_max_workers, len(items))) as pool:
+            results = list(pool.map(run, items))
+        
+        succeeded = sum(1 for result in results if result['success'])
+        changed = any(result['success'] and not result['result'].get('duplicate') for result in results)
+        ingestion = None
+        if changed:
+            # Cached answers may no longer reflect the data source
+            self._invalidate_caches(knowledge_base_id)
+            ingestion = self.request_ingestion(knowledge_base_id, data_source_id)
+        
+        logger.info(f"Batch {operation} completed: {succeeded} succeeded, {len(results) - succeeded} failed")
+        
+        return {
+            'success': succeeded == len(results),
+            'message': f'Batch {operation} completed: {succeeded} of {len(results)} documents',
+            'succeeded_count': succeeded,
+            'failed_count': len(results) - succeeded,
+            'results': results,
+            'knowledge_base_id': knowledge_base_id,
+            'data_source_id': data_source_id,
+            'ingestion_job_id': ingestion['ingestion_job_id'] if ingestion else None,
+            'ingestion': ingestion,
+            'completed_at': datetime.now().isoformat()
+        }
+    
+    def duplicate_report(self, knowledge_base_id, data_source_id, sample_size=100):
+        """
+        Groups of documents with the same size and ETag (same content) from a
+        full S3 listing. The oldest copy of each group is the one to keep.
+        """
+        documents = self.list_documents(knowledge_base_id, data_source_id, raise_errors=True)
+        groups = self._duplicate_groups(documents)
+        return {
+            'documents': len(documents),
+            'duplicate_groups': len(groups),
+            'duplicate_documents': sum(len(group['duplicates']) for group in groups),
+            'reclaimable_bytes': sum(group['size'] * len(group['duplicates']) for group in groups),
+            'groups': groups[:sample_size],
+            'checked_at': datetime.now(timezone.utc).isoformat()
+        }
+    
+    def cleanup_duplicates(self, knowledge_base_id, data_source_id, dry_run=False):
+        """Delete every copy but the oldest of each duplicate group, with a single ingestion job."""
+        try:
+            documents = self.list_documents(knowledge_base_id, data_source_id, raise_errors=True)
+            groups = self._duplicate_groups(documents)
+            keys = [key for group in groups for key in group['duplicates']]
+            result = {
+                'dry_run': dry_run,
+                'duplicate_groups': len(groups),
+                'duplicate_documents': len(keys),
+                'reclaimable_bytes': sum(group['size'] * len(group['duplicates']) for group in groups)
+            }
+            if dry_run or not keys:
+                return {**result, 'deleted_count': 0, 'errors': [], 'ingestion_job_id': None}
+            
+            config = self.get_data_source_config(knowledge_base_id, data_source_id)
+            deleted, errors = self._delete_keys(config['bucket_name'], keys)
+            logger.info(f"Duplicate cleanup of data source {data_source_id}: {len(deleted)} deleted, {len(errors)} errors")
+            
+            if deleted:
+                self._invalidate_caches(knowledge_base_id)
+                self._update_catalog(lambda catalog: catalog.remove_documents(data_source_id, deleted))
+            ingestion = self.request_ingestion(knowledge_base_id, data_source_id)
+            
+            return {
+                **result,
+                'deleted_count': len(deleted),
+                'errors': errors,
+                'ingestion_job_id': ingestion['ingestion_job_id'],
+                'ingestion': ingestion
+            }
+            
+        except Exception as e:
+            logger.error(f"Error cleaning up duplicates: {str(e)}")
+            self._invalidate_config_on_error(e, knowledge_base_id, data_source_id)
             raise
+    
+    def _duplicate_groups(self, documents):
+        """Group documents by (size, ETag); largest reclaimable groups first."""
+        by_content = {}
+        for document in documents:
+            etag = document['metadata'].get('etag')
+            if etag:
+                by_content.setdefault((document['size'], etag), []).append(document)
+        
+        groups = []
+        for (size, etag), copies in by_content.items():
+            if len(copies) < 2:
+                continue
+            copies.sort(key=lambda document: (document['updatedAt'], document['id']))
+            groups.append({
+                'size': size,
+                'etag': etag,
+                'keep': copies[0]['id'],
+                'duplicates': [document['id'] for document in copies[1:]]
+            })
+        groups.sort(key=lambda group: group['size'] * len(group['duplicates']), reverse=True)
+        return groups
+    
+    def get_catalog_stats(self, knowledge_base_id, data_source_id):
+        """Document count and total size per extension, served from the catalog."""
+        if self.catalog is None:
+            raise ValueError("Document catalog is not enabled")
+        return self.catalog.get_stats(knowledge_base_id, data_source_id)
+    
+    def catalog_drift_report(self, knowledge_base_id, data_source_id):
+        """Compare the catalog with a full S3 listing without changing it."""
+        if self.catalog is None:
+            raise ValueError("Document catalog is not enabled")
+        s3_documents = self.list_documents(knowledge_base_id, data_source_id, raise_errors=True)
+        report = self.catalog.drift_report(knowledge_base_id, data_source_id, s3_documents)
+        logger.info(f"Catalog drift for data source {data_source_id}: missing={report['missing_count']}, "
+                    f"stale={report['stale_count']}, changed={report['changed_count']}")
+        return report
+    
+    def reconcile_catalog(self, knowledge_base_id, data_source_id):
+        """Rebuild the catalog entries of a data source from a full S3 listing."""
+        if self.catalog is None:
+            raise ValueError("Document catalog is not enabled")
+        s3_documents = self.list_documents(knowledge_base_id, data_source_id, raise_errors=True)
+        return self.catalog.reconcile(knowledge_base_id, data_source_id, s3_documents)
@@ -0,0 +1,121 @@
+"""
+Client Registry Module
+Process-wide cache of boto3 clients and database connection pools so that
+warm Lambda invocations reuse them instead of rebuilding them on every request
+"""
+
+import boto3
+import logging
+import threading
+from typing import Dict, Any, Callable, Tuple
+
+from db_pool import ConnectionPool
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class ClientRegistry:
+    """
+    Lazily creates and caches AWS clients and DB connection pools per container
+    """
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str], Any] = {}
+        self._pools: Dict[str, ConnectionPool] = {}
+        self._lock = threading.RLock()
+        self._stats = {
+            'client_hits': 0,
+            'client_misses': 0,
+            'pool_hits': 0,
+            'pool_misses': 0
+        }
+
+    def get_client(self, service_name: str, region_name: str = 'eu-west-1'):
+        """
+        Return a cached boto3 client, creating it on first use
+
+        Args:
+            service_name: boto3 service name (e.g. 'bedrock-runtime')
+            region_name: AWS region
+
+        Returns:
+            boto3 client
+        """
+        key = (service_name, region_name)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._stats['client_hits'] += 1
+                return client
+
+            self._stats['client_misses'] += 1
+            client = boto3.client(service_name, region_name=region_name)
+            self._clients[key] = client
+            logger.info(f"Created {service_name} client for region {region_name}")
+            return client
+
+    def get_pool(self, key: str, factory: Callable[[], Any], **pool_options) -> ConnectionPool:
+        """
+        Return the cached connection pool for a database, creating it on first use
+
+        Args:
+            key: Identifier of the pool (e.g. the secret name)
+            factory: Callable that opens a new connection
+            pool_options: ConnectionPool keyword arguments used on creation
+
+        Returns:
+            ConnectionPool
+        """
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._stats['pool_hits'] += 1
+                return pool
+
+            self._stats['pool_misses'] += 1
+            pool = ConnectionPool(factory, **pool_options)
+            self._pools[key] = pool
+            logger.info(f"Created database connection pool {key}")
+            return pool
+
+    def close_pool(self, key: str):
+        """Close and forget a cached pool"""
+        with self._lock:
+            pool = self._pools.pop(key, None)
+        if pool is not None:
+            pool.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the hit/miss counters and pool metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_clients'] = len(self._clients)
+            stats['pools'] = {key: pool.get_stats() for key, pool in self._pools.items()}
+            return stats
+
+    def reset(self):
+        """Drop every cached client and pool (mainly for tests)"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._clients.clear()
+            self._pools.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+        for pool in pools:
+            pool.close()
+
+
+# Shared registry for the whole container
+registry = ClientRegistry()
+
+
+def get_client(service_name: str, region_name: str = 'eu-west-1'):
+    """Shortcut for registry.get_client"""
+    return registry.get_client(service_name, region_name)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Shortcut for registry.get_stats"""
+    return registry.get_stats()
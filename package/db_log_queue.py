@@ -0,0 +1,371 @@
+"""
+Write-Behind Queue Module for RAG Query Logs
+Buffers log records in memory and writes them to the database in batches
+from a background thread, spilling to a local file when the database is
+unreachable and setting aside records it rejects
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, List, Optional
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_BLOCK = 'block'
+
+
+class _TransientWriteError(Exception):
+    """A write failed because the database is unavailable"""
+
+    def __init__(self, error: Exception, unwritten: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(str(error))
+        self.error = error
+        self.unwritten = unwritten
+
+
+class WriteBehindQueue:
+    """
+    Bounded FIFO of log records flushed in batches by a daemon thread
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]]], None],
+                 max_size: int = 1000, batch_size: int = 50,
+                 flush_interval: float = 0.5, policy: str = POLICY_DROP_OLDEST,
+                 block_timeout: float = 0.05,
+                 spill_path: str = '/tmp/db_log_spill.jsonl',
+                 retry_interval: float = 5.0,
+                 dead_letter_path: str = '/tmp/db_log_dead_letter.jsonl',
+                 is_transient_error: Optional[Callable[[Exception], bool]] = None,
+                 max_replay_attempts: int = 5):
+        """
+        Args:
+            write_batch: Callable that writes a list of records in one transaction
+            max_size: Maximum number of records waiting in memory
+            batch_size: Maximum number of records written per transaction
+            flush_interval: Seconds the worker waits for more records before writing
+            policy: 'drop_oldest' or 'block' when the queue is full
+            block_timeout: Seconds put() blocks under the 'block' policy before
+                spilling the record to the local file
+            spill_path: JSONL file used while the database is unreachable
+            retry_interval: Seconds to wait before retrying after a write failure
+            dead_letter_path: JSONL file for records the database rejects
+            is_transient_error: Whether a write error means the database is
+                unavailable (spill and retry) rather than a bad record
+                (dead-letter it). By default every error is transient.
+            max_replay_attempts: Failed replays of the oldest spilled record
+                after which it goes to the dead-letter file, so one record
+                cannot hold back the rest of the spill file
+        """
+        if policy not in (POLICY_DROP_OLDEST, POLICY_BLOCK):
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+
+        self.write_batch = write_batch
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path
+        self.retry_interval = retry_interval
+        self.dead_letter_path = dead_letter_path
+        self.is_transient_error = is_transient_error or (lambda error: True)
+        self.max_replay_attempts = max_replay_attempts
+
+        self._records = deque()
+        self._in_flight = 0
+        self._retry_after = 0.0
+        self._condition = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._stopped = False
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'dead_lettered': 0,
+            'write_failures': 0
+        }
+
+        self._worker = threading.Thread(target=self._run, name='db-log-writer', daemon=True)
+        self._worker.start()
+
+    def put(self, record: Dict[str, Any]):
+        """Enqueue a record, applying the backpressure policy when full"""
+        spill = False
+        with self._condition:
+            if len(self._records) >= self.max_size and self.policy == POLICY_BLOCK:
+                deadline = time.time() + self.block_timeout
+                while len(self._records) >= self.max_size and not self._stopped:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+            if len(self._records) >= self.max_size:
+                if self.policy == POLICY_DROP_OLDEST:
+                    self._records.popleft()
+                    self._stats['dropped'] += 1
+                    logger.warning("Log queue full, dropped oldest record")
+                else:
+                    spill = True
+
+            if not spill:
+                self._records.append(record)
+                self._stats['enqueued'] += 1
+                self._condition.notify_all()
+
+        if spill:
+            logger.warning("Log queue full, spilling record to local file")
+            self._spill([record])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued record has been written (or spilled)
+
+        Returns:
+            True if the queue drained before the timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            self._condition.notify_all()
+            while self._records or self._in_flight:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def stop(self, timeout: Optional[float] = None):
+        """Flush pending records and stop the worker thread"""
+        self.flush(timeout)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return a snapshot of the queue counters"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._records)
+            return stats
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._records and not self._stopped:
+                    self._condition.wait(self.flush_interval)
+                if self._stopped and not self._records:
+                    return
+                # Give concurrent producers a moment to fill the batch
+                if len(self._records) < self.batch_size and not self._stopped:
+                    self._condition.wait(self.flush_interval)
+                batch = [self._records.popleft()
+                         for _ in range(min(self.batch_size, len(self._records)))]
+                self._in_flight = len(batch)
+                # Wake producers blocked on a full queue
+                self._condition.notify_all()
+
+            try:
+                self._write(batch)
+            finally:
+                with self._condition:
+                    self._in_flight = 0
+                    self._condition.notify_all()
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+
+        # While the database is known to be down, skip straight to the spill file
+        if time.time() < self._retry_after:
+            self._spill(batch)
+            return
+
+        try:
+            self._replay_spill()
+            self._write_records(batch)
+        except _TransientWriteError as e:
+            # The spill replay failed before the batch was tried, or the batch
+            # failed part way: keep whatever of it was not written
+            self._write_failed(e.error, batch if e.unwritten is None else e.unwritten)
+        except Exception as e:
+            self._write_failed(e, batch)
+
+    def _write_failed(self, error: Exception, unwritten: List[Dict[str, Any]]):
+        """Spill records after a transient failure and back off for retry_interval"""
+        logger.error(f"Write-behind log flush failed, spilling {len(unwritten)} records: {str(error)}")
+        self._retry_after = time.time() + self.retry_interval
+        with self._condition:
+            self._stats['write_failures'] += 1
+        self._spill(unwritten)
+
+    def _write_records(self, records: List[Dict[str, Any]]):
+        """
+        Write records in one transaction. If the batch fails with a
+        permanent error, write them one by one so only the records that
+        cannot be written go to the dead-letter file.
+
+        Raises:
+            _TransientWriteError: The database is unavailable; 'unwritten'
+                holds the records that were not written
+        """
+        try:
+            self.write_batch(records)
+        except Exception as e:
+            if self.is_transient_error(e):
+                raise _TransientWriteError(e, records)
+            if len(records) == 1:
+                self._dead_letter(records[0], e)
+                return
+            logger.warning(f"Log batch of {len(records)} records rejected, writing them one by one: {str(e)}")
+            for index, record in enumerate(records):
+                try:
+                    self.write_batch([record])
+                except Exception as record_error:
+                    if self.is_transient_error(record_error):
+                        raise _TransientWriteError(record_error, records[index:])
+                    self._dead_letter(record, record_error)
+                    continue
+                with self._condition:
+                    self._stats['written'] += 1
+            return
+        with self._condition:
+            self._stats['written'] += len(records)
+            self._stats['batches'] += 1
+
+    def _dead_letter(self, record: Dict[str, Any], error: Exception, attempts: Optional[int] = None):
+        """Set aside a record the database rejected, so it is not retried"""
+        logger.error(f"Log record rejected by the database, moving it to {self.dead_letter_path}: {str(error)}")
+        entry = {
+            'record': record,
+            'error': str(error),
+            'failed_at': datetime.now(timezone.utc).isoformat()
+        }
+        if attempts is not None:
+            entry['replay_attempts'] = attempts
+        try:
+            with self._spill_lock:
+                with open(self.dead_letter_path, 'a', encoding='utf-8') as dead_letter_file:
+                    dead_letter_file.write(json.dumps(entry, default=str) + '\n')
+        except Exception as e:
+            logger.error(f"Could not write dead-letter log record: {str(e)}")
+        with self._condition:
+            self._stats['dead_lettered'] += 1
+
+    def _spill(self, records: List[Dict[str, Any]]):
+        """Append records to the local spill file"""
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, 'a', encoding='utf-8') as spill_file:
+                    for record in records:
+                        spill_file.write(json.dumps(record, default=str) + '\n')
+            with self._condition:
+                self._stats['spilled'] += len(records)
+        except Exception as e:
+            logger.error(f"Could not spill {len(records)} log records: {str(e)}")
+            with self._condition:
+                self._stats['dropped'] += len(records)
+
+    def _replay_spill(self):
+        """
+        Write spilled records back to the database, oldest first
+
+        The spill file is renamed to a replay file under the lock, so put()
+        keeps spilling to a new file while the replay talks to the database.
+        Progress is kept as a byte offset in a side file, written after each
+        batch, so a failure resumes where it stopped without rewriting the
+        records that are left. The side file also counts the failed replays
+        of the record at that offset; after max_replay_attempts it is moved
+        to the dead-letter file and the replay goes on with the next one.
+
+        Raises:
+            _TransientWriteError: The database is unavailable
+        """
+        replay_path = self.spill_path + '.replay'
+        offset_path = replay_path + '.offset'
+        # Records spilled while replaying are replayed too, in a later round
+        while True:
+            with self._spill_lock:
+                if not os.path.exists(replay_path):
+                    if not os.path.exists(self.spill_path):
+                        return
+                    os.replace(self.spill_path, replay_path)
+            self._replay_file(replay_path, offset_path)
+
+    def _replay_file(self, replay_path: str, offset_path: str):
+        """Write the records of a renamed spill file from its saved offset, then remove it"""
+        offset, attempts = self._load_replay_offset(offset_path)
+
+        replayed = 0
+        try:
+            # Binary mode: tell() is a byte offset even while iterating lines
+            with open(replay_path, 'rb') as replay_file:
+                replay_file.seek(offset)
+                while True:
+                    records = []
+                    # Byte offset at the start of each record, and after the last
+                    offsets = [replay_file.tell()]
+                    for line in replay_file:
+                        if not line.strip():
+                            offsets[-1] = replay_file.tell()
+                            continue
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError as e:
+                            self._dead_letter({'raw': line.decode('utf-8', 'replace')}, e)
+                            offsets[-1] = replay_file.tell()
+                            continue
+                        offsets.append(replay_file.tell())
+                        if len(records) >= self.batch_size:
+                            break
+                    if not records:
+                        break
+                    try:
+                        self._write_records(records)
+                    except _TransientWriteError as e:
+                        written = len(records) - len(e.unwritten)
+                        replayed += written
+                        # Count the failure against the record the replay stopped at
+                        attempts = 1 if written else attempts + 1
+                        if attempts >= self.max_replay_attempts:
+                            self._dead_letter(records[written], e.error, attempts)
+                            written, attempts = written + 1, 0
+                        self._save_replay_offset(offset_path, offsets[written], attempts)
+                        # The batch being written is not a spill record
+                        raise _TransientWriteError(e.error)
+                    replayed += len(records)
+                    attempts = 0
+                    self._save_replay_offset(offset_path, offsets[-1])
+        finally:
+            with self._condition:
+                self._stats['replayed'] += replayed
+
+        os.remove(replay_path)
+        if os.path.exists(offset_path):
+            os.remove(offset_path)
+        logger.info(f"Replayed {replayed} spilled log records")
+
+    def _load_replay_offset(self, offset_path: str):
+        """(byte offset, failed replays of the record there) saved for a replay file"""
+        if not os.path.exists(offset_path):
+            return 0, 0
+        with open(offset_path, 'r', encoding='utf-8') as offset_file:
+            fields = offset_file.read().split()
+        offset = int(fields[0]) if fields else 0
+        attempts = int(fields[1]) if len(fields) > 1 else 0
+        return offset, attempts
+
+    def _save_replay_offset(self, offset_path: str, offset: int, attempts: int = 0):
+        with open(offset_path, 'w', encoding='utf-8') as offset_file:
+            offset_file.write(f"{offset} {attempts}")
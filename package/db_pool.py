@@ -0,0 +1,286 @@
+"""
+Database Connection Pool Module
+Small thread-safe pool of pymysql connections shared by every DatabaseLogger
+in the container (chat handler, write-behind writer and reporting code)
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available before the acquire timeout"""
+
+
+class _PoolEntry:
+    """Bookkeeping for one pooled connection"""
+
+    __slots__ = ('connection', 'created_at', 'last_used')
+
+    def __init__(self, connection):
+        now = time.monotonic()
+        self.connection = connection
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    Pool of DB connections with min/max size, idle timeout, max lifetime
+    and ping-based validation on checkout
+    """
+
+    def __init__(self, factory: Callable[[], Any], min_size: int = 1, max_size: int = 4,
+                 idle_timeout: float = 300.0, max_lifetime: float = 1800.0,
+                 validation_interval: float = 5.0, acquire_timeout: float = 5.0):
+        """
+        Args:
+            factory: Callable that opens a new connection
+            min_size: Connections kept open even when idle
+            max_size: Maximum number of open connections
+            idle_timeout: Seconds an idle connection (above min_size) is kept
+            max_lifetime: Seconds after which a connection is recycled, so
+                RDS failovers and DNS changes are picked up
+            validation_interval: Connections idle for longer than this are
+                pinged (with reconnect) before being handed out
+            acquire_timeout: Default seconds to wait for a free connection
+        """
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.validation_interval = validation_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()
+        self._in_use: Dict[int, _PoolEntry] = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'closed': 0,
+            'validations': 0,
+            'validation_failures': 0,
+            'reconnects': 0,
+            'recycled': 0,
+            'idle_evictions': 0,
+            'timeouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0
+        }
+
+        for _ in range(min_size):
+            try:
+                self._idle.append(self._create())
+            except Exception as e:
+                logger.warning(f"Could not pre-open pooled connection: {str(e)}")
+                break
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Check out a validated connection
+
+        Args:
+            timeout: Seconds to wait for a free connection (defaults to acquire_timeout)
+
+        Returns:
+            Open connection object
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        entry = None
+        create = False
+        to_close = []
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                to_close.extend(self._evict_expired_locked(time.monotonic()))
+                if self._idle:
+                    # LIFO: the most recently used connection is the warmest
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"No database connection available after {timeout}s")
+                self._condition.wait(remaining)
+
+        for stale in to_close:
+            self._close_entry(stale)
+
+        if create:
+            try:
+                entry = self._create(reserved=True)
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+        else:
+            entry = self._validate(entry)
+
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._condition:
+            self._in_use[id(entry.connection)] = entry
+            self._stats['checkouts'] += 1
+            self._stats['total_wait_ms'] += wait_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+        return entry.connection
+
+    def release(self, connection, broken: bool = False):
+        """
+        Return a connection to the pool
+
+        Args:
+            connection: Connection obtained from acquire()
+            broken: Close the connection instead of reusing it
+        """
+        with self._condition:
+            entry = self._in_use.pop(id(connection), None)
+            if entry is None:
+                logger.warning("Released a connection that does not belong to the pool")
+                return
+
+            now = time.monotonic()
+            expired = now - entry.created_at > self.max_lifetime
+            if broken or expired or self._closed or not connection.open:
+                self._size -= 1
+                if expired:
+                    self._stats['recycled'] += 1
+                self._condition.notify()
+            else:
+                entry.last_used = now
+                self._idle.append(entry)
+                self._condition.notify()
+                return
+
+        self._close_entry(entry)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Context manager that acquires a connection and always releases it"""
+        connection = self.acquire(timeout)
+        broken = False
+        try:
+            yield connection
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(connection, broken=broken)
+
+    def close(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for entry in idle:
+            self._close_entry(entry)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the pool counters, including wait times"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = len(self._in_use)
+            stats['avg_wait_ms'] = round(stats['total_wait_ms'] / stats['checkouts'], 3) if stats['checkouts'] else 0.0
+            stats['total_wait_ms'] = round(stats['total_wait_ms'], 3)
+            stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+            return stats
+
+    def _create(self, reserved: bool = False) -> _PoolEntry:
+        """Open a new connection (reserved=True when _size was already bumped)"""
+        connection = self.factory()
+        with self._condition:
+            if not reserved:
+                self._size += 1
+            self._stats['created'] += 1
+        return _PoolEntry(connection)
+
+    def _validate(self, entry: _PoolEntry) -> _PoolEntry:
+        """Ping connections that have been idle for a while, reconnecting if needed"""
+        now = time.monotonic()
+        if now - entry.last_used <= self.validation_interval:
+            return entry
+
+        connection = entry.connection
+        thread_id = getattr(connection, 'server_thread_id', None)
+        try:
+            with self._condition:
+                self._stats['validations'] += 1
+            connection.ping(reconnect=True)
+        except Exception as e:
+            logger.warning(f"Pooled connection failed validation, opening a new one: {str(e)}")
+            with self._condition:
+                self._stats['validation_failures'] += 1
+            self._close_entry(entry, count=False)
+            try:
+                fresh = self.factory()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._stats['created'] += 1
+            return _PoolEntry(fresh)
+
+        if getattr(connection, 'server_thread_id', None) != thread_id:
+            # ping() reopened the socket: this is effectively a new connection
+            with self._condition:
+                self._stats['reconnects'] += 1
+            entry.created_at = time.monotonic()
+        return entry
+
+    def _evict_expired_locked(self, now: float):
+        """Remove idle connections past idle_timeout (above min_size) or max_lifetime"""
+        evicted = []
+        kept = deque()
+        while self._idle:
+            entry = self._idle.popleft()
+            too_old = now - entry.created_at > self.max_lifetime
+            too_idle = (now - entry.last_used > self.idle_timeout
+                        and self._size - len(evicted) > self.min_size)
+            if too_old or too_idle:
+                evicted.append(entry)
+                self._stats['recycled' if too_old else 'idle_evictions'] += 1
+            else:
+                kept.append(entry)
+        self._idle = kept
+        self._size -= len(evicted)
+        return evicted
+
+    def _close_entry(self, entry: _PoolEntry, count: bool = True):
+        try:
+            if entry.connection.open:
+                entry.connection.close()
+        except Exception:
+            pass
+        if count:
+            with self._condition:
+                self._stats['closed'] += 1
@@ -0,0 +1,543 @@
+"""
+Ingestion Scheduler Module
+Coalesces Knowledge Base sync requests per (knowledge_base_id, data_source_id).
+A mutation starts an ingestion job only when none is running; mutations that
+arrive while a job is starting or running (or within the debounce window)
+queue at most one follow-up job, which is started once the running job ends.
+With INGESTION_SCHEDULE_TARGET_ARN and INGESTION_SCHEDULE_ROLE_ARN set, queued
+follow-ups and started jobs are also handed to one-time EventBridge Scheduler
+schedules that invoke the Lambda again, so they do not depend on a later
+request reaching the same container.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from client_registry import get_client
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ACTIVE_JOB_STATUSES = ['STARTING', 'IN_PROGRESS']
+FINISHED_JOB_STATUSES = ['COMPLETE', 'FAILED', 'STOPPED']
+
+# 'action' of the events the schedules send to the Lambda
+SCHEDULED_ACTION = 'run_scheduled_ingestion'
+SCHEDULE_FOLLOW_UP = 'follow-up'
+SCHEDULE_WATCH = 'watch'
+
+
+class _SyncState:
+    """Scheduler bookkeeping for one data source"""
+
+    __slots__ = ('job_id', 'started_at', 'follow_up_pending', 'requests', 'last_requested_at',
+                 'finished_job_id', 'checked_at', 'follow_up_scheduled')
+
+    def __init__(self):
+        self.job_id = None
+        self.started_at = 0.0
+        self.follow_up_pending = False
+        self.requests = 0
+        self.last_requested_at = None
+        # Last job whose end was reported to the finished-job listeners
+        self.finished_job_id = None
+        self.checked_at = 0.0
+        # The pending follow-up was handed to an EventBridge schedule
+        self.follow_up_scheduled = False
+
+
+class IngestionScheduler:
+    """
+    Per-container coalescing of start_ingestion_job calls
+    """
+
+    def __init__(self, debounce_seconds: float = 30.0,
+                 schedule_target_arn: Optional[str] = None,
+                 schedule_role_arn: Optional[str] = None,
+                 schedule_group: str = 'default',
+                 schedule_interval_seconds: float = 60.0,
+                 region: str = 'eu-west-1'):
+        """
+        Args:
+            debounce_seconds: Mutations within this many seconds of the last
+                started job are folded into a single follow-up job
+            schedule_target_arn: ARN of the Lambda the EventBridge schedules
+                invoke (without it follow-ups are only kept in memory)
+            schedule_role_arn: Role EventBridge Scheduler assumes to invoke it
+            schedule_group: Schedule group of the schedules
+            schedule_interval_seconds: Delay of each scheduled run
+            region: AWS region of EventBridge Scheduler
+        """
+        self.debounce_seconds = debounce_seconds
+        self.schedule_target_arn = schedule_target_arn
+        self.schedule_role_arn = schedule_role_arn
+        self.schedule_group = schedule_group
+        self.schedule_interval_seconds = schedule_interval_seconds
+        self.region = region
+        self._states: Dict[Tuple[str, str], _SyncState] = {}
+        self._lock = threading.Lock()
+        self._job_finished_listeners: List[Callable[[str, str, str], None]] = []
+        self._stats = {
+            'requests': 0,
+            'started': 0,
+            'follow_ups_started': 0,
+            'coalesced': 0,
+            'queued': 0,
+            'conflicts': 0,
+            'errors': 0,
+            'jobs_finished': 0,
+            'schedules_put': 0,
+            'schedule_errors': 0
+        }
+
+    def add_job_finished_listener(self, listener: Callable[[str, str, str], None]):
+        """
+        Call listener(knowledge_base_id, data_source_id, ingestion_job_id) once
+        when a job started or seen by this scheduler is found to have ended
+        """
+        self._job_finished_listeners.append(listener)
+
+    def request_sync(self, client, knowledge_base_id: str, data_source_id: str) -> Dict[str, Any]:
+        """
+        Ask for the data source to be synced after a mutation
+
+        Args:
+            client: bedrock-agent client
+            knowledge_base_id: Knowledge Base ID
+            data_source_id: Data source ID
+
+        Returns:
+            dict: status ('started', 'queued', 'coalesced' or 'failed'),
+                  ingestion_job_id of the job clients should poll, and
+                  follow_up_pending
+        """
+        with self._lock:
+            state = self._state(knowledge_base_id, data_source_id)
+            state.requests += 1
+            state.last_requested_at = datetime.now(timezone.utc).isoformat()
+            self._stats['requests'] += 1
+
+            coalesced = state.job_id and time.time() - state.started_at < self.debounce_seconds
+            if coalesced:
+                # The job we just started may not include this change
+                state.follow_up_pending = True
+                self._stats['coalesced'] += 1
+
+        if coalesced:
+            self._schedule_follow_up(knowledge_base_id, data_source_id)
+            with self._lock:
+                return self._result('coalesced', state)
+
+        return self._start_unless_running(client, knowledge_base_id, data_source_id, follow_up=False)
+
+    def run_pending(self, client, knowledge_base_id: Optional[str] = None,
+                    data_source_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Start queued follow-up jobs whose debounce window has passed and whose
+        data source has no job running, and check whether tracked jobs have
+        ended (at most once per debounce window each). Limited to one data
+        source if given. Follow-ups handed to a schedule are left to it.
+
+        Returns:
+            Results of the follow-ups that were attempted
+        """
+        now = time.time()
+        with self._lock:
+            selected = [
+                (key, state) for key, state in self._states.items()
+                if knowledge_base_id is None or key == (knowledge_base_id, data_source_id)
+            ]
+            due = [
+                key for key, state in selected
+                if state.follow_up_pending and not state.follow_up_scheduled
+                and now - state.started_at >= self.debounce_seconds
+            ]
+            # Jobs not known to have ended, checked at most once per debounce window
+            unchecked = [
+                key for key, state in selected
+                if key not in due and state.job_id and state.job_id != state.finished_job_id
+                and now - state.checked_at >= self.debounce_seconds
+            ]
+
+        for kb_id, ds_id in unchecked:
+            self.check_job(client, kb_id, ds_id)
+        return [self._start_unless_running(client, kb_id, ds_id, follow_up=True) for kb_id, ds_id in due]
+
+    def check_job(self, client, knowledge_base_id: str, data_source_id: str,
+                  ingestion_job_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fetch an ingestion job (by default the last one this scheduler
+        tracked for the data source) and notify the finished-job listeners
+        if it has ended
+
+        Returns:
+            The job, or None if there is none to check or the lookup failed
+        """
+        with self._lock:
+            state = self._state(knowledge_base_id, data_source_id)
+            job_id = ingestion_job_id or state.job_id
+            state.checked_at = time.time()
+        if not job_id:
+            return None
+        try:
+            job = client.get_ingestion_job(
+                knowledgeBaseId=knowledge_base_id,
+                dataSourceId=data_source_id,
+                ingestionJobId=job_id
+            ).get('ingestionJob', {})
+        except Exception as e:
+            logger.warning(f"Could not get ingestion job {job_id} of data source {data_source_id}: {str(e)}")
+            return None
+        if job.get('status') in FINISHED_JOB_STATUSES:
+            self._job_finished(knowledge_base_id, data_source_id, job_id)
+        return job
+
+    def run_scheduled(self, client, knowledge_base_id: str, data_source_id: str,
+                      ingestion_job_id: Optional[str] = None, follow_up: bool = False) -> Dict[str, Any]:
+        """
+        Run of a one-time schedule: check the watched job, start the queued
+        follow-up if there is one, and schedule another run while there is
+        still something to wait for
+
+        Args:
+            client: bedrock-agent client
+            knowledge_base_id: Knowledge Base ID
+            data_source_id: Data source ID
+            ingestion_job_id: Job to check for completion
+            follow_up: Whether a follow-up job is queued
+
+        Returns:
+            dict: job checked and result of the follow-up, if any
+        """
+        job = None
+        if ingestion_job_id:
+            job = self.check_job(client, knowledge_base_id, data_source_id, ingestion_job_id)
+
+        result = None
+        if follow_up:
+            with self._lock:
+                state = self._state(knowledge_base_id, data_source_id)
+                # This run consumes the schedule that queued the follow-up
+                state.follow_up_pending = True
+                state.follow_up_scheduled = False
+            # A job still running queues and schedules the follow-up again,
+            # and a started job is watched
+            result = self._start_unless_running(client, knowledge_base_id, data_source_id, follow_up=True)
+            if result['status'] == 'failed':
+                self._schedule_follow_up(knowledge_base_id, data_source_id)
+        elif job is not None and job.get('status') not in FINISHED_JOB_STATUSES:
+            # Still running: look again later
+            self._put_schedule(knowledge_base_id, data_source_id, SCHEDULE_WATCH, ingestion_job_id)
+
+        return {
+            'job': _job_summary(job) if job else None,
+            'follow_up': result
+        }
+
+    def get_status(self, client, knowledge_base_id: str, data_source_id: str) -> Dict[str, Any]:
+        """
+        Status of the latest ingestion job of a data source (starting any due
+        follow-up first), for clients polling a single job
+
+        Returns:
+            dict: job (id, status, statistics, times), follow_up_pending and
+                  the number of sync requests seen by this container
+        """
+        self.run_pending(client, knowledge_base_id, data_source_id)
+
+        with self._lock:
+            state = self._state(knowledge_base_id, data_source_id)
+            follow_up_scheduled = state.follow_up_scheduled
+        if follow_up_scheduled and not self._schedule_pending(knowledge_base_id, data_source_id, SCHEDULE_FOLLOW_UP):
+            # The schedule ran in another invocation, which started or
+            # rescheduled the follow-up: report the latest job instead
+            with self._lock:
+                state.follow_up_scheduled = False
+                state.follow_up_pending = False
+                state.job_id = None
+
+        with self._lock:
+            job_id = state.job_id
+
+        if job_id:
+            job = client.get_ingestion_job(
+                knowledgeBaseId=knowledge_base_id,
+                dataSourceId=data_source_id,
+                ingestionJobId=job_id
+            ).get('ingestionJob', {})
+            if job.get('status') in FINISHED_JOB_STATUSES:
+                self._job_finished(knowledge_base_id, data_source_id, job_id)
+        else:
+            jobs = self._list_jobs(client, knowledge_base_id, data_source_id, statuses=None)
+            job = jobs[0] if jobs else None
+
+        with self._lock:
+            return {
+                'job': _job_summary(job) if job else None,
+                'follow_up_pending': state.follow_up_pending,
+                'requests': state.requests,
+                'last_requested_at': state.last_requested_at
+            }
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return a snapshot of the scheduler counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending_follow_ups'] = sum(1 for state in self._states.values() if state.follow_up_pending)
+            return stats
+
+    def _start_unless_running(self, client, knowledge_base_id: str, data_source_id: str,
+                              follow_up: bool) -> Dict[str, Any]:
+        try:
+            running = self._list_jobs(client, knowledge_base_id, data_source_id, statuses=ACTIVE_JOB_STATUSES)
+        except Exception as e:
+            # Without the check, fall back to trying the start directly
+            logger.warning(f"Could not list ingestion jobs for data source {data_source_id}: {str(e)}")
+            running = None
+
+        with self._lock:
+            state = self._state(knowledge_base_id, data_source_id)
+            tracked_job_id = state.job_id
+        if (running is not None and tracked_job_id
+                and tracked_job_id not in [job.get('ingestionJobId') for job in running]):
+            # The job this scheduler last tracked is no longer active
+            self._job_finished(knowledge_base_id, data_source_id, tracked_job_id)
+
+        with self._lock:
+            if running:
+                state.job_id = running[0].get('ingestionJobId')
+                state.follow_up_pending = True
+                self._stats['queued'] += 1
+                logger.info(f"Ingestion job {state.job_id} running for data source {data_source_id}, follow-up queued")
+        if running:
+            return self._queued(knowledge_base_id, data_source_id, state)
+
+        try:
+            response = client.start_ingestion_job(
+                knowledgeBaseId=knowledge_base_id,
+                dataSourceId=data_source_id
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConflictException':
+                with self._lock:
+                    state.follow_up_pending = True
+                    self._stats['conflicts'] += 1
+                    self._stats['queued'] += 1
+                return self._queued(knowledge_base_id, data_source_id, state)
+            return self._failed(state, data_source_id, e)
+        except Exception as e:
+            return self._failed(state, data_source_id, e)
+
+        with self._lock:
+            state.job_id = response.get('ingestionJob', {}).get('ingestionJobId')
+            state.started_at = time.time()
+            state.follow_up_pending = False
+            follow_up_scheduled = state.follow_up_scheduled
+            state.follow_up_scheduled = False
+            self._stats['follow_ups_started' if follow_up else 'started'] += 1
+            logger.info(f"Started {'follow-up ' if follow_up else ''}ingestion job {state.job_id} "
+                        f"for data source {data_source_id}")
+            result = self._result('started', state)
+
+        if follow_up_scheduled:
+            # This job covers the queued changes
+            self._delete_schedule(knowledge_base_id, data_source_id, SCHEDULE_FOLLOW_UP)
+        # Watch the job so its end is noticed without further requests
+        self._put_schedule(knowledge_base_id, data_source_id, SCHEDULE_WATCH, result['ingestion_job_id'])
+        return result
+
+    def _queued(self, knowledge_base_id: str, data_source_id: str, state: _SyncState) -> Dict[str, Any]:
+        """Result of a follow-up queued behind a running job, after scheduling it"""
+        self._schedule_follow_up(knowledge_base_id, data_source_id)
+        with self._lock:
+            return self._result('queued', state)
+
+    def _schedule_follow_up(self, knowledge_base_id: str, data_source_id: str):
+        """Hand the pending follow-up of a data source to a schedule, if configured"""
+        with self._lock:
+            job_id = self._state(knowledge_base_id, data_source_id).job_id
+        if self._put_schedule(knowledge_base_id, data_source_id, SCHEDULE_FOLLOW_UP, job_id):
+            with self._lock:
+                self._state(knowledge_base_id, data_source_id).follow_up_scheduled = True
+
+    def _put_schedule(self, knowledge_base_id: str, data_source_id: str, kind: str,
+                      ingestion_job_id: Optional[str]) -> bool:
+        """
+        Create (or move, if it already exists) the one-time schedule of a data
+        source that invokes the Lambda with SCHEDULED_ACTION. Schedules are
+        kept after they run and moved by the next call: deleting them after
+        completion could race with a run that reschedules itself.
+
+        Returns:
+            True if the schedule is in place; False without schedule
+            configuration or if EventBridge Scheduler failed
+        """
+        if not (self.schedule_target_arn and self.schedule_role_arn):
+            return False
+
+        run_at = datetime.now(timezone.utc) + timedelta(seconds=self.schedule_interval_seconds)
+        params = {
+            'Name': _schedule_name(knowledge_base_id, data_source_id, kind),
+            'GroupName': self.schedule_group,
+            'ScheduleExpression': f"at({run_at.strftime('%Y-%m-%dT%H:%M:%S')})",
+            'ScheduleExpressionTimezone': 'UTC',
+            'FlexibleTimeWindow': {'Mode': 'OFF'},
+            'Target': {
+                'Arn': self.schedule_target_arn,
+                'RoleArn': self.schedule_role_arn,
+                'Input': json.dumps({
+                    'action': SCHEDULED_ACTION,
+                    'knowledge_base_id': knowledge_base_id,
+                    'data_source_id': data_source_id,
+                    'ingestion_job_id': ingestion_job_id,
+                    'follow_up': kind == SCHEDULE_FOLLOW_UP
+                })
+            }
+        }
+        client = get_client('scheduler', self.region)
+        try:
+            try:
+                client.create_schedule(**params)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConflictException':
+                    raise
+                # Already scheduled, or ran before: move it so it runs after this change
+                client.update_schedule(**params)
+        except Exception as e:
+            logger.warning(f"Could not schedule ingestion {kind} for data source {data_source_id}: {str(e)}")
+            with self._lock:
+                self._stats['schedule_errors'] += 1
+            return False
+
+        with self._lock:
+            self._stats['schedules_put'] += 1
+        logger.info(f"Scheduled ingestion {kind} for data source {data_source_id} at {params['ScheduleExpression']}")
+        return True
+
+    def _schedule_pending(self, knowledge_base_id: str, data_source_id: str, kind: str) -> bool:
+        """Whether a schedule has yet to run (assumed so if the lookup fails)"""
+        try:
+            schedule = get_client('scheduler', self.region).get_schedule(
+                Name=_schedule_name(knowledge_base_id, data_source_id, kind),
+                GroupName=self.schedule_group
+            )
+            # at(yyyy-mm-ddThh:mm:ss), in UTC
+            run_at = datetime.strptime(schedule['ScheduleExpression'][3:-1], '%Y-%m-%dT%H:%M:%S')
+            return run_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ResourceNotFoundException':
+                return False
+            logger.warning(f"Could not get ingestion {kind} schedule for data source {data_source_id}: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Could not get ingestion {kind} schedule for data source {data_source_id}: {str(e)}")
+        return True
+
+    def _delete_schedule(self, knowledge_base_id: str, data_source_id: str, kind: str):
+        """Best-effort removal of a schedule that is no longer needed"""
+        try:
+            get_client('scheduler', self.region).delete_schedule(
+                Name=_schedule_name(knowledge_base_id, data_source_id, kind),
+                GroupName=self.schedule_group
+            )
+        except Exception as e:
+            logger.info(f"Could not delete ingestion {kind} schedule for data source {data_source_id}: {str(e)}")
+
+    def _job_finished(self, knowledge_base_id: str, data_source_id: str, job_id: str):
+        """Notify the listeners that a job ended, once per job"""
+        with self._lock:
+            state = self._state(knowledge_base_id, data_source_id)
+            if state.finished_job_id == job_id:
+                return
+            state.finished_job_id = job_id
+            self._stats['jobs_finished'] += 1
+        logger.info(f"Ingestion job {job_id} of data source {data_source_id} has ended")
+        for listener in self._job_finished_listeners:
+            try:
+                listener(knowledge_base_id, data_source_id, job_id)
+            except Exception as e:
+                logger.warning(f"Ingestion job listener failed: {str(e)}")
+
+    def _failed(self, state: _SyncState, data_source_id: str, error: Exception) -> Dict[str, Any]:
+        logger.warning(f"Could not start ingestion job for data source {data_source_id}: {str(error)}")
+        with self._lock:
+            self._stats['errors'] += 1
+            result = self._result('failed', state)
+        result['error'] = str(error)
+        return result
+
+    def _list_jobs(self, client, knowledge_base_id: str, data_source_id: str,
+                   statuses: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Most recent ingestion jobs first, optionally filtered by status"""
+        params = {
+            'knowledgeBaseId': knowledge_base_id,
+            'dataSourceId': data_source_id,
+            'sortBy': {'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+            'maxResults': 5
+        }
+        if statuses:
+            params['filters'] = [{'attribute': 'STATUS', 'operator': 'EQ', 'values': statuses}]
+        return client.list_ingestion_jobs(**params).get('ingestionJobSummaries', [])
+
+    def _state(self, knowledge_base_id: str, data_source_id: str) -> _SyncState:
+        key = (knowledge_base_id, data_source_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _SyncState()
+        return state
+
+    def _result(self, status: str, state: _SyncState) -> Dict[str, Any]:
+        return {
+            'status': status,
+            'ingestion_job_id': state.job_id,
+            'follow_up_pending': state.follow_up_pending
+        }
+
+
+def _schedule_name(knowledge_base_id: str, data_source_id: str, kind: str) -> str:
+    """One schedule of each kind per data source"""
+    return f"ingestion-{kind}-{knowledge_base_id}-{data_source_id}"
+
+
+def _job_summary(job: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-friendly view of an ingestion job or job summary"""
+    summary = {
+        'ingestion_job_id': job.get('ingestionJobId'),
+        'status': job.get('status'),
+        'statistics': job.get('statistics'),
+        'failure_reasons': job.get('failureReasons')
+    }
+    for source, target in (('startedAt', 'started_at'), ('updatedAt', 'updated_at')):
+        value = job.get(source)
+        summary[target] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return summary
+
+
+def _build_default_scheduler() -> Optional[IngestionScheduler]:
+    """Create the container-wide scheduler from environment variables"""
+    if os.environ.get('INGESTION_SCHEDULER_ENABLED', 'true').lower() != 'true':
+        logger.info("Ingestion scheduler disabled")
+        return None
+    schedule_target_arn = os.environ.get('INGESTION_SCHEDULE_TARGET_ARN')
+    schedule_role_arn = os.environ.get('INGESTION_SCHEDULE_ROLE_ARN')
+    if not (schedule_target_arn and schedule_role_arn):
+        logger.warning("INGESTION_SCHEDULE_TARGET_ARN/INGESTION_SCHEDULE_ROLE_ARN not set: queued "
+                       "ingestion follow-ups only run on a later request to the same container")
+    return IngestionScheduler(
+        debounce_seconds=float(os.environ.get('INGESTION_DEBOUNCE_SECONDS', '30')),
+        schedule_target_arn=schedule_target_arn,
+        schedule_role_arn=schedule_role_arn,
+        schedule_group=os.environ.get('INGESTION_SCHEDULE_GROUP', 'default'),
+        schedule_interval_seconds=float(os.environ.get('INGESTION_SCHEDULE_INTERVAL_SECONDS', '60'))
+    )
+
+
+# Shared scheduler for the whole container (None when disabled)
+ingestion_scheduler = _build_default_scheduler()
@@ -1,10 +1,8 @@
 import json
-import boto3
 import logging
 import os
 import sys
 import time
-import base64
 from datetime import datetime
 from urllib.parse import unquote
 
@@ -16,10 +14,30 @@ logger.setLevel(logging.INFO)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
+# Seconds to wait at the end of a request for queued DB log records (write-behind
+# mode). Lambda freezes the container once the handler returns, so records
+# still queued would wait for the next invocation or be lost with the
+# container. The wait is capped by the invocation's remaining time minus
+# DB_LOG_FLUSH_MARGIN_SECONDS; 0 disables it
+DB_LOG_FLUSH_TIMEOUT_SECONDS = float(os.environ.get('DB_LOG_FLUSH_TIMEOUT_SECONDS', '2'))
+DB_LOG_FLUSH_MARGIN_SECONDS = 0.5
+
+# Query pipelines: a single RetrieveAndGenerate call, or Retrieve + Converse with per-phase timings
+ALLOWED_PIPELINES = ['retrieve_and_generate', 'retrieve_then_generate']
+DEFAULT_PIPELINE = os.environ.get('KB_QUERY_PIPELINE', 'retrieve_and_generate')
+
+# Query string parameters that switch GET /documents to the paginated listing
+LIST_QUERY_PARAMETERS = ['limit', 'page_token', 'name_prefix', 'extension', 'sort_by', 'sort_order']
+
 # Import BedrockClient from bedrock_client_hybrid_search and DocumentManager
 from bedrock_client_hybrid_search import BedrockClient
-from document_manager import DocumentManager
+from document_manager import DocumentManager, DEFAULT_PAGE_SIZE, DEDUP_MODES
+from upload_stream import parse_upload_body, base64_content
 from db_logger import DatabaseLogger
+from client_registry import get_stats as get_registry_stats
+from answer_cache import answer_cache
+from data_source_cache import data_source_cache
+from ingestion_scheduler import SCHEDULED_ACTION as SCHEDULED_INGESTION_ACTION
 
 def lambda_handler(event, context):
     """
@@ -55,6 +73,14 @@ def lambda_handler(event, context):
                 })
             }
         
+        # Scheduled job (EventBridge rule with a constant input)
+        if event.get('action') == 'reconcile_document_catalog':
+            return handle_catalog_reconcile_job(event)
+        
+        # One-time EventBridge Scheduler schedule of the ingestion scheduler
+        if event.get('action') == SCHEDULED_INGESTION_ACTION:
+            return handle_scheduled_ingestion_job(event)
+        
         # Route requests based on path and method
         if path.startswith('/documents'):
             return handle_document_request(event, context, headers)
@@ -91,12 +117,16 @@ def handle_chat_request(event, context, headers):
         model_id = body.get('model_id', 'anthropic.claude-sonnet-4-20250514-v1:0')
         knowledge_base_id = body.get('knowledge_base_id', 'TJ8IMVJVQW')  # ID por defecto
         retrieval_only = body.get('retrieval_only', False)
+        stream = body.get('stream', False)
+        pipeline = body.get('pipeline', DEFAULT_PIPELINE)
         
         # Log request parameters
         logger.info(f"Query: {query}")
         logger.info(f"Model ID: {model_id}")
         logger.info(f"Knowledge Base ID: {knowledge_base_id}")
         logger.info(f"Retrieval only: {retrieval_only}")
+        logger.info(f"Stream: {stream}")
+        logger.info(f"Pipeline: {pipeline}")
         
         # Validar parámetros
         if not query:
@@ -122,6 +152,20 @@ def handle_chat_request(event, context, headers):
                 })
             }
         
+        if pipeline not in ALLOWED_PIPELINES:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({
+                    'error': f'Pipeline no válido. Pipelines permitidos: {", ".join(ALLOWED_PIPELINES)}',
+                    'allowed_pipelines': ALLOWED_PIPELINES
+                })
+            }
+        
+        # Streaming mode only applies when an answer is generated
+        if stream and not retrieval_only:
+            return handle_chat_stream_request(event, context, headers, query, model_id, knowledge_base_id, pipeline)
+        
         # Initialize database logger and create initial log entry
         try:
             db_logger = DatabaseLogger()
@@ -131,17 +175,30 @@ def handle_chat_request(event, context, headers):
             logger.error(f"Failed to create database log entry: {str(db_error)}")
             # Continue processing even if database logging fails
         
-        # Inicializar el cliente de Bedrock con el modelo seleccionado
-        bedrock_client = BedrockClient(region_name='eu-west-1', model_id=model_id)
-        
         # Realizar la consulta a la knowledge base con búsqueda híbrida
         start_time = time.time()
-        result = bedrock_client.retrieve_and_generate(
-            knowledge_base_id=knowledge_base_id,
-            prompt=query,
-            model_id=model_id,
-            retrieval_only=retrieval_only
-        )
+        result = _get_cached_answer(query, knowledge_base_id, model_id, retrieval_only, pipeline)
+        cache_hit = result is not None
+        
+        if not cache_hit:
+            # Inicializar el cliente de Bedrock con el modelo seleccionado
+            bedrock_client = BedrockClient(region_name='eu-west-1', model_id=model_id)
+            
+            if pipeline == 'retrieve_then_generate':
+                result = bedrock_client.retrieve_then_generate(
+                    knowledge_base_id=knowledge_base_id,
+                    prompt=query,
+                    model_id=model_id,
+                    retrieval_only=retrieval_only
+                )
+            else:
+                result = bedrock_client.retrieve_and_generate(
+                    knowledge_base_id=knowledge_base_id,
+                    prompt=query,
+                    model_id=model_id,
+                    retrieval_only=retrieval_only
+                )
+            _store_cached_answer(query, knowledge_base_id, model_id, retrieval_only, result, pipeline)
         
         # Calculate processing time
         total_time_ms = round((time.time() - start_time) * 1000, 2)
@@ -151,27 +208,22 @@ def handle_chat_request(event, context, headers):
         result['model_used'] = model_id
         result['knowledge_base_id'] = knowledge_base_id
         result['total_processing_time_ms'] = total_time_ms
+        result['cache_hit'] = cache_hit
+        result['pipeline'] = pipeline
         
         # Update database log with success
         if db_logger and query_id:
             try:
-                response_text = result.get('answer', '')
-                retrieved_docs = result.get('retrievalResults', [])
-                
-                db_logger.update_query_log_success(
+                # Update the log and store retrieved documents in one transaction
+                db_logger.complete_query_log(
                     query_id=query_id,
-                    response=response_text,
+                    response=result.get('answer', ''),
                     processing_time_ms=int(total_time_ms),
-                    tokens_used=None,  # Bedrock doesn't provide token count directly
-                    retrieved_docs_count=len(retrieved_docs),
-                    vector_db_time_ms=None,
-                    llm_time_ms=None
+                    documents=result.get('retrievalResults', []),
+                    cache_hit=cache_hit,
+                    **_phase_metrics(result)
                 )
                 
-                # Log retrieved documents if available
-                if retrieved_docs:
-                    db_logger.log_retrieved_documents(query_id, retrieved_docs)
-                
                 logger.info(f"Successfully updated database log entry {query_id}")
             except Exception as db_error:
                 logger.error(f"Failed to update database log entry: {str(db_error)}")
@@ -202,12 +254,207 @@ def handle_chat_request(event, context, headers):
             'body': json.dumps({'error': str(e)})
         }
     finally:
-        # Close database connection
+        # Flush queued log records before the container is frozen, and release
+        # the database connection (it stays cached for the next invocation)
         if db_logger:
             try:
+                _flush_db_log(db_logger, context)
                 db_logger._close()
             except:
                 pass
+        logger.info(f"Client registry stats: {get_registry_stats()}")
+
+
+def handle_chat_stream_request(event, context, headers, query, model_id, knowledge_base_id,
+                               pipeline=DEFAULT_PIPELINE):
+    """
+    Handle a streaming chat request.
+    
+    Under the streaming runtime (lambda_stream_runtime.py, behind a Function
+    URL with InvokeMode RESPONSE_STREAM) the context has response_stream set
+    and the body is the iter_chat_stream generator itself, written to the
+    client chunk by chunk. Behind API Gateway (REST), which buffers the
+    integration response, the NDJSON events are joined into a single body.
+    """
+    stream_headers = dict(headers)
+    stream_headers['Content-Type'] = 'application/x-ndjson'
+    
+    chunks = iter_chat_stream(event, query, model_id, knowledge_base_id, pipeline, context)
+    return {
+        'statusCode': 200,
+        'headers': stream_headers,
+        'body': chunks if getattr(context, 'response_stream', False) else ''.join(chunks)
+    }
+
+
+def iter_chat_stream(event, query, model_id, knowledge_base_id, pipeline=DEFAULT_PIPELINE, context=None):
+    """
+    Run a streaming knowledge base query and yield it as NDJSON lines.
+    
+    Events, one JSON object per line:
+        {"type": "start", "query_id": ...}
+        {"type": "text", "text": ...}                 (answer deltas)
+        {"type": "citation", "start": ..., "end": ..., "references": [...], "retrievalResults": [...]}
+        {"type": "done", "answer": ..., "time_to_first_token_ms": ..., ...}
+        {"type": "error", "error": ...}               (instead of "done" on failure)
+    
+    The retrieve_then_generate pipeline sends its fragments in a single
+    citation event without spans, and its "done" event carries the per-phase
+    timings and the token counts of the ConverseStream metadata event.
+    The database log entry is finalized once the stream has ended.
+    """
+    query_id = None
+    db_logger = None
+    
+    try:
+        try:
+            db_logger = DatabaseLogger()
+            query_id = db_logger.create_query_log(event, query, model_id, knowledge_base_id)
+            logger.info(f"Created database log entry with ID: {query_id}")
+        except Exception as db_error:
+            logger.error(f"Failed to create database log entry: {str(db_error)}")
+        
+        yield _ndjson_line({'type': 'start', 'query_id': query_id})
+        
+        try:
+            start_time = time.time()
+            result = _get_cached_answer(query, knowledge_base_id, model_id, False, pipeline)
+            cache_hit = result is not None
+            
+            if cache_hit:
+                # Replay the cached answer as a single delta
+                result['type'] = 'done'
+                result['time_to_first_token_ms'] = round((time.time() - start_time) * 1000, 2)
+                yield _ndjson_line({'type': 'text', 'text': result.get('answer', '')})
+                if result.get('retrievalResults'):
+                    yield _ndjson_line({'type': 'citation', 'retrievalResults': result['retrievalResults']})
+            else:
+                bedrock_client = BedrockClient(region_name='eu-west-1', model_id=model_id)
+                
+                if pipeline == 'retrieve_then_generate':
+                    stream_chunks = bedrock_client.retrieve_then_generate_stream
+                else:
+                    stream_chunks = bedrock_client.retrieve_and_generate_stream
+                
+                for chunk in stream_chunks(
+                    knowledge_base_id=knowledge_base_id,
+                    prompt=query,
+                    model_id=model_id
+                ):
+                    if chunk['type'] == 'done':
+                        result = chunk
+                    else:
+                        yield _ndjson_line(chunk)
+                
+                _store_cached_answer(query, knowledge_base_id, model_id, False, result, pipeline)
+            
+            total_time_ms = round((time.time() - start_time) * 1000, 2)
+            
+            result['query'] = query
+            result['model_used'] = model_id
+            result['knowledge_base_id'] = knowledge_base_id
+            result['total_processing_time_ms'] = total_time_ms
+            result['query_id'] = query_id
+            result['cache_hit'] = cache_hit
+            result['pipeline'] = pipeline
+            
+            logger.info(f"Streamed answer: ttft={result.get('time_to_first_token_ms')} ms, total={total_time_ms} ms")
+            
+            # Update database log with success once the whole answer is known
+            if db_logger and query_id:
+                try:
+                    db_logger.complete_query_log(
+                        query_id=query_id,
+                        response=result.get('answer', ''),
+                        processing_time_ms=int(total_time_ms),
+                        documents=result.get('retrievalResults', []),
+                        cache_hit=cache_hit,
+                        **_phase_metrics(result)
+                    )
+                    logger.info(f"Successfully updated database log entry {query_id}")
+                except Exception as db_error:
+                    logger.error(f"Failed to update database log entry: {str(db_error)}")
+            
+            yield _ndjson_line(result)
+            
+        except Exception as e:
+            logger.error(f"Streaming knowledge base query failed: {str(e)}")
+            if db_logger and query_id:
+                try:
+                    db_logger.update_query_log_error(query_id, str(e))
+                except Exception as db_error:
+                    logger.error(f"Failed to update database log with error: {str(db_error)}")
+            yield _ndjson_line({'type': 'error', 'error': str(e), 'query_id': query_id})
+    finally:
+        if db_logger:
+            try:
+                _flush_db_log(db_logger, context)
+                db_logger._close()
+            except:
+                pass
+
+
+def _flush_db_log(db_logger, context=None):
+    """
+    Wait up to DB_LOG_FLUSH_TIMEOUT_SECONDS for the write-behind queue, within
+    the time left in the invocation. Returns at once when the queue is empty
+    or logging is synchronous.
+    """
+    timeout = DB_LOG_FLUSH_TIMEOUT_SECONDS
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        timeout = min(timeout, context.get_remaining_time_in_millis() / 1000 - DB_LOG_FLUSH_MARGIN_SECONDS)
+    if timeout > 0:
+        db_logger.flush(timeout)
+
+
+def _get_cached_answer(query, knowledge_base_id, model_id, retrieval_only, pipeline=DEFAULT_PIPELINE):
+    """Return a cached result for the request, or None (cache errors never fail the query)"""
+    if answer_cache is None:
+        return None
+    try:
+        cached = answer_cache.get(query, knowledge_base_id, model_id, retrieval_only, pipeline)
+        if cached is not None:
+            logger.info(f"Answer cache hit for knowledge base {knowledge_base_id}")
+        return cached
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {str(e)}")
+        return None
+
+
+def _store_cached_answer(query, knowledge_base_id, model_id, retrieval_only, result, pipeline=DEFAULT_PIPELINE):
+    """Cache a freshly generated result, skipping empty answers"""
+    if answer_cache is None:
+        return
+    if not retrieval_only and result.get('answer') in (None, '', "No se generó ninguna respuesta"):
+        return
+    try:
+        cached = {k: v for k, v in result.items() if k in ('answer', 'retrievalResults', 'citations', 'processing_time_ms')}
+        answer_cache.set(query, knowledge_base_id, model_id, retrieval_only, cached, pipeline)
+    except Exception as e:
+        logger.warning(f"Answer cache write failed: {str(e)}")
+
+
+def _phase_metrics(result):
+    """
+    Per-phase timings and token counts for query_logs. Only the
+    retrieve_then_generate pipeline reports them; RetrieveAndGenerate
+    hides where time goes, so those columns stay NULL (tokens estimated).
+    """
+    input_tokens = result.get('input_tokens')
+    output_tokens = result.get('output_tokens')
+    retrieval_time_ms = result.get('retrieval_time_ms')
+    generation_time_ms = result.get('generation_time_ms')
+    
+    return {
+        'tokens_used': input_tokens + output_tokens if input_tokens is not None and output_tokens is not None else None,
+        'vector_db_time_ms': int(retrieval_time_ms) if retrieval_time_ms is not None else None,
+        'llm_time_ms': int(generation_time_ms) if generation_time_ms is not None else None
+    }
+
+
+def _ndjson_line(payload):
+    """Serialize one stream event as a newline-terminated JSON line"""
+    return json.dumps(payload) + '\n'
 
 
 def handle_document_request(event, context, headers):
@@ -270,10 +517,21 @@ def handle_document_request(event, context, headers):
         # Parse path to extract parameters
         # Expected paths:
         # GET /documents/{knowledgeBaseId}/{dataSourceId}
+        # GET /documents/{knowledgeBaseId}/{dataSourceId}/ingestion
+        # GET /documents/{knowledgeBaseId}/{dataSourceId}/duplicates
+        # POST /documents/{knowledgeBaseId}/{dataSourceId}/duplicates/cleanup
+        # GET /documents/{knowledgeBaseId}/{dataSourceId}/catalog
+        # GET /documents/{knowledgeBaseId}/{dataSourceId}/catalog/drift
+        # POST /documents/{knowledgeBaseId}/{dataSourceId}/catalog/reconcile
         # POST /documents/{knowledgeBaseId}/{dataSourceId}
+        # POST /documents/{knowledgeBaseId}/{dataSourceId}/batch
+        # POST /documents/{knowledgeBaseId}/{dataSourceId}/uploads
+        # POST /documents/{knowledgeBaseId}/{dataSourceId}/uploads/complete
+        # POST /documents/{knowledgeBaseId}/{dataSourceId}/uploads/abort
         # DELETE /documents/{knowledgeBaseId}/{dataSourceId}/{documentId}
         # DELETE /documents/{knowledgeBaseId}/{dataSourceId}/batch
         # PUT /documents/{knowledgeBaseId}/{dataSourceId}/{documentId}/rename
+        # PUT /documents/{knowledgeBaseId}/{dataSourceId}/batch/rename
         
         path_parts = [p for p in path.split('/') if p]
         logger.info(f"📂 Path parts: {path_parts}")
@@ -294,27 +552,68 @@ def handle_document_request(event, context, headers):
         data_source_id = unquote(path_parts[2])
         
         logger.info(f"🎯 Document operation: {http_method} for KB: {knowledge_base_id}, DS: {data_source_id}")
+        if data_source_cache is not None:
+            logger.info(f"Data source config cache stats: {data_source_cache.get_stats()}")
+        
+        if http_method == 'GET' and len(path_parts) == 4 and path_parts[3] == 'ingestion':
+            return handle_ingestion_status_request(doc_manager, knowledge_base_id, data_source_id, headers)
+        
+        # Follow-up syncs queued by earlier mutations start on the next request once due
+        doc_manager.run_pending_ingestions(knowledge_base_id, data_source_id)
+        
+        if http_method in ('GET', 'POST') and len(path_parts) >= 4 and path_parts[3] == 'catalog':
+            return handle_catalog_request(doc_manager, http_method, path_parts, knowledge_base_id, data_source_id, headers)
+        
+        if http_method in ('GET', 'POST') and len(path_parts) >= 4 and path_parts[3] == 'duplicates':
+            return handle_duplicates_request(event, doc_manager, http_method, path_parts, knowledge_base_id, data_source_id, headers)
+        
+        if http_method == 'POST' and len(path_parts) >= 4 and path_parts[3] == 'uploads':
+            return handle_upload_session_request(event, doc_manager, path_parts, knowledge_base_id, data_source_id, headers)
         
         if http_method == 'GET':
             # List documents
             logger.info(f"📄 Listando documentos para KB: {knowledge_base_id}, DS: {data_source_id}")
+            query_params = event.get('queryStringParameters') or {}
             try:
-                documents = doc_manager.list_documents(knowledge_base_id, data_source_id)
-                logger.info(f"✅ Encontrados {len(documents)} documentos")
+                if any(name in query_params for name in LIST_QUERY_PARAMETERS):
+                    # Paginated listing: only the requested page is built
+                    extensions = query_params.get('extension')
+                    response_body = doc_manager.list_documents_page(
+                        knowledge_base_id,
+                        data_source_id,
+                        limit=query_params.get('limit', DEFAULT_PAGE_SIZE),
+                        page_token=query_params.get('page_token'),
+                        name_prefix=query_params.get('name_prefix'),
+                        extensions=extensions.split(',') if extensions else None,
+                        sort_by=query_params.get('sort_by', 'key'),
+                        sort_order=query_params.get('sort_order', 'asc')
+                    )
+                    logger.info(f"✅ Página con {response_body['count']} documentos")
+                else:
+                    documents = doc_manager.list_documents(knowledge_base_id, data_source_id)
+                    logger.info(f"✅ Encontrados {len(documents)} documentos")
+                    response_body = {
+                        'documents': documents,
+                        'count': len(documents)
+                    }
                 
-                response_body = {
-                    'documents': documents,
+                response_body.update({
                     'knowledge_base_id': knowledge_base_id,
                     'data_source_id': data_source_id,
-                    'count': len(documents),
                     'timestamp': datetime.now().isoformat()
-                }
+                })
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
                     'body': json.dumps(response_body)
                 }
+            except ValueError as list_error:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(list_error)})
+                }
             except Exception as list_error:
                 logger.error(f"❌ Error al listar documentos: {str(list_error)}")
                 return {
@@ -327,43 +626,55 @@ def handle_document_request(event, context, headers):
                     })
                 }
             
+        elif http_method == 'POST' and len(path_parts) == 4 and path_parts[3] == 'batch':
+            return handle_batch_upload_request(event, doc_manager, knowledge_base_id, data_source_id, headers)
+            
         elif http_method == 'POST':
             # Upload document
             body_str = event.get('body') or '{}'
-            body = json.loads(body_str)
             
-            # Handle file upload - expect base64 encoded content
+            # Handle file upload - expect base64 encoded content, decoded in
+            # chunks straight from the request body (see upload_stream)
+            try:
+                body, file_content = parse_upload_body(body_str)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(e)})
+                }
+            
             filename = body.get('filename')
-            file_content_b64 = body.get('file_content')
             content_type = body.get('content_type', 'application/octet-stream')
+            on_duplicate = body.get('on_duplicate')
             
-            if not filename or not file_content_b64:
+            if not filename or file_content is None:
                 return {
                     'statusCode': 400,
                     'headers': headers,
                     'body': json.dumps({'error': 'filename and file_content are required'})
                 }
             
-            # Decode base64 content
-            try:
-                file_content = base64.b64decode(file_content_b64)
-            except Exception as e:
+            on_duplicate_error = validate_on_duplicate(on_duplicate, doc_manager)
+            if on_duplicate_error:
                 return {
                     'statusCode': 400,
                     'headers': headers,
-                    'body': json.dumps({'error': f'Invalid base64 content: {str(e)}'})
+                    'body': json.dumps({'error': on_duplicate_error})
                 }
             
-            result = doc_manager.upload_document(
+            result = doc_manager.upload_document_stream(
                 knowledge_base_id, 
                 data_source_id, 
                 file_content, 
                 filename, 
-                content_type
+                content_type,
+                on_duplicate=on_duplicate
             )
             
             return {
-                'statusCode': 201,
+                # The content was already in the data source: nothing was created
+                'statusCode': 200 if result.get('duplicate') else 201,
                 'headers': headers,
                 'body': json.dumps(result)
             }
@@ -416,7 +727,24 @@ def handle_document_request(event, context, headers):
                 }
                 
         elif http_method == 'PUT':
-            if len(path_parts) >= 5 and path_parts[4] == 'rename':
+            if len(path_parts) == 5 and path_parts[3] == 'batch' and path_parts[4] == 'rename':
+                # Batch rename
+                body = json.loads(event.get('body') or '{}')
+                try:
+                    result = doc_manager.rename_documents_batch(knowledge_base_id, data_source_id, body.get('renames') or [])
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': str(e)})
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps(result)
+                }
+            elif len(path_parts) >= 5 and path_parts[4] == 'rename':
                 # Rename document
                 document_id = unquote(path_parts[3])
                 body_str = event.get('body') or '{}'
@@ -462,3 +790,257 @@ def handle_document_request(event, context, headers):
             'headers': headers,
             'body': json.dumps({'error': str(e)})
         }
+
+
+def validate_on_duplicate(on_duplicate, doc_manager):
+    """Error message for an invalid on_duplicate field of an upload, or None"""
+    if on_duplicate is None:
+        return None
+    if on_duplicate not in DEDUP_MODES:
+        return f'on_duplicate must be one of {list(DEDUP_MODES)}'
+    # Duplicates are looked up in the content hash index of the catalog
+    if on_duplicate != 'off' and doc_manager.catalog is None:
+        return f"on_duplicate='{on_duplicate}' requires the document catalog (DOCUMENT_CATALOG_ENABLED)"
+    return None
+
+
+def handle_batch_upload_request(event, doc_manager, knowledge_base_id, data_source_id, headers):
+    """
+    Upload several base64 files in one request (POST .../batch):
+    {"files": [{"filename", "file_content", "content_type", "on_duplicate"}]}
+    Items with invalid content are reported in the results, the rest are uploaded
+    """
+    body = json.loads(event.get('body') or '{}')
+    
+    uploads = []
+    for item in body.get('files') or []:
+        upload = {
+            'filename': item.get('filename'),
+            'content_type': item.get('content_type'),
+            'on_duplicate': item.get('on_duplicate')
+        }
+        on_duplicate_error = validate_on_duplicate(upload['on_duplicate'], doc_manager)
+        if on_duplicate_error:
+            upload['error'] = on_duplicate_error
+        elif item.get('file_content'):
+            try:
+                upload['content'] = base64_content(item['file_content'])
+            except ValueError as e:
+                upload['error'] = str(e)
+        uploads.append(upload)
+    
+    try:
+        result = doc_manager.upload_documents_batch(knowledge_base_id, data_source_id, uploads)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result)
+    }
+
+
+def handle_upload_session_request(event, doc_manager, path_parts, knowledge_base_id, data_source_id, headers):
+    """
+    Two-step upload straight to S3: POST .../uploads returns presigned URLs,
+    POST .../uploads/complete validates the object and schedules ingestion,
+    POST .../uploads/abort cancels a multipart upload
+    """
+    operation = path_parts[4] if len(path_parts) >= 5 else None
+    body = json.loads(event.get('body') or '{}')
+    
+    try:
+        if operation is None:
+            filename = body.get('filename')
+            if not filename:
+                raise ValueError('filename is required')
+            size = body.get('size')
+            result = doc_manager.create_upload_session(
+                knowledge_base_id,
+                data_source_id,
+                filename,
+                body.get('content_type', 'application/octet-stream'),
+                int(size) if size is not None else None,
+                content_sha256=body.get('content_sha256')
+            )
+            status_code = 201
+        elif operation in ('complete', 'abort'):
+            document_id = body.get('document_id')
+            if not document_id:
+                raise ValueError('document_id is required')
+            if operation == 'complete':
+                on_duplicate_error = validate_on_duplicate(body.get('on_duplicate'), doc_manager)
+                if on_duplicate_error:
+                    raise ValueError(on_duplicate_error)
+                result = doc_manager.complete_upload(
+                    knowledge_base_id,
+                    data_source_id,
+                    document_id,
+                    upload_id=body.get('upload_id'),
+                    parts=body.get('parts'),
+                    on_duplicate=body.get('on_duplicate')
+                )
+                # The content was already in the data source: the new object was discarded
+                status_code = 200 if result.get('duplicate') else 201
+            else:
+                if not body.get('upload_id'):
+                    raise ValueError('upload_id is required')
+                result = doc_manager.abort_upload(knowledge_base_id, data_source_id, document_id, body['upload_id'])
+                status_code = 200
+        else:
+            raise ValueError('Invalid upload operation. Expected POST .../uploads, .../uploads/complete or .../uploads/abort')
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': json.dumps(result)
+    }
+
+
+def handle_duplicates_request(event, doc_manager, http_method, path_parts, knowledge_base_id, data_source_id, headers):
+    """
+    Duplicate content in a data source, by S3 size + ETag: report
+    (GET .../duplicates) and cleanup (POST .../duplicates/cleanup, body
+    {"dry_run": true} to only count)
+    """
+    operation = path_parts[4] if len(path_parts) >= 5 else None
+    
+    if http_method == 'GET' and operation is None:
+        result = doc_manager.duplicate_report(knowledge_base_id, data_source_id)
+    elif http_method == 'POST' and operation == 'cleanup':
+        body = json.loads(event.get('body') or '{}')
+        result = doc_manager.cleanup_duplicates(knowledge_base_id, data_source_id, dry_run=bool(body.get('dry_run')))
+    else:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Invalid duplicates operation. Expected GET .../duplicates or POST .../duplicates/cleanup'})
+        }
+    
+    result.update({
+        'knowledge_base_id': knowledge_base_id,
+        'data_source_id': data_source_id
+    })
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result)
+    }
+
+
+def handle_ingestion_status_request(doc_manager, knowledge_base_id, data_source_id, headers):
+    """
+    Status of the data source's ingestion job (GET .../ingestion), so clients
+    poll one job after several uploads/deletes/renames
+    """
+    if doc_manager.ingestion_scheduler is None:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Ingestion scheduler is not enabled (INGESTION_SCHEDULER_ENABLED)'})
+        }
+    
+    result = doc_manager.get_ingestion_status(knowledge_base_id, data_source_id)
+    result.update({
+        'knowledge_base_id': knowledge_base_id,
+        'data_source_id': data_source_id,
+        'timestamp': datetime.now().isoformat()
+    })
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result)
+    }
+
+
+def handle_catalog_request(doc_manager, http_method, path_parts, knowledge_base_id, data_source_id, headers):
+    """
+    Document catalog operations: stats (GET .../catalog), drift report
+    (GET .../catalog/drift) and reconcile (POST .../catalog/reconcile)
+    """
+    operation = path_parts[4] if len(path_parts) >= 5 else None
+    
+    if doc_manager.catalog is None:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Document catalog is not enabled (DOCUMENT_CATALOG_ENABLED)'})
+        }
+    
+    if http_method == 'GET' and operation is None:
+        result = doc_manager.get_catalog_stats(knowledge_base_id, data_source_id)
+    elif http_method == 'GET' and operation == 'drift':
+        result = doc_manager.catalog_drift_report(knowledge_base_id, data_source_id)
+    elif http_method == 'POST' and operation == 'reconcile':
+        result = doc_manager.reconcile_catalog(knowledge_base_id, data_source_id)
+    else:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Invalid catalog operation. Expected GET .../catalog, GET .../catalog/drift or POST .../catalog/reconcile'})
+        }
+    
+    result.update({
+        'knowledge_base_id': knowledge_base_id,
+        'data_source_id': data_source_id
+    })
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result)
+    }
+
+
+def handle_scheduled_ingestion_job(event):
+    """
+    Check a watched ingestion job and start a queued follow-up:
+    {"action": "run_scheduled_ingestion", "knowledge_base_id": "...",
+     "data_source_id": "...", "ingestion_job_id": "...", "follow_up": true}
+    """
+    doc_manager = DocumentManager()
+    knowledge_base_id = event['knowledge_base_id']
+    data_source_id = event['data_source_id']
+    try:
+        result = doc_manager.run_scheduled_ingestion(
+            knowledge_base_id, data_source_id,
+            event.get('ingestion_job_id'), bool(event.get('follow_up'))
+        )
+    except Exception as e:
+        logger.error(f"Scheduled ingestion run failed for data source {data_source_id}: {str(e)}")
+        return {'data_source_id': data_source_id, 'error': str(e)}
+    result['data_source_id'] = data_source_id
+    return result
+
+
+def handle_catalog_reconcile_job(event):
+    """
+    Reconcile the document catalog of every data source in the event:
+    {"action": "reconcile_document_catalog",
+     "data_sources": [{"knowledge_base_id": "...", "data_source_id": "..."}]}
+    """
+    doc_manager = DocumentManager()
+    reports = []
+    
+    for data_source in event.get('data_sources', []):
+        knowledge_base_id = data_source['knowledge_base_id']
+        data_source_id = data_source['data_source_id']
+        try:
+            report = doc_manager.reconcile_catalog(knowledge_base_id, data_source_id)
+            report['data_source_id'] = data_source_id
+            reports.append(report)
+        except Exception as e:
+            logger.error(f"Catalog reconcile failed for data source {data_source_id}: {str(e)}")
+            reports.append({'data_source_id': data_source_id, 'error': str(e)})
+    
+    return {'reports': reports}
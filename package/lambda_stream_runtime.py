@@ -0,0 +1,216 @@
+"""
+Streaming Lambda Runtime Module
+Minimal Lambda Runtime API loop that runs kb_query_handler.lambda_handler and
+writes HTTP responses in streaming mode, so a Function URL with InvokeMode
+RESPONSE_STREAM delivers each NDJSON event of a "stream": true query as soon
+as it is produced. The managed Python runtime only returns buffered
+responses; this loop replaces it through AWS_LAMBDA_EXEC_WRAPPER (see
+lambda-stream-bootstrap).
+
+Only Function URL requests are answered in streaming mode: there the
+handler may return an iterator body, streamed chunk by chunk, and string
+bodies are sent as a single chunk. Any other event (API Gateway, scheduled
+actions) gets the usual buffered response, so the same function can keep
+serving API Gateway.
+"""
+
+import base64
+import http.client
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RUNTIME_API_VERSION = '2018-06-01'
+
+# Function URL streaming: a JSON prelude with status and headers, eight
+# null bytes, then the body
+HTTP_INTEGRATION_CONTENT_TYPE = 'application/vnd.awslambda.http-integration-response'
+PRELUDE_DELIMITER = b'\x00' * 8
+
+
+class StreamingContext:
+    """
+    Lambda context of one invocation; response_stream tells the handler it
+    may return an iterator body
+    """
+
+    def __init__(self, headers, response_stream=False):
+        self.response_stream = response_stream
+        self.aws_request_id = headers.get('Lambda-Runtime-Aws-Request-Id')
+        self.invoked_function_arn = headers.get('Lambda-Runtime-Invoked-Function-Arn')
+        self.function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+        self.function_version = os.environ.get('AWS_LAMBDA_FUNCTION_VERSION')
+        self.memory_limit_in_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+        self.log_group_name = os.environ.get('AWS_LAMBDA_LOG_GROUP_NAME')
+        self.log_stream_name = os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME')
+        self._deadline_ms = int(headers.get('Lambda-Runtime-Deadline-Ms') or 0)
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(self._deadline_ms - int(time.time() * 1000), 0)
+
+
+def normalize_function_url_event(event):
+    """
+    Give a Function URL event (payload format 2.0) the API Gateway REST
+    fields kb_query_handler reads: httpMethod, path and a decoded body
+
+    Returns:
+        True if the event is a Function URL request
+    """
+    http_context = (event.get('requestContext') or {}).get('http')
+    if not http_context or 'httpMethod' in event:
+        return False
+    event['httpMethod'] = http_context.get('method', 'POST')
+    event['path'] = event.get('rawPath') or http_context.get('path', '/')
+    if event.get('isBase64Encoded') and event.get('body'):
+        event['body'] = base64.b64decode(event['body']).decode('utf-8')
+        event['isBase64Encoded'] = False
+    return True
+
+
+def _chunks(response):
+    """Prelude and body chunks of an HTTP response, as bytes"""
+    prelude = {
+        'statusCode': response.get('statusCode', 200),
+        'headers': response.get('headers') or {}
+    }
+    yield json.dumps(prelude).encode('utf-8') + PRELUDE_DELIMITER
+
+    body = response.get('body')
+    if body is None:
+        return
+    if isinstance(body, (str, bytes)):
+        body = [body]
+    for chunk in body:
+        if chunk:
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+class RuntimeClient:
+    """Calls to the Lambda Runtime API (one keep-alive connection)"""
+
+    def __init__(self, address):
+        self.address = address
+        self.connection = http.client.HTTPConnection(address)
+
+    def next_invocation(self):
+        """Block until the next event; returns (event, headers)"""
+        self.connection.request('GET', f'/{RUNTIME_API_VERSION}/runtime/invocation/next')
+        response = self.connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Runtime API next invocation failed: {response.status} {body[:200]!r}")
+        return json.loads(body), dict(response.getheaders())
+
+    def post_response(self, request_id, response):
+        """Buffered JSON response"""
+        self._post(f'/{RUNTIME_API_VERSION}/runtime/invocation/{request_id}/response',
+                   json.dumps(response).encode('utf-8'), {'Content-Type': 'application/json'})
+
+    def stream_response(self, request_id, response):
+        """
+        HTTP response in streaming mode. An error raised by the body iterator
+        after the first chunk is reported through the error trailers, since
+        the status has already been sent.
+        """
+        error = {}
+
+        def body():
+            try:
+                yield from _chunks(response)
+            except Exception as e:
+                logger.error(f"Response stream failed: {str(e)}")
+                error.update(_error_payload(e))
+
+        headers = {
+            'Content-Type': HTTP_INTEGRATION_CONTENT_TYPE,
+            'Lambda-Runtime-Function-Response-Mode': 'streaming',
+            'Transfer-Encoding': 'chunked',
+            'Trailer': 'Lambda-Runtime-Function-Error-Type, Lambda-Runtime-Function-Error-Body'
+        }
+        path = f'/{RUNTIME_API_VERSION}/runtime/invocation/{request_id}/response'
+        self.connection.putrequest('POST', path)
+        for name, value in headers.items():
+            self.connection.putheader(name, value)
+        self.connection.endheaders()
+        for chunk in body():
+            # One HTTP chunk per handler chunk, sent as soon as it is produced
+            self.connection.send(f'{len(chunk):x}\r\n'.encode('ascii') + chunk + b'\r\n')
+        trailers = b''
+        if error:
+            trailers = (
+                f"Lambda-Runtime-Function-Error-Type: {error['errorType']}\r\n"
+                f"Lambda-Runtime-Function-Error-Body: "
+                f"{base64.b64encode(json.dumps(error).encode('utf-8')).decode('ascii')}\r\n"
+            ).encode('ascii')
+        self.connection.send(b'0\r\n' + trailers + b'\r\n')
+        self._read_status(path)
+
+    def post_error(self, request_id, error):
+        self._post(f'/{RUNTIME_API_VERSION}/runtime/invocation/{request_id}/error',
+                   json.dumps(_error_payload(error)).encode('utf-8'),
+                   {'Content-Type': 'application/json',
+                    'Lambda-Runtime-Function-Error-Type': type(error).__name__})
+
+    def post_init_error(self, error):
+        self._post(f'/{RUNTIME_API_VERSION}/runtime/init/error',
+                   json.dumps(_error_payload(error)).encode('utf-8'),
+                   {'Content-Type': 'application/json',
+                    'Lambda-Runtime-Function-Error-Type': type(error).__name__})
+
+    def _post(self, path, body, headers):
+        self.connection.request('POST', path, body=body, headers=headers)
+        self._read_status(path)
+
+    def _read_status(self, path):
+        response = self.connection.getresponse()
+        body = response.read()
+        if response.status >= 300:
+            logger.error(f"Runtime API {path} returned {response.status}: {body[:200]!r}")
+
+
+def _error_payload(error):
+    return {
+        'errorMessage': str(error),
+        'errorType': type(error).__name__,
+        'stackTrace': traceback.format_exception(type(error), error, error.__traceback__)
+    }
+
+
+def main():
+    runtime = RuntimeClient(os.environ['AWS_LAMBDA_RUNTIME_API'])
+    sys.path.insert(0, os.environ.get('LAMBDA_TASK_ROOT', os.path.dirname(os.path.abspath(__file__))))
+    try:
+        from kb_query_handler import lambda_handler
+    except Exception as e:
+        logger.error(f"Could not import the handler: {str(e)}")
+        runtime.post_init_error(e)
+        sys.exit(1)
+
+    while True:
+        event, headers = runtime.next_invocation()
+        request_id = headers.get('Lambda-Runtime-Aws-Request-Id')
+        function_url = isinstance(event, dict) and normalize_function_url_event(event)
+        try:
+            response = lambda_handler(event, StreamingContext(headers, response_stream=function_url))
+        except Exception as e:
+            logger.error(f"Handler failed: {str(e)}")
+            runtime.post_error(request_id, e)
+            continue
+
+        if function_url and isinstance(response, dict):
+            runtime.stream_response(request_id, response)
+        else:
+            runtime.post_response(request_id, response)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
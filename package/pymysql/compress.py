@@ -0,0 +1,140 @@
+# MySQL compressed protocol (CLIENT_COMPRESS / CLIENT_ZSTD_COMPRESSION_ALGORITHM)
+# https://dev.mysql.com/doc/dev/mysql-server/latest/page_protocol_basic_compression.html
+
+import struct
+import zlib
+
+try:
+    import zstandard as _zstd
+except ImportError:  # pragma: no cover - optional dependency
+    _zstd = None
+
+from .constants import CR
+from . import err
+
+
+#: Payloads shorter than this are sent uncompressed (same as libmysqlclient).
+MIN_COMPRESS_LENGTH = 50
+
+#: Default zstd level sent in the handshake response (MySQL default is 3).
+ZSTD_DEFAULT_LEVEL = 3
+
+MAX_PAYLOAD_LEN = 2**24 - 1
+
+ALGORITHMS = ("zlib", "zstd")
+
+
+def zstd_available():
+    return _zstd is not None
+
+
+class ZlibCodec:
+    name = "zlib"
+
+    def compress(self, data):
+        return zlib.compress(data)
+
+    def decompress(self, data, size):
+        return zlib.decompress(data, bufsize=size)
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, level=ZSTD_DEFAULT_LEVEL):
+        self._compressor = _zstd.ZstdCompressor(level=level)
+        self._decompressor = _zstd.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data, size):
+        return self._decompressor.decompress(data, max_output_size=size)
+
+
+class CompressedStream:
+    """Compressed packet framing between the socket and the MySQL packets.
+
+    Outgoing bytes are wrapped in compressed packets (7 byte header: payload
+    length, compressed sequence id, uncompressed length or 0 when the payload
+    is stored as is). Incoming compressed packets are inflated into a buffer
+    from which the regular packet reader takes its bytes.
+    """
+
+    def __init__(self, codec, threshold=MIN_COMPRESS_LENGTH):
+        self.codec = codec
+        self.threshold = threshold
+        self.sequence_id = 0
+        self._buffer = bytearray()
+        self._offset = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.raw_bytes_in = 0
+        self.raw_bytes_out = 0
+
+    def frame(self, data):
+        """Compressed packets carrying 'data'."""
+        frames = []
+        for start in range(0, max(len(data), 1), MAX_PAYLOAD_LEN):
+            chunk = data[start : start + MAX_PAYLOAD_LEN]
+            payload, uncompressed_length = chunk, 0
+            if len(chunk) >= self.threshold:
+                compressed = self.codec.compress(chunk)
+                if len(compressed) < len(chunk):
+                    payload, uncompressed_length = compressed, len(chunk)
+            frames.append(
+                struct.pack("<I", len(payload))[:3]
+                + bytes([self.sequence_id])
+                + struct.pack("<I", uncompressed_length)[:3]
+            )
+            frames.append(payload)
+            self.sequence_id = (self.sequence_id + 1) % 256
+            self.raw_bytes_out += len(chunk)
+            self.bytes_out += len(payload) + 7
+        return b"".join(frames)
+
+    def read(self, num_bytes, read_socket):
+        """Return 'num_bytes' decompressed bytes, reading compressed packets
+        with read_socket(n) as needed."""
+        while len(self._buffer) - self._offset < num_bytes:
+            self._fill(read_socket)
+        end = self._offset + num_bytes
+        with memoryview(self._buffer) as view:
+            data = view[self._offset : end].tobytes()
+        if end == len(self._buffer):
+            self._buffer.clear()
+            self._offset = 0
+        else:
+            self._offset = end
+        return data
+
+    def _fill(self, read_socket):
+        header = read_socket(7)
+        payload_length = header[0] | header[1] << 8 | header[2] << 16
+        uncompressed_length = header[4] | header[5] << 8 | header[6] << 16
+        self.sequence_id = (header[3] + 1) % 256
+        payload = read_socket(payload_length)
+        self.bytes_in += payload_length + 7
+        if uncompressed_length:
+            try:
+                payload = self.codec.decompress(payload, uncompressed_length)
+            except Exception as e:
+                raise err.OperationalError(
+                    CR.CR_MALFORMED_PACKET, f"Malformed compressed packet ({e})"
+                ) from e
+            if len(payload) != uncompressed_length:
+                raise err.OperationalError(
+                    CR.CR_MALFORMED_PACKET,
+                    f"Malformed compressed packet: expected {uncompressed_length} bytes, got {len(payload)}",
+                )
+        self.raw_bytes_in += len(payload)
+        if self._offset:
+            del self._buffer[: self._offset]
+            self._offset = 0
+        self._buffer += payload
+
+
+def make_codec(algorithm, zstd_level=ZSTD_DEFAULT_LEVEL):
+    if algorithm == "zstd":
+        return ZstdCodec(zstd_level)
+    return ZlibCodec()
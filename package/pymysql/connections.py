@@ -2,7 +2,9 @@
 # http://dev.mysql.com/doc/internals/en/client-server-protocol.html
 # Error codes:
 # https://dev.mysql.com/doc/refman/5.5/en/error-handling.html
+import collections
 import errno
+import functools
 import os
 import socket
 import struct
@@ -11,12 +13,14 @@ import traceback
 import warnings
 
 from . import _auth
+from . import compress as _compress
 
 from .charset import charset_by_name, charset_by_id
 from .constants import CLIENT, COMMAND, CR, ER, FIELD_TYPE, SERVER_STATUS
 from . import converters
 from .cursors import Cursor
 from .optionfile import Parser
+from .prepared import PreparedStatement, binary_column_reader, prepared_sql
 from .protocol import (
     dump_packet,
     MysqlPacket,
@@ -24,6 +28,9 @@ from .protocol import (
     OKPacketWrapper,
     EOFPacketWrapper,
     LoadLocalPacketWrapper,
+    NULL_COLUMN,
+    UNSIGNED_SHORT_COLUMN,
+    UNSIGNED_INT24_COLUMN,
 )
 from . import err, VERSION_STRING
 
@@ -154,7 +161,14 @@ class Connection:
         (if no authenticate method) for returning a string from the user. (experimental)
     :param server_public_key: SHA256 authentication plugin public key value. (default: None)
     :param binary_prefix: Add _binary prefix on bytes and bytearray. (default: False)
-    :param compress: Not supported.
+    :param max_prepared_statements: Server-side prepared statements cached per
+        connection by Cursor.execute_prepared(). (default: 64)
+    :param compress: Use the compressed protocol: "zlib" (or True) or "zstd".
+        zstd needs the zstandard package and MySQL 8.0.18+; otherwise zlib is
+        used if the server supports it, or no compression. (default: None)
+    :param compress_threshold: Packets smaller than this many bytes are sent
+        uncompressed. (default: 50)
+    :param zstd_compression_level: zstd level requested from the server. (default: 3)
     :param named_pipe: Not supported.
     :param db: **DEPRECATED** Alias for database.
     :param passwd: **DEPRECATED** Alias for password.
@@ -165,6 +179,7 @@ class Connection:
 
     _sock = None
     _rfile = None
+    _compressor = None
     _auth_plugin_name = ""
     _closed = False
     _secure = False
@@ -208,7 +223,10 @@ class Connection:
         ssl_key_password=None,
         ssl_verify_cert=None,
         ssl_verify_identity=None,
-        compress=None,  # not supported
+        max_prepared_statements=64,
+        compress=None,
+        compress_threshold=_compress.MIN_COMPRESS_LENGTH,
+        zstd_compression_level=_compress.ZSTD_DEFAULT_LEVEL,
         named_pipe=None,  # not supported
         passwd=None,  # deprecated
         db=None,  # deprecated
@@ -226,10 +244,15 @@ class Connection:
             # )
             password = passwd
 
-        if compress or named_pipe:
-            raise NotImplementedError(
-                "compress and named_pipe arguments are not supported"
-            )
+        if named_pipe:
+            raise NotImplementedError("named_pipe argument is not supported")
+        if compress is True:
+            compress = "zlib"
+        if compress and compress not in _compress.ALGORITHMS:
+            raise ValueError(f"compress should be one of {_compress.ALGORITHMS}")
+        self.compress = compress or None
+        self.compress_threshold = compress_threshold
+        self.zstd_compression_level = zstd_compression_level
 
         self._local_infile = bool(local_infile)
         if self._local_infile:
@@ -346,6 +369,8 @@ class Connection:
         self.sql_mode = sql_mode
         self.init_command = init_command
         self.max_allowed_packet = max_allowed_packet
+        self.max_prepared_statements = max_prepared_statements
+        self._statements = collections.OrderedDict()
         self._auth_plugin_map = auth_plugin_map or {}
         self._binary_prefix = binary_prefix
         self.server_public_key = server_public_key
@@ -426,6 +451,11 @@ class Connection:
         if self._sock is None:
             return
         send_data = struct.pack("<iB", 1, COMMAND.COM_QUIT)
+        # COM_QUIT starts a new command: packet and compressed sequence ids
+        # restart from 0, as in _execute_command
+        self._next_seq_id = 1
+        if self._compressor is not None:
+            self._compressor.sequence_id = 0
         try:
             self._write_bytes(send_data)
         except Exception:
@@ -576,9 +606,74 @@ class Connection:
         return self._affected_rows
 
     def next_result(self, unbuffered=False):
-        self._affected_rows = self._read_query_result(unbuffered=unbuffered)
+        # Results of a prepared CALL keep using the binary protocol
+        binary = self._result is not None and self._result.binary
+        self._affected_rows = self._read_query_result(
+            unbuffered=unbuffered, binary=binary
+        )
         return self._affected_rows
 
+    def prepare(self, sql):
+        """
+        Prepare a statement on the server, or return the cached one.
+
+        :param sql: Query with %s placeholders (%% for a literal %)
+        :return: :py:class:`PreparedStatement`
+
+        Statements are cached per connection by query text, up to
+        max_prepared_statements (least recently used ones are closed).
+        The cache is emptied on (re)connect, so statements are prepared
+        again on the new session when next used.
+        """
+        statement = self._statements.get(sql)
+        if statement is not None:
+            self._statements.move_to_end(sql)
+            return statement
+
+        self._execute_command(COMMAND.COM_STMT_PREPARE, prepared_sql(sql))
+        statement = PreparedStatement.from_packet(self._read_packet(), sql)
+        # Parameter and column definitions: the execute response repeats the
+        # column metadata, so they are only skipped here
+        for count in (statement.param_count, statement.column_count):
+            if count:
+                for _ in range(count):
+                    self._read_packet()
+                eof_packet = self._read_packet()
+                assert eof_packet.is_eof_packet(), "Protocol error, expecting EOF"
+
+        self._statements[sql] = statement
+        while len(self._statements) > self.max_prepared_statements:
+            _, evicted = self._statements.popitem(last=False)
+            self._close_statement(evicted)
+        return statement
+
+    def execute_prepared(self, sql, args=(), unbuffered=False):
+        """Execute sql as a prepared statement (binary protocol)."""
+        statement = self.prepare(sql)
+        try:
+            return self._execute_statement(statement, args, unbuffered)
+        except err.MySQLError as e:
+            if not e.args or e.args[0] != ER.UNKNOWN_STMT_HANDLER:
+                raise
+        # The server no longer knows the statement (e.g. the session was
+        # reset by a proxy): prepare it again and retry once
+        self._statements.pop(sql, None)
+        return self._execute_statement(self.prepare(sql), args, unbuffered)
+
+    def _execute_statement(self, statement, args, unbuffered):
+        payload = statement.execute_payload(args, self.encoding)
+        self._execute_command(COMMAND.COM_STMT_EXECUTE, payload)
+        self._affected_rows = self._read_query_result(
+            unbuffered=unbuffered, binary=True
+        )
+        return self._affected_rows
+
+    def _close_statement(self, statement):
+        """Deallocate a statement on the server (COM_STMT_CLOSE has no response)."""
+        self._execute_command(
+            COMMAND.COM_STMT_CLOSE, struct.pack("<I", statement.statement_id)
+        )
+
     def affected_rows(self):
         return self._affected_rows
 
@@ -642,6 +737,9 @@ class Connection:
 
     def connect(self, sock=None):
         self._closed = False
+        self._compressor = None
+        # Server-side statements do not survive the session
+        self._statements = collections.OrderedDict()
         try:
             if sock is None:
                 if self.unix_socket:
@@ -746,7 +844,7 @@ class Connection:
         :raise OperationalError: If the connection to the MySQL server is lost.
         :raise InternalError: If the packet sequence number is wrong.
         """
-        buff = bytearray()
+        buff = None
         while True:
             packet_header = self._read_bytes(4)
             # if DEBUG: dump_packet(packet_header)
@@ -770,12 +868,20 @@ class Connection:
             recv_data = self._read_bytes(bytes_to_read)
             if DEBUG:
                 dump_packet(recv_data)
-            buff += recv_data
             # https://dev.mysql.com/doc/internals/en/sending-more-than-16mbyte.html
             if bytes_to_read < MAX_PACKET_LEN:
+                if buff is None:
+                    # Single-frame packet: use the received bytes without copying
+                    data = recv_data
+                else:
+                    buff += recv_data
+                    data = bytes(buff)
                 break
+            if buff is None:
+                buff = bytearray()
+            buff += recv_data
 
-        packet = packet_type(bytes(buff), self.encoding)
+        packet = packet_type(data, self.encoding)
         if packet.is_error_packet():
             if self._result is not None and self._result.unbuffered_active is True:
                 self._result.unbuffered_active = False
@@ -783,6 +889,11 @@ class Connection:
         return packet
 
     def _read_bytes(self, num_bytes):
+        if self._compressor is not None:
+            return self._compressor.read(num_bytes, self._read_socket)
+        return self._read_socket(num_bytes)
+
+    def _read_socket(self, num_bytes):
         self._sock.settimeout(self._read_timeout)
         while True:
             try:
@@ -808,6 +919,8 @@ class Connection:
         return data
 
     def _write_bytes(self, data):
+        if self._compressor is not None:
+            data = self._compressor.frame(data)
         self._sock.settimeout(self._write_timeout)
         try:
             self._sock.sendall(data)
@@ -817,9 +930,9 @@ class Connection:
                 CR.CR_SERVER_GONE_ERROR, f"MySQL server has gone away ({e!r})"
             )
 
-    def _read_query_result(self, unbuffered=False):
+    def _read_query_result(self, unbuffered=False, binary=False):
         self._result = None
-        result = MySQLResult(self)
+        result = MySQLResult(self, binary=binary)
         if unbuffered:
             result.init_unbuffered_query()
         else:
@@ -862,6 +975,9 @@ class Connection:
         # calling self..write_packet()
         prelude = struct.pack("<iB", packet_size, command)
         packet = prelude + sql[: packet_size - 1]
+        if self._compressor is not None:
+            # Compressed packets are numbered from 0 for each command too
+            self._compressor.sequence_id = 0
         self._write_bytes(packet)
         if DEBUG:
             dump_packet(packet)
@@ -890,8 +1006,15 @@ class Connection:
         if isinstance(self.user, str):
             self.user = self.user.encode(self.encoding)
 
+        compression = self._negotiate_compression()
+        client_flag = self.client_flag
+        if compression == "zlib":
+            client_flag |= CLIENT.COMPRESS
+        elif compression == "zstd":
+            client_flag |= CLIENT.ZSTD_COMPRESSION_ALGORITHM
+
         data_init = struct.pack(
-            "<iIB23s", self.client_flag, MAX_PACKET_LEN, charset_id, b""
+            "<iIB23s", client_flag, MAX_PACKET_LEN, charset_id, b""
         )
 
         if self.ssl and self.server_capabilities & CLIENT.SSL:
@@ -954,6 +1077,9 @@ class Connection:
                 connect_attrs += _lenenc_int(len(v)) + v
             data += _lenenc_int(len(connect_attrs)) + connect_attrs
 
+        if compression == "zstd":
+            data += struct.pack("B", self.zstd_compression_level)
+
         self.write_packet(data)
         auth_packet = self._read_packet()
 
@@ -988,6 +1114,32 @@ class Connection:
         if DEBUG:
             print("Succeed to auth")
 
+        if compression:
+            # Every packet after the authentication OK is compressed
+            self._compressor = _compress.CompressedStream(
+                _compress.make_codec(compression, self.zstd_compression_level),
+                self.compress_threshold,
+            )
+
+    def _negotiate_compression(self):
+        """Compression algorithm to request, given what the server supports."""
+        if not self.compress:
+            return None
+        if (
+            self.compress == "zstd"
+            and _compress.zstd_available()
+            and self.server_capabilities & CLIENT.ZSTD_COMPRESSION_ALGORITHM
+        ):
+            return "zstd"
+        if self.server_capabilities & CLIENT.COMPRESS:
+            return "zlib"
+        return None
+
+    @property
+    def compression(self):
+        """Compression algorithm in use on this connection, or None."""
+        return self._compressor.codec.name if self._compressor else None
+
     def _process_auth(self, plugin_name, auth_packet):
         handler = self._get_auth_plugin_handler(plugin_name)
         if handler:
@@ -1178,11 +1330,13 @@ class Connection:
 
 
 class MySQLResult:
-    def __init__(self, connection):
+    def __init__(self, connection, binary=False):
         """
         :type connection: Connection
+        :param binary: Rows use the binary protocol (prepared statement result)
         """
         self.connection = connection
+        self.binary = binary
         self.affected_rows = None
         self.insert_id = None
         self.server_status = None
@@ -1193,6 +1347,8 @@ class MySQLResult:
         self.rows = None
         self.has_next = None
         self.unbuffered_active = False
+        self.field_names = None
+        self._decode_row = None
 
     def __del__(self):
         if self.unbuffered_active:
@@ -1308,6 +1464,11 @@ class MySQLResult:
         # After much reading on the MySQL protocol, it appears that there is,
         # in fact, no way to stop MySQL from sending all the data after
         # executing a query, so we just spin, and wait for an EOF packet.
+        # Unless the socket was closed: the remaining rows went with it.
+        if self.unbuffered_active and self.connection._sock is None:
+            self.unbuffered_active = False
+            self.connection = None
+            return
         while self.unbuffered_active:
             try:
                 packet = self.connection._read_packet()
@@ -1341,23 +1502,103 @@ class MySQLResult:
         self.rows = tuple(rows)
 
     def _read_row_from_packet(self, packet):
-        row = []
-        for encoding, converter in self.converters:
-            try:
-                data = packet.read_length_coded_string()
-            except IndexError:
-                # No more columns in this row
-                # See https://github.com/PyMySQL/PyMySQL/pull/434
-                break
-            if data is not None:
-                if encoding is not None:
-                    data = data.decode(encoding)
-                if DEBUG:
-                    print("DEBUG: DATA = ", data)
-                if converter is not None:
-                    data = converter(data)
-            row.append(data)
-        return tuple(row)
+        row = self._decode_row(packet)
+        if DEBUG:
+            print("DEBUG: ROW = ", row)
+        return row
+
+    def _build_row_decoder(self):
+        """Build the row decoder of this result set from self.converters.
+
+        Encodings and converters are resolved once into one callable per
+        column, and the length-coded values are read inline from the packet
+        view, so decoding a row does no per-column lookups or method calls
+        on the packet.
+        """
+        column_decoders = tuple(
+            _column_decoder(encoding, converter)
+            for encoding, converter in self.converters
+        )
+        unpack_uint16 = struct.Struct("<H").unpack_from
+        unpack_uint64 = struct.Struct("<Q").unpack_from
+
+        def decode_row(packet):
+            data = packet._data
+            view = packet._view
+            position = packet._position
+            data_length = len(data)
+            row = []
+            for decode in column_decoders:
+                if position >= data_length:
+                    # No more columns in this row
+                    # See https://github.com/PyMySQL/PyMySQL/pull/434
+                    break
+                length = data[position]
+                position += 1
+                if length >= NULL_COLUMN:
+                    if length == NULL_COLUMN:
+                        row.append(None)
+                        continue
+                    if length == UNSIGNED_SHORT_COLUMN:
+                        length = unpack_uint16(data, position)[0]
+                        position += 2
+                    elif length == UNSIGNED_INT24_COLUMN:
+                        length = int.from_bytes(data[position : position + 3], "little")
+                        position += 3
+                    else:
+                        length = unpack_uint64(data, position)[0]
+                        position += 8
+                end = position + length
+                if end > data_length:
+                    raise AssertionError(
+                        "Result length not requested length:\n"
+                        f"Expected={length}.  Actual={data_length - position}.  Position: {position}.  Data Length: {data_length}"
+                    )
+                row.append(decode(view[position:end]))
+                position = end
+            packet._position = position
+            return tuple(row)
+
+        return decode_row
+
+    def _build_binary_row_decoder(self):
+        """Build the decoder of binary protocol rows (prepared statements).
+
+        A binary row is a 0x00 header, a NULL bitmap with a 2 bit offset and
+        the non-NULL values, each in the binary form of its column type.
+        """
+        readers = []
+        for index, (field, (encoding, converter)) in enumerate(
+            zip(self.fields, self.converters)
+        ):
+            bit = index + 2
+            readers.append(
+                (
+                    bit >> 3,
+                    1 << (bit & 7),
+                    binary_column_reader(field, _column_decoder(encoding, converter)),
+                )
+            )
+        readers = tuple(readers)
+        null_bitmap_length = (len(readers) + 9) // 8
+
+        def decode_row(packet):
+            data = packet._data
+            view = packet._view
+            position = packet._position + 1
+            null_bitmap = data[position : position + null_bitmap_length]
+            position += null_bitmap_length
+            row = []
+            for null_byte, null_mask, read in readers:
+                if null_bitmap[null_byte] & null_mask:
+                    row.append(None)
+                else:
+                    value, position = read(data, view, position)
+                    row.append(value)
+            packet._position = position
+            return tuple(row)
+
+        return decode_row
 
     def _get_descriptions(self):
         """Read a column descriptor packet for each column in the result."""
@@ -1401,6 +1642,54 @@ class MySQLResult:
         eof_packet = self.connection._read_packet()
         assert eof_packet.is_eof_packet(), "Protocol error, expecting EOF"
         self.description = tuple(description)
+        self.field_names = _field_names(self.fields)
+        if self.binary:
+            self._decode_row = self._build_binary_row_decoder()
+        else:
+            self._decode_row = self._build_row_decoder()
+
+
+# Converters that accept the packet view as is
+_BUFFER_CONVERTERS = (int, float)
+
+
+def _column_decoder(encoding, converter):
+    """Callable turning a column value (packet view) into its Python value."""
+    if converter in _BUFFER_CONVERTERS and encoding in (None, "ascii"):
+        # int() and float() parse the ASCII digits straight from the view
+        return converter
+    if encoding is not None:
+        if converter is None:
+            return functools.partial(str, encoding=encoding)
+        return _decode_and_convert(encoding, converter)
+    if converter is None:
+        return bytes
+    return _copy_and_convert(converter)
+
+
+def _decode_and_convert(encoding, converter):
+    def decode(data):
+        return converter(str(data, encoding))
+
+    return decode
+
+
+def _copy_and_convert(converter):
+    def decode(data):
+        return converter(bytes(data))
+
+    return decode
+
+
+def _field_names(fields):
+    """Column names used as dict keys, qualified with the table on duplicates."""
+    names = []
+    for field in fields:
+        name = field.name
+        if name in names:
+            name = field.table_name + "." + name
+        names.append(name)
+    return tuple(names)
 
 
 class LoadLocalFile:
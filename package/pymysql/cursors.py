@@ -154,6 +154,30 @@ class Cursor:
         self._executed = query
         return result
 
+    def execute_prepared(self, query, args=()):
+        """Execute a query as a server-side prepared statement.
+
+        :param query: Query to execute, with %s placeholders (%% for a literal %).
+        :type query: str
+
+        :param args: Parameters used with query, one per placeholder. (optional)
+        :type args: tuple or list
+
+        :return: Number of affected rows.
+        :rtype: int
+
+        The statement is prepared once per connection and cached (see
+        Connection.max_prepared_statements). Parameters and result rows use
+        the binary protocol, so arguments are not escaped into the query and
+        only the statement id and the values are sent on each execution.
+        """
+        while self.nextset():
+            pass
+
+        result = self._query_prepared(query, args)
+        self._executed = query
+        return result
+
     def executemany(self, query, args):
         """Run several data against one query.
 
@@ -323,6 +347,13 @@ class Cursor:
         self._do_get_result()
         return self.rowcount
 
+    def _query_prepared(self, q, args):
+        conn = self._get_db()
+        self._clear_result()
+        conn.execute_prepared(q, args)
+        self._do_get_result()
+        return self.rowcount
+
     def _clear_result(self):
         self.rownumber = 0
         self._result = None
@@ -384,14 +415,10 @@ class DictCursorMixin:
 
     def _do_get_result(self):
         super()._do_get_result()
-        fields = []
+        fields = ()
         if self.description:
-            for f in self._result.fields:
-                name = f.name
-                if name in fields:
-                    name = f.table_name + "." + name
-                fields.append(name)
-            self._fields = fields
+            # Key tuple computed once per result set by MySQLResult
+            fields = self._fields = self._result.field_names
 
         if fields and self._rows:
             self._rows = [self._conv_row(r) for r in self._rows]
@@ -448,6 +475,13 @@ class SSCursor(Cursor):
         self._do_get_result()
         return self.rowcount
 
+    def _query_prepared(self, q, args):
+        conn = self._get_db()
+        self._clear_result()
+        conn.execute_prepared(q, args, unbuffered=True)
+        self._do_get_result()
+        return self.rowcount
+
     def nextset(self):
         return self._nextset(unbuffered=True)
 
@@ -0,0 +1,251 @@
+# Server-side prepared statements (binary protocol)
+# https://dev.mysql.com/doc/dev/mysql-server/latest/page_protocol_command_phase_ps.html
+
+import datetime
+import decimal
+import re
+import struct
+
+from .constants import FIELD_TYPE, FLAG
+from . import err
+
+
+#: Placeholders accepted by Connection.prepare(): %s becomes ?, %% becomes %.
+RE_PLACEHOLDER = re.compile(r"%[s%]")
+
+CURSOR_TYPE_NO_CURSOR = 0
+
+_EXECUTE_HEADER = struct.Struct("<IBI")
+_PREPARE_OK = struct.Struct("<xIHH")
+
+_INT_FORMATS = {
+    FIELD_TYPE.TINY: ("<b", "<B"),
+    FIELD_TYPE.SHORT: ("<h", "<H"),
+    FIELD_TYPE.YEAR: ("<h", "<H"),
+    FIELD_TYPE.INT24: ("<i", "<I"),
+    FIELD_TYPE.LONG: ("<i", "<I"),
+    FIELD_TYPE.LONGLONG: ("<q", "<Q"),
+}
+_FLOAT_FORMATS = {
+    FIELD_TYPE.FLOAT: "<f",
+    FIELD_TYPE.DOUBLE: "<d",
+}
+_DATETIME_TYPES = (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP)
+_DATE_TYPES = (FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE)
+
+
+def prepared_sql(query):
+    """Translate a pyformat query (%s placeholders) to the server's ? syntax."""
+    return RE_PLACEHOLDER.sub(lambda m: "?" if m.group() == "%s" else "%", query)
+
+
+class PreparedStatement:
+    """A statement prepared on one connection (COM_STMT_PREPARE response)."""
+
+    __slots__ = ("statement_id", "query", "param_count", "column_count")
+
+    def __init__(self, statement_id, query, param_count, column_count):
+        self.statement_id = statement_id
+        self.query = query
+        self.param_count = param_count
+        self.column_count = column_count
+
+    @classmethod
+    def from_packet(cls, packet, query):
+        statement_id, column_count, param_count = _PREPARE_OK.unpack_from(
+            packet.get_all_data()
+        )
+        return cls(statement_id, query, param_count, column_count)
+
+    def execute_payload(self, args, encoding):
+        """Body of the COM_STMT_EXECUTE packet binding 'args' to the placeholders."""
+        if args is None:
+            args = ()
+        if len(args) != self.param_count:
+            raise err.ProgrammingError(
+                f"Prepared statement expects {self.param_count} parameters, got {len(args)}"
+            )
+        payload = [_EXECUTE_HEADER.pack(self.statement_id, CURSOR_TYPE_NO_CURSOR, 1)]
+        if not self.param_count:
+            return payload[0]
+
+        null_bitmap = bytearray((self.param_count + 7) // 8)
+        types = bytearray()
+        values = []
+        for index, arg in enumerate(args):
+            if arg is None:
+                null_bitmap[index >> 3] |= 1 << (index & 7)
+                types += b"\x06\x00"
+                continue
+            type_code, flags, value = _encode_param(arg, encoding)
+            types.append(type_code)
+            types.append(flags)
+            values.append(value)
+        # new-params-bound flag = 1: parameter types follow
+        payload += [bytes(null_bitmap), b"\x01", bytes(types)]
+        payload += values
+        return b"".join(payload)
+
+
+def _lenenc_bytes(value):
+    length = len(value)
+    if length < 0xFB:
+        return bytes([length]) + value
+    elif length < (1 << 16):
+        return b"\xfc" + struct.pack("<H", length) + value
+    elif length < (1 << 24):
+        return b"\xfd" + struct.pack("<I", length)[:3] + value
+    return b"\xfe" + struct.pack("<Q", length) + value
+
+
+def _encode_param(arg, encoding):
+    """Return (type_code, flags, value bytes) of one bound parameter."""
+    if isinstance(arg, bool):
+        return FIELD_TYPE.TINY, 0, struct.pack("<b", arg)
+    if isinstance(arg, int):
+        if -(1 << 63) <= arg < (1 << 63):
+            return FIELD_TYPE.LONGLONG, 0, struct.pack("<q", arg)
+        if 0 <= arg < (1 << 64):
+            return FIELD_TYPE.LONGLONG, 0x80, struct.pack("<Q", arg)
+        return FIELD_TYPE.NEWDECIMAL, 0, _lenenc_bytes(str(arg).encode("ascii"))
+    if isinstance(arg, float):
+        return FIELD_TYPE.DOUBLE, 0, struct.pack("<d", arg)
+    if isinstance(arg, str):
+        return FIELD_TYPE.VAR_STRING, 0, _lenenc_bytes(arg.encode(encoding))
+    if isinstance(arg, (bytes, bytearray, memoryview)):
+        return FIELD_TYPE.BLOB, 0, _lenenc_bytes(bytes(arg))
+    if isinstance(arg, decimal.Decimal):
+        return FIELD_TYPE.NEWDECIMAL, 0, _lenenc_bytes(str(arg).encode("ascii"))
+    if isinstance(arg, datetime.datetime):
+        value = struct.pack(
+            "<HBBBBB", arg.year, arg.month, arg.day, arg.hour, arg.minute, arg.second
+        )
+        if arg.microsecond:
+            value += struct.pack("<I", arg.microsecond)
+        return FIELD_TYPE.DATETIME, 0, bytes([len(value)]) + value
+    if isinstance(arg, datetime.date):
+        return FIELD_TYPE.DATE, 0, b"\x04" + struct.pack("<HBB", arg.year, arg.month, arg.day)
+    if isinstance(arg, datetime.timedelta):
+        negative = arg < datetime.timedelta(0)
+        if negative:
+            arg = -arg
+        hours, seconds = divmod(arg.seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        return FIELD_TYPE.TIME, 0, _time_value(
+            negative, arg.days, hours, minutes, seconds, arg.microseconds
+        )
+    if isinstance(arg, datetime.time):
+        return FIELD_TYPE.TIME, 0, _time_value(
+            False, 0, arg.hour, arg.minute, arg.second, arg.microsecond
+        )
+    raise err.ProgrammingError(
+        f"Unsupported parameter type for a prepared statement: {type(arg).__name__}"
+    )
+
+
+def _time_value(negative, days, hours, minutes, seconds, microseconds):
+    value = struct.pack("<BIBBB", negative, days, hours, minutes, seconds)
+    if microseconds:
+        value += struct.pack("<I", microseconds)
+    return bytes([len(value)]) + value
+
+
+def binary_column_reader(field, decode):
+    """Reader of one column value in a binary protocol row.
+
+    Returns read(data, view, position) -> (value, next position). Integer,
+    floating point and temporal columns are unpacked from their binary form;
+    the rest are length coded strings decoded with 'decode', the same
+    callable the text protocol uses for the column.
+    """
+    type_code = field.type_code
+    if type_code in _INT_FORMATS:
+        return _struct_reader(_INT_FORMATS[type_code][bool(field.flags & FLAG.UNSIGNED)])
+    if type_code in _FLOAT_FORMATS:
+        return _struct_reader(_FLOAT_FORMATS[type_code])
+    if type_code in _DATETIME_TYPES:
+        return _read_datetime
+    if type_code in _DATE_TYPES:
+        return _read_date
+    if type_code == FIELD_TYPE.TIME:
+        return _read_time
+    return _string_reader(decode)
+
+
+def _struct_reader(fmt):
+    fmt = struct.Struct(fmt)
+    unpack_from = fmt.unpack_from
+    size = fmt.size
+
+    def read(data, view, position):
+        return unpack_from(data, position)[0], position + size
+
+    return read
+
+
+def _string_reader(decode):
+    def read(data, view, position):
+        length = data[position]
+        position += 1
+        if length == 0xFC:
+            length = int.from_bytes(data[position : position + 2], "little")
+            position += 2
+        elif length == 0xFD:
+            length = int.from_bytes(data[position : position + 3], "little")
+            position += 3
+        elif length == 0xFE:
+            length = int.from_bytes(data[position : position + 8], "little")
+            position += 8
+        end = position + length
+        return decode(view[position:end]), end
+
+    return read
+
+
+def _temporal_parts(data, position):
+    """Date/time fields of a binary DATE, DATETIME or TIMESTAMP value."""
+    length = data[position]
+    parts = [0, 0, 0, 0, 0, 0, 0]
+    if length >= 4:
+        parts[0:3] = struct.unpack_from("<HBB", data, position + 1)
+    if length >= 7:
+        parts[3:6] = struct.unpack_from("<BBB", data, position + 5)
+    if length >= 11:
+        parts[6] = struct.unpack_from("<I", data, position + 8)[0]
+    return parts, position + 1 + length
+
+
+def _read_datetime(data, view, position):
+    parts, position = _temporal_parts(data, position)
+    try:
+        return datetime.datetime(*parts), position
+    except ValueError:
+        # Zero and invalid dates are returned as str, like the text protocol
+        return "%04d-%02d-%02d %02d:%02d:%02d" % tuple(parts[:6]), position
+
+
+def _read_date(data, view, position):
+    parts, position = _temporal_parts(data, position)
+    try:
+        return datetime.date(*parts[:3]), position
+    except ValueError:
+        return "%04d-%02d-%02d" % tuple(parts[:3]), position
+
+
+def _read_time(data, view, position):
+    length = data[position]
+    negative, days, hours, minutes, seconds, microseconds = 0, 0, 0, 0, 0, 0
+    if length >= 8:
+        negative, days, hours, minutes, seconds = struct.unpack_from(
+            "<BIBBB", data, position + 1
+        )
+    if length >= 12:
+        microseconds = struct.unpack_from("<I", data, position + 9)[0]
+    value = datetime.timedelta(
+        days=days,
+        hours=hours,
+        minutes=minutes,
+        seconds=seconds,
+        microseconds=microseconds,
+    )
+    return (-value if negative else value), position + 1 + length
@@ -48,13 +48,18 @@ class MysqlPacket:
     """Representation of a MySQL response packet.
 
     Provides an interface for reading/parsing the packet results.
+
+    The public accessors return bytes. _view is a memoryview of the payload
+    used internally by the MySQLResult row decoders, which convert each
+    column value from it without an intermediate copy.
     """
 
-    __slots__ = ("_position", "_data")
+    __slots__ = ("_position", "_data", "_view")
 
     def __init__(self, data, encoding):
         self._position = 0
         self._data = data
+        self._view = memoryview(data)
 
     def get_all_data(self):
         return self._data
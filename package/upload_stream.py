@@ -0,0 +1,122 @@
+"""
+Upload Stream Module
+Incremental decoding of the base64 file_content of POST /documents/{kb}/{ds}.
+The value is located inside the raw request body and decoded in fixed-size
+chunks, so the handler never builds a second copy of the base64 string
+(json.loads) nor the whole decoded file when it is uploaded in parts.
+"""
+
+import binascii
+import json
+import re
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+
+# Characters of base64 text decoded per chunk (multiple of 4)
+BASE64_CHUNK_CHARS = 256 * 1024
+
+_BASE64_RE = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class Base64Content:
+    """
+    Base64 text stored in text[start:end], decoded lazily. Slicing is never
+    done over the whole value, only per chunk.
+    """
+
+    def __init__(self, text: str, start: int = 0, end: Optional[int] = None):
+        self.text = text
+        self.start = start
+        self.end = len(text) if end is None else end
+
+    def validate(self):
+        """Raise ValueError unless the text is padded base64"""
+        if (self.end - self.start) % 4 or not _BASE64_RE.fullmatch(self.text, self.start, self.end):
+            raise ValueError("Invalid base64 content")
+
+    @property
+    def decoded_size(self) -> int:
+        padding = self.text.count('=', max(self.start, self.end - 2), self.end)
+        return (self.end - self.start) // 4 * 3 - padding
+
+    def chunks(self, chunk_chars: int = BASE64_CHUNK_CHARS) -> Iterator[bytes]:
+        """Yield the decoded bytes chunk by chunk"""
+        for position in range(self.start, self.end, chunk_chars):
+            yield binascii.a2b_base64(self.text[position:min(position + chunk_chars, self.end)])
+
+    def decode(self) -> bytearray:
+        """Decode into a single preallocated buffer (for files uploaded with one put_object)"""
+        buffer = bytearray(self.decoded_size)
+        view = memoryview(buffer)
+        offset = 0
+        for chunk in self.chunks():
+            view[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        return buffer
+
+
+def parse_upload_body(body_str: str, field: str = 'file_content') -> Tuple[Dict[str, Any], Optional[Base64Content]]:
+    """
+    Parse an upload request body without copying the base64 field.
+
+    Args:
+        body_str: Raw JSON body
+        field: Name of the base64 field
+
+    Returns:
+        (other fields, Base64Content or None if the field is missing/empty)
+
+    Raises:
+        ValueError: If the body is not valid JSON or the content is not base64
+    """
+    match = re.search(r'"' + re.escape(field) + r'"\s*:\s*"', body_str)
+    if match:
+        start = match.end()
+        end = body_str.find('"', start)
+        # Escapes (\/, \n) inside the value need the regular JSON decoder
+        if end != -1 and body_str.find('\\', start, end) == -1:
+            # Same document with the value replaced by ""
+            fields = json.loads(body_str[:start] + body_str[end:])
+            if isinstance(fields, dict) and fields.get(field) == '':
+                fields.pop(field)
+                content = Base64Content(body_str, start, end) if end > start else None
+                if content is not None:
+                    content.validate()
+                return fields, content
+
+    fields = json.loads(body_str)
+    if not isinstance(fields, dict):
+        raise ValueError("Request body must be a JSON object")
+    value = fields.pop(field, None)
+    if not value:
+        return fields, None
+    return fields, base64_content(value)
+
+
+def base64_content(value: str) -> Base64Content:
+    """
+    Validated Base64Content of an already parsed JSON string value
+
+    Raises:
+        ValueError: If the value is not base64
+    """
+    if not isinstance(value, str):
+        raise ValueError("Invalid base64 content")
+    # MIME-style line breaks were accepted by base64.b64decode
+    content = Base64Content(_WHITESPACE_RE.sub('', value))
+    content.validate()
+    return content
+
+
+def iter_parts(chunks: Iterable[bytes], part_size: int) -> Iterator[bytearray]:
+    """Regroup decoded chunks into parts of part_size bytes (the last one may be smaller)"""
+    part = bytearray()
+    for chunk in chunks:
+        part += chunk
+        while len(part) >= part_size:
+            rest = part[part_size:]
+            del part[part_size:]
+            yield part
+            part = rest
+    if part:
+        yield part
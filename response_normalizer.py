@@ -0,0 +1,177 @@
+"""
+Response Normalizer Module
+Parses RetrieveAndGenerate responses (boto3 dict shape) in a single pass into
+a compact structure: answer text, a reference table deduplicated by
+(s3 uri, chunk content hash) and citation spans pointing into that table
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+NO_ANSWER = "No se generó ninguna respuesta"
+
+# Fraction of responses whose full payload is logged (0 disables it)
+DEBUG_LOG_SAMPLE_RATE = float(os.environ.get('RAG_DEBUG_LOG_SAMPLE_RATE', '0'))
+
+
+def reference_key(location: str, text: str) -> Tuple[str, bytes]:
+    """Identity of a retrieved chunk: (s3 uri, SHA-256 of the chunk text)"""
+    return location, hashlib.sha256(text.encode('utf-8')).digest()
+
+
+@dataclass
+class Reference:
+    """A retrieved chunk referenced by the answer, with the spans that cite it"""
+    content: str = ''
+    location: str = ''
+    score: Optional[float] = None
+    spans: List[List[int]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {'content': self.content, 'location': self.location}
+        if self.score is not None:
+            result['score'] = self.score
+        if self.spans:
+            result['spans'] = self.spans
+        return result
+
+
+@dataclass
+class Citation:
+    """A span of the answer and the indices of the references that support it"""
+    text: str = ''
+    start: Optional[int] = None
+    end: Optional[int] = None
+    reference_indices: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {'start': self.start, 'end': self.end, 'references': self.reference_indices}
+        if self.start is None:
+            # Sin offsets el cliente solo puede localizar la cita por su texto
+            result['text'] = self.text
+        return result
+
+
+class ReferenceTable:
+    """
+    Deduplicated references of one answer. A chunk cited by several spans
+    is stored once and keeps the list of spans that cite it.
+    """
+
+    def __init__(self):
+        self.references: List[Reference] = []
+        self._index_by_key: Dict[Tuple[str, bytes], int] = {}
+
+    def add(self, reference: Dict[str, Any]) -> Optional[int]:
+        """Add a retrievedReferences/retrievalResults entry; return its index in the table"""
+        content = reference.get('content')
+        text = content.get('text', '') if isinstance(content, dict) else (content or '')
+        location = reference.get('location') or ''
+        if isinstance(location, dict):
+            location = (location.get('s3Location') or {}).get('uri', '')
+        if not text and not location:
+            return None
+
+        key = reference_key(location, text)
+        index = self._index_by_key.get(key)
+        if index is None:
+            index = len(self.references)
+            self._index_by_key[key] = index
+            self.references.append(Reference(content=text, location=location, score=reference.get('score')))
+        else:
+            existing = self.references[index]
+            score = reference.get('score')
+            if score is not None and (existing.score is None or score > existing.score):
+                existing.score = score
+        return index
+
+    def add_citation(self, citation: Dict[str, Any]) -> Citation:
+        """Parse one citation, adding its references and recording its span on each of them"""
+        part = (citation.get('generatedResponsePart') or {}).get('textResponsePart') or {}
+        span = part.get('span') or {}
+        parsed = Citation(text=part.get('text', ''), start=span.get('start'), end=span.get('end'))
+
+        for reference in citation.get('retrievedReferences') or ():
+            index = self.add(reference)
+            if index is None or index in parsed.reference_indices:
+                continue
+            parsed.reference_indices.append(index)
+            if parsed.start is not None:
+                self.references[index].spans.append([parsed.start, parsed.end])
+
+        return parsed
+
+
+@dataclass
+class NormalizedResponse:
+    """Compact view of a RetrieveAndGenerate response"""
+    answer: str = NO_ANSWER
+    citations: List[Citation] = field(default_factory=list)
+    references: List[Reference] = field(default_factory=list)
+    session_id: Optional[str] = None
+
+    def retrieval_results(self) -> List[Dict[str, Any]]:
+        """Reference table in the retrievalResults format used by the API and query logs"""
+        return [reference.to_dict() for reference in self.references]
+
+    def citation_table(self) -> List[Dict[str, Any]]:
+        """Answer spans with indices into retrieval_results()"""
+        return [citation.to_dict() for citation in self.citations]
+
+
+def normalize_retrieve_and_generate(response: Dict[str, Any]) -> NormalizedResponse:
+    """
+    Normalize a RetrieveAndGenerate response in one pass
+
+    Args:
+        response: Response dict returned by bedrock-agent-runtime
+
+    Returns:
+        NormalizedResponse
+    """
+    _maybe_log_payload(response)
+
+    table = ReferenceTable()
+    normalized = NormalizedResponse(references=table.references, session_id=response.get('sessionId'))
+
+    output = response.get('output')
+    if isinstance(output, dict):
+        normalized.answer = output.get('text') or NO_ANSWER
+    elif isinstance(output, str) and output:
+        normalized.answer = output
+
+    for citation in response.get('citations') or ():
+        normalized.citations.append(table.add_citation(citation))
+
+    # Some payloads (e.g. recorded fixtures) also carry a flat retrievalResults list
+    for result in response.get('retrievalResults') or ():
+        table.add(result)
+
+    return normalized
+
+
+def unique_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop repeated fragments (same s3 uri and chunk text), keeping the first occurrence"""
+    seen = set()
+    unique = []
+    for document in documents:
+        key = reference_key(document.get('location', ''), document.get('content', ''))
+        if key not in seen:
+            seen.add(key)
+            unique.append(document)
+    return unique
+
+
+def _maybe_log_payload(response: Dict[str, Any]):
+    """Log the full payload for a sample of responses only"""
+    if DEBUG_LOG_SAMPLE_RATE > 0 and random.random() < DEBUG_LOG_SAMPLE_RATE:
+        logger.info(f"Sampled RetrieveAndGenerate payload: {json.dumps(response, default=str)}")
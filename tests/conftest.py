@@ -0,0 +1,12 @@
+"""
+Test configuration: the Lambda modules are imported from the repository
+root, and pymysql from its vendored copy in package/ (as in the deployed
+Lambda package)
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'package'))
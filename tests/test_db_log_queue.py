@@ -0,0 +1,137 @@
+"""
+Tests for the spill file replay of db_log_queue.WriteBehindQueue
+"""
+
+import json
+import os
+
+import pytest
+
+from db_log_queue import WriteBehindQueue, _TransientWriteError
+
+
+class FakeDatabase:
+    """write_batch target that rejects some records and is down for others"""
+
+    def __init__(self):
+        self.rows = []
+        self.down_for = set()
+        self.rejects = set()
+
+    def write_batch(self, records):
+        ids = [record['id'] for record in records]
+        if self.rejects.intersection(ids):
+            raise ValueError('record rejected')
+        if self.down_for.intersection(ids):
+            raise ConnectionError('database unavailable')
+        self.rows.extend(ids)
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def queue(tmp_path, database):
+    queue = WriteBehindQueue(
+        database.write_batch,
+        batch_size=2,
+        flush_interval=0.01,
+        spill_path=str(tmp_path / 'spill.jsonl'),
+        dead_letter_path=str(tmp_path / 'dead_letter.jsonl'),
+        is_transient_error=lambda error: isinstance(error, ConnectionError),
+        max_replay_attempts=3
+    )
+    yield queue
+    queue.stop(1)
+
+
+def _offset_file(queue):
+    return queue.spill_path + '.replay.offset'
+
+
+def _line_offset(path, line_number):
+    """Byte offset at the start of a line of the file"""
+    with open(path, 'rb') as lines:
+        return sum(len(lines.readline()) for _ in range(line_number))
+
+
+def _dead_lettered(queue):
+    with open(queue.dead_letter_path, 'r', encoding='utf-8') as dead_letter_file:
+        return [json.loads(line) for line in dead_letter_file]
+
+
+def test_replay_resumes_from_saved_offset_after_partial_failure(queue, database):
+    queue._spill([{'id': index} for index in range(1, 6)])
+    database.down_for = {3}
+
+    with pytest.raises(_TransientWriteError):
+        queue._replay_spill()
+
+    replay_path = queue.spill_path + '.replay'
+    assert database.rows == [1, 2]
+    with open(_offset_file(queue), 'r', encoding='utf-8') as offset_file:
+        assert offset_file.read() == f"{_line_offset(replay_path, 2)} 1"
+
+    database.down_for = set()
+    queue._replay_spill()
+
+    assert database.rows == [1, 2, 3, 4, 5]
+    assert not os.path.exists(replay_path)
+    assert not os.path.exists(_offset_file(queue))
+    assert queue.get_stats()['replayed'] == 5
+
+
+def test_replay_resumes_inside_a_batch_written_one_by_one(queue, database):
+    queue._spill([{'id': index} for index in range(1, 5)])
+    # [3, 4] is rejected, so it is written one by one: 3 is dead-lettered
+    # and 4 fails with the database down
+    database.rejects = {3}
+    database.down_for = {4}
+
+    with pytest.raises(_TransientWriteError):
+        queue._replay_spill()
+
+    assert database.rows == [1, 2]
+    with open(_offset_file(queue), 'r', encoding='utf-8') as offset_file:
+        assert offset_file.read() == f"{_line_offset(queue.spill_path + '.replay', 3)} 1"
+
+    database.down_for = set()
+    queue._replay_spill()
+
+    assert database.rows == [1, 2, 4]
+    assert [entry['record'] for entry in _dead_lettered(queue)] == [{'id': 3}]
+
+
+def test_replay_dead_letters_record_after_max_attempts(queue, database):
+    queue._spill([{'id': 1}, {'id': 2}, {'id': 3}])
+    database.down_for = {1}
+
+    for _ in range(queue.max_replay_attempts):
+        with pytest.raises(_TransientWriteError):
+            queue._replay_spill()
+    assert database.rows == []
+
+    database.down_for = set()
+    queue._replay_spill()
+
+    assert database.rows == [2, 3]
+    entries = _dead_lettered(queue)
+    assert [entry['record'] for entry in entries] == [{'id': 1}]
+    assert entries[0]['replay_attempts'] == queue.max_replay_attempts
+
+
+def test_records_spilled_during_replay_are_replayed_later(queue, database):
+    queue._spill([{'id': 1}])
+    database.down_for = {1}
+    with pytest.raises(_TransientWriteError):
+        queue._replay_spill()
+
+    # A new spill file is started while the replay file is pending
+    queue._spill([{'id': 2}])
+    database.down_for = set()
+    queue._replay_spill()
+
+    assert database.rows == [1, 2]
+    assert not os.path.exists(queue.spill_path)
@@ -0,0 +1,34 @@
+"""
+Tests for the classification of database errors by db_logger
+"""
+
+import pytest
+from pymysql import err
+
+from db_logger import _is_transient_error
+
+
+def _mysql_error(errno):
+    try:
+        err.raise_mysql_exception(
+            b'\xff' + errno.to_bytes(2, 'little') + b'#HY000' + b'error')
+    except err.MySQLError as e:
+        return e
+
+
+@pytest.mark.parametrize('errno', [2003, 2006, 2013, 2055, 1040, 1205, 1213])
+def test_connection_and_lock_errors_are_transient(errno):
+    assert _is_transient_error(_mysql_error(errno))
+
+
+@pytest.mark.parametrize('errno', [1054, 1146, 1292, 1364, 1406])
+def test_errors_about_the_record_are_permanent(errno):
+    assert not _is_transient_error(_mysql_error(errno))
+
+
+def test_interface_error_is_transient():
+    assert _is_transient_error(err.InterfaceError(0, ''))
+
+
+def test_bad_record_is_permanent():
+    assert not _is_transient_error(TypeError('Object of type bytes is not JSON serializable'))
@@ -0,0 +1,92 @@
+"""
+Tests for the page tokens of DocumentManager.list_documents_page over a
+fake S3 listing
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+import document_manager
+from document_manager import DocumentManager
+
+KB_ID = 'KB1'
+DS_ID = 'DS1'
+BUCKET = 'docs-bucket'
+
+
+class FakeS3:
+    """list_objects_v2 over a sorted list of keys, 1000 keys per page"""
+
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, StartAfter=None, ContinuationToken=None, **params):
+        start_after = ContinuationToken or StartAfter
+        keys = [key for key in self.keys
+                if key.startswith(Prefix) and (start_after is None or key > start_after)]
+        page = keys[:MaxKeys]
+        response = {
+            'Contents': [{
+                'Key': key,
+                'LastModified': datetime(2024, 1, 1, tzinfo=timezone.utc),
+                'Size': len(key),
+                'ETag': f'"{key}"'
+            } for key in page],
+            'IsTruncated': len(keys) > MaxKeys
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        return response
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    s3 = FakeS3([f'docs/report_{index:02d}.pdf' for index in range(5)]
+                + [f'docs/notes_{index:02d}.txt' for index in range(3)])
+    monkeypatch.setattr(document_manager, 'get_client', lambda service, region: s3)
+    manager = DocumentManager()
+    manager.catalog = None
+    monkeypatch.setattr(manager, 'get_data_source_config',
+                        lambda kb_id, ds_id: {'bucket_name': BUCKET, 'prefixes': ['docs/']})
+    return manager
+
+
+def _names(page):
+    return [document['name'] for document in page['documents']]
+
+
+def test_page_token_continues_the_listing(manager):
+    first = manager.list_documents_page(KB_ID, DS_ID, limit=3, name_prefix='report')
+    second = manager.list_documents_page(KB_ID, DS_ID, limit=3, name_prefix='report',
+                                         page_token=first['next_page_token'])
+
+    assert first['source'] == 's3'
+    assert _names(first) == ['report_00.pdf', 'report_01.pdf', 'report_02.pdf']
+    assert _names(second) == ['report_03.pdf', 'report_04.pdf']
+    assert second['next_page_token'] is None
+
+
+@pytest.mark.parametrize('other_query', [
+    {'name_prefix': 'notes'},
+    {'name_prefix': 'report', 'extensions': ['.pdf']},
+    {'name_prefix': 'report', 'sort_by': 'name'},
+    {'name_prefix': 'report', 'sort_order': 'desc'},
+])
+def test_page_token_from_a_different_query_is_rejected(manager, other_query):
+    first = manager.list_documents_page(KB_ID, DS_ID, limit=2, name_prefix='report')
+
+    with pytest.raises(ValueError, match='does not match the listing parameters'):
+        manager.list_documents_page(KB_ID, DS_ID, limit=2, page_token=first['next_page_token'], **other_query)
+
+
+def test_page_token_from_another_data_source_is_rejected(manager):
+    first = manager.list_documents_page(KB_ID, DS_ID, limit=2)
+
+    with pytest.raises(ValueError, match='does not match the listing parameters'):
+        manager.list_documents_page(KB_ID, 'DS2', limit=2, page_token=first['next_page_token'])
+
+
+def test_malformed_page_token_is_rejected(manager):
+    with pytest.raises(ValueError, match='Invalid page_token'):
+        manager.list_documents_page(KB_ID, DS_ID, limit=2, page_token='not-a-token')
@@ -0,0 +1,200 @@
+"""
+Tests for ingestion_scheduler.IngestionScheduler with in-memory
+bedrock-agent and EventBridge Scheduler clients
+"""
+
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import ingestion_scheduler
+from ingestion_scheduler import IngestionScheduler, SCHEDULED_ACTION
+
+KB_ID = 'KB1'
+DS_ID = 'DS1'
+
+
+def _client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class FakeBedrockAgent:
+    """start/list/get_ingestion_job over a list of running job IDs"""
+
+    def __init__(self):
+        self.running = []
+        self.started = []
+        self.conflict = False
+
+    def start_ingestion_job(self, knowledgeBaseId, dataSourceId):
+        if self.conflict:
+            raise _client_error('ConflictException', 'StartIngestionJob')
+        job_id = f'job-{len(self.started) + 1}'
+        self.started.append(job_id)
+        self.running.append(job_id)
+        return {'ingestionJob': {'ingestionJobId': job_id, 'status': 'STARTING'}}
+
+    def list_ingestion_jobs(self, **params):
+        return {'ingestionJobSummaries': [
+            {'ingestionJobId': job_id, 'status': 'IN_PROGRESS'} for job_id in reversed(self.running)
+        ]}
+
+    def get_ingestion_job(self, knowledgeBaseId, dataSourceId, ingestionJobId):
+        status = 'IN_PROGRESS' if ingestionJobId in self.running else 'COMPLETE'
+        return {'ingestionJob': {'ingestionJobId': ingestionJobId, 'status': status}}
+
+    def finish_all(self):
+        self.running = []
+
+
+class FakeScheduler:
+    """create/update/get/delete_schedule keyed by schedule name"""
+
+    def __init__(self):
+        self.schedules = {}
+        self.calls = []
+
+    def create_schedule(self, **params):
+        self.calls.append(('create', params['Name']))
+        if params['Name'] in self.schedules:
+            raise _client_error('ConflictException', 'CreateSchedule')
+        self.schedules[params['Name']] = params
+
+    def update_schedule(self, **params):
+        self.calls.append(('update', params['Name']))
+        self.schedules[params['Name']] = params
+
+    def get_schedule(self, Name, GroupName):
+        if Name not in self.schedules:
+            raise _client_error('ResourceNotFoundException', 'GetSchedule')
+        return self.schedules[Name]
+
+    def delete_schedule(self, Name, GroupName):
+        self.calls.append(('delete', Name))
+        self.schedules.pop(Name, None)
+
+
+@pytest.fixture
+def agent():
+    return FakeBedrockAgent()
+
+
+@pytest.fixture
+def scheduler_client(monkeypatch):
+    client = FakeScheduler()
+    monkeypatch.setattr(ingestion_scheduler, 'get_client', lambda service, region: client)
+    return client
+
+
+def _scheduled_input(scheduler_client, kind):
+    schedule = scheduler_client.schedules[f'ingestion-{kind}-{KB_ID}-{DS_ID}']
+    return json.loads(schedule['Target']['Input'])
+
+
+def test_request_within_debounce_is_coalesced(agent):
+    scheduler = IngestionScheduler(debounce_seconds=60)
+
+    first = scheduler.request_sync(agent, KB_ID, DS_ID)
+    second = scheduler.request_sync(agent, KB_ID, DS_ID)
+
+    assert first['status'] == 'started'
+    assert second == {'status': 'coalesced', 'ingestion_job_id': first['ingestion_job_id'],
+                      'follow_up_pending': True}
+    assert agent.started == ['job-1']
+
+
+def test_conflict_exception_queues_follow_up(agent):
+    scheduler = IngestionScheduler(debounce_seconds=0)
+    agent.conflict = True
+
+    result = scheduler.request_sync(agent, KB_ID, DS_ID)
+
+    assert result['status'] == 'queued'
+    assert result['follow_up_pending'] is True
+    assert scheduler.get_stats()['conflicts'] == 1
+    assert agent.started == []
+
+    # Once the data source accepts jobs again, the follow-up is started
+    agent.conflict = False
+    follow_ups = scheduler.run_pending(agent, KB_ID, DS_ID)
+
+    assert [follow_up['status'] for follow_up in follow_ups] == ['started']
+    assert follow_ups[0]['follow_up_pending'] is False
+    assert scheduler.get_stats()['follow_ups_started'] == 1
+
+
+def test_running_job_queues_follow_up_until_it_ends(agent):
+    scheduler = IngestionScheduler(debounce_seconds=0)
+    finished = []
+    scheduler.add_job_finished_listener(lambda kb_id, ds_id, job_id: finished.append(job_id))
+    agent.running = ['external-job']
+
+    result = scheduler.request_sync(agent, KB_ID, DS_ID)
+
+    assert result == {'status': 'queued', 'ingestion_job_id': 'external-job', 'follow_up_pending': True}
+    assert scheduler.run_pending(agent, KB_ID, DS_ID)[0]['status'] == 'queued'
+
+    agent.finish_all()
+    follow_ups = scheduler.run_pending(agent, KB_ID, DS_ID)
+
+    assert follow_ups[0]['status'] == 'started'
+    assert finished == ['external-job']
+    # The end of a job is reported once
+    scheduler.check_job(agent, KB_ID, DS_ID, 'external-job')
+    assert finished == ['external-job']
+
+
+def test_existing_schedule_is_updated_and_follow_up_left_to_it(agent, scheduler_client):
+    scheduler = IngestionScheduler(debounce_seconds=0, schedule_target_arn='arn:lambda',
+                                   schedule_role_arn='arn:role')
+    agent.running = ['job-0']
+    # A schedule left by an earlier run
+    scheduler_client.schedules[f'ingestion-follow-up-{KB_ID}-{DS_ID}'] = {}
+
+    result = scheduler.request_sync(agent, KB_ID, DS_ID)
+
+    assert result['status'] == 'queued'
+    assert scheduler_client.calls == [('create', f'ingestion-follow-up-{KB_ID}-{DS_ID}'),
+                                      ('update', f'ingestion-follow-up-{KB_ID}-{DS_ID}')]
+    assert _scheduled_input(scheduler_client, 'follow-up') == {
+        'action': SCHEDULED_ACTION,
+        'knowledge_base_id': KB_ID,
+        'data_source_id': DS_ID,
+        'ingestion_job_id': 'job-0',
+        'follow_up': True
+    }
+    # The schedule owns the follow-up: a request to this container does not start it
+    agent.finish_all()
+    assert scheduler.run_pending(agent, KB_ID, DS_ID) == []
+    assert agent.started == []
+
+
+def test_scheduled_run_starts_follow_up_and_watches_the_job(agent, scheduler_client):
+    scheduler = IngestionScheduler(debounce_seconds=0, schedule_target_arn='arn:lambda',
+                                   schedule_role_arn='arn:role')
+
+    result = scheduler.run_scheduled(agent, KB_ID, DS_ID, ingestion_job_id='job-0', follow_up=True)
+
+    assert result['job']['status'] == 'COMPLETE'
+    assert result['follow_up']['status'] == 'started'
+    watch = _scheduled_input(scheduler_client, 'watch')
+    assert watch['ingestion_job_id'] == 'job-1'
+    assert watch['follow_up'] is False
+
+
+def test_schedule_failure_keeps_follow_up_in_memory(agent, scheduler_client, monkeypatch):
+    scheduler = IngestionScheduler(debounce_seconds=0, schedule_target_arn='arn:lambda',
+                                   schedule_role_arn='arn:role')
+
+    def fail(**params):
+        raise _client_error('AccessDeniedException', 'CreateSchedule')
+
+    monkeypatch.setattr(scheduler_client, 'create_schedule', fail)
+    agent.running = ['job-0']
+
+    assert scheduler.request_sync(agent, KB_ID, DS_ID)['status'] == 'queued'
+    assert scheduler.get_stats()['schedule_errors'] == 1
+
+    agent.finish_all()
+    assert scheduler.run_pending(agent, KB_ID, DS_ID)[0]['status'] == 'started'